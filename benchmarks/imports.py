@@ -0,0 +1,93 @@
+"""Import time of the rsimusim modules
+
+Every module is imported in a fresh interpreter, and the best time of several runs is
+reported together with the heavy dependencies that the import pulled in, e.g.
+
+    python -m benchmarks.imports --out imports.json
+
+The report has the same format as benchmarks.run, and can be compared in the same way.
+"""
+from __future__ import print_function, division
+
+import os
+import sys
+import json
+import argparse
+import datetime
+import platform
+import subprocess
+
+from .run import compare, _git_commit
+
+MODULES = [
+    'rsimusim',
+    'rsimusim.batch',
+    'rsimusim.camera',
+    'rsimusim.dataset',
+    'rsimusim.simulation',
+    'rsimusim.sweep',
+]
+
+# Dependencies which should only be loaded by the code paths that need them
+HEAVY_MODULES = ['imusim', 'crisp', 'cv2', 'matplotlib', 'h5py', 'scipy.optimize']
+
+_TIMING_CODE = """
+import sys, time, json
+t0 = time.time()
+import {module}
+elapsed = time.time() - t0
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def time_import(module, repeat=5):
+    "Best import time of module in a fresh interpreter, and the heavy modules it loaded"
+    code = _TIMING_CODE.format(module=module, heavy=HEAVY_MODULES)
+    # Import from the same locations as this interpreter
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code], env=env)
+        result = json.loads(out.decode('utf8').strip().splitlines()[-1])
+        times.append(result['seconds'])
+    return times, result['loaded']
+
+def run_imports(modules=MODULES, repeat=5):
+    records = []
+    for module in modules:
+        times, loaded = time_import(module, repeat)
+        records.append({'benchmark': 'import:{}'.format(module), 'size': 'import', 'params': {},
+                        'times': times, 'best': min(times), 'items': 1, 'per_item': min(times),
+                        'loaded': loaded})
+    return {'commit': _git_commit(),
+            'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': records}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time of the rsimusim modules")
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', default=None, help="Write results as JSON to this file")
+    parser.add_argument('--compare', default=None, help="Earlier JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    report = run_imports(args.modules, args.repeat)
+    for record in report['results']:
+        print('{:<32s} {:>8.3f} s  {}'.format(record['benchmark'], record['best'], ' '.join(record['loaded'])))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            old = json.load(f)
+        _, regressions = compare(old, report, args.threshold)
+        if regressions:
+            print('{:d} imports slower than {:.2f}x'.format(len(regressions), args.threshold))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""Benchmarks of the simulator hot paths on synthetic datasets
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.run --sizes small medium --out bench.json
+    python -m benchmarks.run --sizes small --compare bench.json
+
+Results are written as JSON, and comparing against an earlier results file reports the
+ratio of the best times and fails if any benchmark is slower than the threshold.
+"""
+from __future__ import print_function, division
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+import numpy as np
+
+from .synthetic import make_dataset, make_config
+
+logger = logging.getLogger("rsimusim.benchmarks")
+
+SIZES = OrderedDict([
+    ('small', {'landmarks': 1000, 'duration': 10.0, 'speed': 1.0, 'visibility': 0.5}),
+    ('medium', {'landmarks': 10000, 'duration': 60.0, 'speed': 1.0, 'visibility': 0.5}),
+    ('large', {'landmarks': 100000, 'duration': 300.0, 'speed': 1.0, 'visibility': 0.5}),
+])
+
+# Number of frames to sample in the camera benchmarks, and simulated seconds for the results benchmarks
+CAMERA_FRAMES = 10
+RESULTS_SECONDS = 1.0
+
+class Fixture(object):
+    "Synthetic dataset and simulation config of one size"
+    def __init__(self, workdir, name, params):
+        self.name = name
+        self.params = params
+        self.dataset_path = os.path.join(workdir, '{}.h5'.format(name))
+        self.config_path = os.path.join(workdir, '{}.yml'.format(name))
+        self.short_config_path = os.path.join(workdir, '{}_short.yml'.format(name))
+        self.results_path = os.path.join(workdir, '{}_results.h5'.format(name))
+        make_dataset(self.dataset_path, params['landmarks'], params['duration'], params['speed'],
+                     params['visibility'])
+        # Leave margins to the ends of the splined trajectory
+        self.start = 1.0
+        self.end = params['duration'] - 1.0
+        make_config(self.config_path, os.path.basename(self.dataset_path), self.start, self.end)
+        make_config(self.short_config_path, os.path.basename(self.dataset_path), self.start,
+                    self.start + RESULTS_SECONDS)
+        self._simulation = None
+
+    @property
+    def simulation(self):
+        from rsimusim.simulation import RollingShutterImuSimulation
+        if self._simulation is None:
+            self._simulation = RollingShutterImuSimulation.from_config(self.config_path,
+                                                                        datasetdir=os.path.dirname(self.config_path))
+            self._simulation.camera.camera.use_multiproc = False
+        return self._simulation
+
+    def frame_times(self):
+        from rsimusim.camera import frame_times
+        camera = self.simulation.camera.camera
+        return frame_times(self.start, self.end, camera.frame_rate, camera.camera_model.readout)
+
+def bench_dataset_load(fixture):
+    from rsimusim.dataset import Dataset
+    def run():
+        Dataset.from_file(fixture.dataset_path)
+    return run, 1
+
+def bench_visible_landmarks(fixture):
+    dataset = fixture.simulation.config.dataset
+    times = fixture.frame_times()
+    def run():
+        for t in times:
+            dataset.visible_landmarks(t)
+    return run, len(times)
+
+def bench_project_point_rs(fixture):
+    from rsimusim.camera import _project_point_rs
+    camera = fixture.simulation.camera.camera
+    t = fixture.frame_times()[0]
+    landmarks = fixture.simulation.config.dataset.visible_landmarks(t)
+    def run():
+        for lm in landmarks:
+            _project_point_rs(lm.position, t, camera.camera_model, camera.Rci, camera.pci,
+                              fixture.simulation.simulation_trajectory)
+    return run, len(landmarks)
+
+def bench_trajectory_eval(fixture):
+    from rsimusim.trajectory import TrajectoryEvaluator
+    evaluator = TrajectoryEvaluator.from_trajectory(fixture.simulation.simulation_trajectory)
+    times = np.linspace(fixture.start, fixture.end, num=10000)
+    def run():
+        evaluator.evaluate(times)
+    return run, len(times)
+
+def bench_camera_sample(fixture):
+    camera = fixture.simulation.camera.camera
+    times = fixture.frame_times()[:CAMERA_FRAMES]
+    def run():
+        for t in times:
+            camera.sample(t)
+    return run, len(times)
+
+def bench_imu_generation(fixture):
+    from rsimusim.inertial import sample_times, generate_default_imu
+    sim = fixture.simulation
+    times = sample_times(fixture.start, fixture.end, sim.config.imu_config['sample_rate'])
+    def run():
+        generate_default_imu(sim.imu, times, sim.environment)
+    return run, len(times)
+
+def _short_results(fixture):
+    from rsimusim.simulation import RollingShutterImuSimulation
+    sim = RollingShutterImuSimulation.from_config(fixture.short_config_path,
+                                                  datasetdir=os.path.dirname(fixture.short_config_path))
+    sim.camera.camera.use_multiproc = False
+    return sim.run()
+
+def bench_results_save(fixture):
+    results = _short_results(fixture)
+    def run():
+        results.save(fixture.results_path)
+    return run, len(results.image_measurements)
+
+def bench_results_load(fixture):
+    from rsimusim.simulation import SimulationResults
+    results = _short_results(fixture)
+    results.save(fixture.results_path)
+    def run():
+        SimulationResults.from_file(fixture.results_path)
+    return run, len(results.image_measurements)
+
+BENCHMARKS = OrderedDict([
+    ('dataset_load', bench_dataset_load),
+    ('visible_landmarks', bench_visible_landmarks),
+    ('project_point_rs', bench_project_point_rs),
+    ('trajectory_eval', bench_trajectory_eval),
+    ('camera_sample', bench_camera_sample),
+    ('imu_generation', bench_imu_generation),
+    ('results_save', bench_results_save),
+    ('results_load', bench_results_load),
+])
+
+def time_benchmark(setup, fixture, repeat):
+    "Best and all times of `repeat` runs, and the number of items processed per run"
+    run, items = setup(fixture)
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        run()
+        times.append(time.time() - t0)
+    return times, items
+
+def _git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull)
+        return out.decode('utf8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes, names=None, repeat=3, workdir=None):
+    """Run benchmarks for all sizes
+
+    Parameters
+    ----------------
+    sizes : dict
+        Maps size name to dataset parameters, see SIZES
+    names : list of str
+        Benchmarks to run, defaults to all in BENCHMARKS
+
+    Returns
+    ----------------
+    report : dict
+        Environment and one record per benchmark and size
+    """
+    names = list(BENCHMARKS) if names is None else names
+    cleanup = workdir is None
+    workdir = tempfile.mkdtemp(prefix='rsimusim_bench_') if workdir is None else workdir
+    records = []
+    try:
+        for size_name, params in sizes.items():
+            logger.info("Generating %s dataset: %s", size_name, params)
+            fixture = Fixture(workdir, size_name, params)
+            for name in names:
+                times, items = time_benchmark(BENCHMARKS[name], fixture, repeat)
+                best = min(times)
+                records.append({'benchmark': name, 'size': size_name, 'params': params,
+                                'times': times, 'best': best, 'items': items,
+                                'per_item': best / items if items else None})
+                logger.info("%s/%s: %.4f s (%d items)", size_name, name, best, items)
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir)
+
+    return {'commit': _git_commit(),
+            'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'results': records}
+
+def compare(old, new, threshold=1.2):
+    """Compare two reports
+
+    Returns
+    ----------------
+    rows : list of (benchmark, size, old best, new best, ratio)
+    regressions : list of rows where the ratio exceeds threshold
+    """
+    old_best = {(r['benchmark'], r['size']): r['best'] for r in old['results']}
+    rows = []
+    for r in new['results']:
+        key = (r['benchmark'], r['size'])
+        if key in old_best:
+            rows.append(key + (old_best[key], r['best'], r['best'] / old_best[key]))
+    regressions = [row for row in rows if row[-1] > threshold]
+    return rows, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulator on synthetic datasets")
+    parser.add_argument('--sizes', nargs='+', default=['small'], choices=list(SIZES) + ['custom'])
+    parser.add_argument('--landmarks', type=int, default=1000, help="Landmarks of the custom size")
+    parser.add_argument('--duration', type=float, default=10.0, help="Trajectory length of the custom size")
+    parser.add_argument('--speed', type=float, default=1.0, help="Camera speed (m/s) of the custom size")
+    parser.add_argument('--visibility', type=float, default=0.5, help="Visibility density of the custom size")
+    parser.add_argument('--benchmarks', nargs='+', default=None, choices=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workdir', default=None, help="Keep generated files in this directory")
+    parser.add_argument('--out', default=None, help="Write results as JSON to this file")
+    parser.add_argument('--compare', default=None, help="Earlier JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="Fail if a benchmark is slower than this ratio of the compared results")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    sizes = OrderedDict()
+    for name in args.sizes:
+        if name == 'custom':
+            sizes[name] = {'landmarks': args.landmarks, 'duration': args.duration,
+                           'speed': args.speed, 'visibility': args.visibility}
+        else:
+            sizes[name] = SIZES[name]
+
+    report = run_benchmarks(sizes, args.benchmarks, args.repeat, args.workdir)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            old = json.load(f)
+        rows, regressions = compare(old, report, args.threshold)
+        print('{:<20s} {:<8s} {:>10s} {:>10s} {:>7s}'.format('Benchmark', 'Size', 'Old', 'New', 'Ratio'))
+        for benchmark, size, old_best, new_best, ratio in rows:
+            print('{:<20s} {:<8s} {:>10.4f} {:>10.4f} {:>7.2f}'.format(benchmark, size, old_best, new_best, ratio))
+        if regressions:
+            print('{:d} benchmarks slower than {:.2f}x'.format(len(regressions), args.threshold))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+from __future__ import print_function, division
+
+import h5py
+import numpy as np
+import yaml
+
+# Pinhole camera used for synthetic configs
+IMAGE_SIZE = (1920, 1080)
+FOCAL_LENGTH = 850.0
+FRAME_RATE = 30.0
+READOUT = 1. / 35
+
+def _quaternion_product(p, q):
+    pw, px, py, pz = p.T
+    qw, qx, qy, qz = q.T
+    return np.column_stack((pw*qw - px*qx - py*qy - pz*qz,
+                            pw*qx + px*qw + py*qz - pz*qy,
+                            pw*qy - px*qz + py*qw + pz*qx,
+                            pw*qz + px*qy - py*qx + pz*qw))
+
+# Body to world rotation of a camera looking along the world x-axis,
+# with body x-axis along world y and body y-axis along world z.
+# Quaternion of the rotation matrix [[0, 0, 1], [1, 0, 0], [0, 1, 0]]
+_Q_LOOK_X = np.array([[0.5, 0.5, 0.5, 0.5]])
+
+def circular_trajectory(duration, speed, radius=2.0, sample_rate=200.0, bob=0.05):
+    """Keyframes of a camera moving on a circle while looking outwards
+
+    Returns
+    ----------------
+    timestamps : (N,) array
+    positions : (3, N) array
+    rotations : (N, 4) array of unit quaternions (w, x, y, z), body to world
+    angles : (N,) array of heading angles around the world z-axis
+    """
+    timestamps = np.arange(0, duration + 1. / sample_rate, 1. / sample_rate)
+    angles = speed / radius * timestamps
+    positions = np.vstack((radius * np.cos(angles),
+                           radius * np.sin(angles),
+                           bob * np.sin(2 * np.pi * timestamps)))
+    heading = np.column_stack((np.cos(angles / 2), np.zeros_like(angles), np.zeros_like(angles), np.sin(angles / 2)))
+    rotations = _quaternion_product(heading, _Q_LOOK_X)
+    return timestamps, positions, rotations, angles
+
+def make_dataset(path, num_landmarks, duration, speed=1.0, visibility=0.5, radius=2.0, wall_radius=10.0,
+                 wall_height=3.0, interval=1. / 30, name='synthetic', seed=0):
+    """Write a synthetic dataset file
+
+    The camera moves on a circle inside a cylindrical wall of landmarks.
+    A landmark is marked as visible in a visibility interval if it is within the horizontal
+    field of view, and then with probability `visibility`.
+
+    Parameters
+    ----------------
+    path : str
+        Output HDF5 file
+    num_landmarks : int
+    duration : float
+        Trajectory length in seconds
+    speed : float
+        Camera speed in m/s
+    visibility : float
+        Visibility density in [0, 1]
+    """
+    rng = np.random.RandomState(seed)
+    timestamps, positions, rotations, _ = circular_trajectory(duration, speed, radius)
+
+    landmark_angles = rng.uniform(0, 2 * np.pi, size=num_landmarks)
+    landmark_positions = np.column_stack((wall_radius * np.cos(landmark_angles),
+                                          wall_radius * np.sin(landmark_angles),
+                                          rng.uniform(-wall_height, wall_height, size=num_landmarks)))
+    colors = rng.randint(0, 256, size=(num_landmarks, 3)).astype('uint8')
+
+    # Interval i spans bounds[i] to bounds[i+1], and the first interval is unbounded below
+    bounds = np.hstack((-np.inf, np.arange(timestamps[0], timestamps[-1], interval)))
+    mid_times = bounds[1:] + interval / 2
+    camera_angles = speed / radius * mid_times
+    half_fov = np.arctan2(IMAGE_SIZE[0] / 2, FOCAL_LENGTH)
+
+    with h5py.File(path, 'w') as f:
+        f.attrs['name'] = name
+        group = f.create_group('position')
+        group['timestamps'] = timestamps
+        group['data'] = positions
+        group = f.create_group('orientation')
+        group['timestamps'] = timestamps
+        group['data'] = rotations
+        landmarks_group = f.create_group('landmarks')
+        landmarks_group['positions'] = landmark_positions
+        landmarks_group['colors'] = colors
+        landmarks_group['visibility_bounds'] = bounds
+        vis_group = landmarks_group.create_group('visibility')
+        pad = len(str(num_landmarks - 1))
+        chunk_size = 1024
+        for first in range(0, num_landmarks, chunk_size):
+            angles = landmark_angles[first:first + chunk_size]
+            diff = np.angle(np.exp(1j * (angles[:, np.newaxis] - camera_angles[np.newaxis, :])))
+            visible = (np.abs(diff) < half_fov) & (rng.uniform(size=diff.shape) < visibility)
+            for i, row in enumerate(visible, first):
+                # Interval ids are offset by one since interval 0 is before the first bound
+                vis_group['{:0{pad}d}'.format(i, pad=pad)] = np.flatnonzero(row).astype('uint64') + 1
+    return path
+
+def make_config(path, dataset_path, start, end, imu_rate=200.0, vectorized=True):
+    "Write a simulation config for a synthetic dataset using a pinhole camera and no relative pose"
+    cols, rows = IMAGE_SIZE
+    conf = {
+        'dataset': {'path': dataset_path, 'start': float(start), 'end': float(end)},
+        'camera': {
+            'type': 'pinhole',
+            'rows': rows,
+            'cols': cols,
+            'framerate': FRAME_RATE,
+            'readout': READOUT,
+            'parameters': {
+                'camera_matrix': [FOCAL_LENGTH, 0., cols / 2, 0., FOCAL_LENGTH, rows / 2, 0., 0., 1.]
+            }
+        },
+        'imu': {
+            'type': 'DefaultIMU',
+            'sample_rate': float(imu_rate),
+            'vectorized': vectorized,
+            'accelerometer': {'noise': 0.01, 'bias': [0.01, 0.02, 0.03]},
+            'gyroscope': {'noise': 1e-4, 'bias': [0.001, 0.002, 0.003]},
+        },
+        'seed': 0,
+    }
+    with open(path, 'w') as f:
+        yaml.safe_dump(conf, f, default_flow_style=False)
+    return path
@@ -0,0 +1,137 @@
+from __future__ import print_function, division
+
+import csv
+import datetime
+import glob
+import logging
+import multiprocessing
+
+import h5py
+import numpy as np
+
+from .constants import DATETIME_FORMAT
+
+logger = logging.getLogger("rsimusim.batch")
+
+SUMMARY_COLUMNS = [
+    'path', 'dataset_path', 'wall_clock', 'num_frames',
+    'observations_mean', 'observations_min', 'observations_max', 'observations_total',
+    'num_tracks', 'track_length_mean', 'track_length_max', 'track_length_histogram',
+    'num_imu_samples',
+    'gyro_mean_x', 'gyro_mean_y', 'gyro_mean_z', 'gyro_std_x', 'gyro_std_y', 'gyro_std_z',
+    'acc_mean_x', 'acc_mean_y', 'acc_mean_z', 'acc_std_x', 'acc_std_y', 'acc_std_z',
+    'error',
+]
+
+def summarize_results(path):
+    """Summarize a single simulation results file
+
+    The file is read directly with h5py such that neither the trajectory nor the
+    per-frame observation dicts are constructed.
+
+    Returns
+    ----------------
+    summary : dict
+        Scalar summary values, the per-frame observation counts and the track
+        length histogram (histogram[n] is the number of tracks of length n).
+    """
+    def load_string(h5ds):
+        data = h5ds.value
+        return data.decode('utf8') if isinstance(data, bytes) else data
+
+    def load_datetime(h5ds):
+        return datetime.datetime.strptime(load_string(h5ds), DATETIME_FORMAT)
+
+    def imu_statistics(group, prefix):
+        data = group['data'].value
+        stats = {}
+        for axis, mean, std in zip('xyz', data.mean(axis=1), data.std(axis=1)):
+            stats['{}_mean_{}'.format(prefix, axis)] = mean
+            stats['{}_std_{}'.format(prefix, axis)] = std
+        return stats, data.shape[1]
+
+    with h5py.File(path, 'r') as f:
+        time_started = load_datetime(f['time_started'])
+        time_finished = load_datetime(f['time_finished'])
+
+        framegroup = f['camera']
+        landmarks = [framegroup[fkey]['landmarks'].value for fkey in sorted(framegroup.keys())]
+        counts = np.array([lms.size for lms in landmarks], dtype='int64')
+        if 'tracks' in f:
+            track_lengths = np.diff(f['tracks']['offsets'].value)
+        elif landmarks:
+            _, track_lengths = np.unique(np.concatenate(landmarks), return_counts=True)
+        else:
+            track_lengths = np.empty(0, dtype='int64')
+
+        gyro_stats, num_imu_samples = imu_statistics(f['gyroscope'], 'gyro')
+        acc_stats, _ = imu_statistics(f['accelerometer'], 'acc')
+
+        summary = {
+            'path': path,
+            'dataset_path': load_string(f['dataset_path']),
+            'wall_clock': (time_finished - time_started).total_seconds(),
+            'num_frames': counts.size,
+            'observation_counts': counts,
+            'observations_mean': counts.mean() if counts.size else 0.0,
+            'observations_min': counts.min() if counts.size else 0,
+            'observations_max': counts.max() if counts.size else 0,
+            'observations_total': counts.sum(),
+            'num_tracks': track_lengths.size,
+            'track_length_mean': track_lengths.mean() if track_lengths.size else 0.0,
+            'track_length_max': track_lengths.max() if track_lengths.size else 0,
+            'track_length_histogram': np.bincount(track_lengths),
+            'num_imu_samples': num_imu_samples,
+            'error': '',
+        }
+        summary.update(gyro_stats)
+        summary.update(acc_stats)
+
+    return summary
+
+def _summarize_safe(path):
+    try:
+        return summarize_results(path)
+    except Exception as e:
+        return {'path': path, 'error': '{}: {}'.format(e.__class__.__name__, e)}
+
+def summarize_files(patterns, processes=None):
+    """Summarize all results files matching the glob pattern(s) using a process pool
+
+    Only the summaries are sent back to the parent process.
+    Files that fail to load get a summary with only 'path' and 'error' set.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    paths = sorted(set(path for pattern in patterns for path in glob.glob(pattern)))
+    logger.info("Summarizing %d results files", len(paths))
+    if not paths:
+        return []
+
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        summaries = []
+        for summary in pool.imap(_summarize_safe, paths):
+            if summary['error']:
+                logger.warning("Failed to summarize %s: %s", summary['path'], summary['error'])
+            summaries.append(summary)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return summaries
+
+def write_summary_table(summaries, path):
+    "Write summaries as a CSV table with one row per results file"
+    def format_value(value):
+        if isinstance(value, np.ndarray):
+            return ' '.join(str(x) for x in value)
+        return value
+
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow({key: format_value(val) for key, val in summary.items()})
@@ -0,0 +1,78 @@
+from __future__ import print_function, division
+
+import numpy as np
+
+DEFAULT_CAPACITY = 1024
+
+class MeasurementBuffer(object):
+    """Array backed time series of vector samples
+
+    Provides the parts of the imusim TimeSeries interface used for sensor measurements.
+    Samples are written by index into preallocated (dim, capacity) arrays which grow
+    geometrically if the capacity is exceeded. The timestamps and values properties
+    are views of the filled part of the arrays.
+    """
+    def __init__(self, capacity=None, dim=3, growth=2.0):
+        capacity = DEFAULT_CAPACITY if capacity is None else max(int(capacity), 1)
+        self._timestamps = np.empty(capacity)
+        self._values = np.empty((dim, capacity))
+        self._size = 0
+        self.growth = growth
+
+    @classmethod
+    def wrap(cls, timestamps, values):
+        "Buffer using the given (N,) timestamps and (dim, N) values arrays without copying"
+        instance = cls.__new__(cls)
+        instance._timestamps = timestamps
+        instance._values = values
+        instance._size = len(timestamps)
+        instance.growth = 2.0
+        return instance
+
+    @property
+    def capacity(self):
+        return self._timestamps.size
+
+    def _reserve(self, size):
+        if size <= self.capacity:
+            return
+        capacity = max(size, int(np.ceil(self.capacity * self.growth)))
+        timestamps = np.empty(capacity)
+        timestamps[:self._size] = self.timestamps
+        values = np.empty((self._values.shape[0], capacity))
+        values[:, :self._size] = self.values
+        self._timestamps = timestamps
+        self._values = values
+
+    def add(self, t, value):
+        "Add a single sample, or several samples if t is an array of times"
+        if np.ndim(t) == 0:
+            self._reserve(self._size + 1)
+            self._timestamps[self._size] = t
+            self._values[:, self._size] = np.ravel(value)
+            self._size += 1
+        else:
+            n = len(t)
+            self._reserve(self._size + n)
+            self._timestamps[self._size:self._size + n] = t
+            self._values[:, self._size:self._size + n] = value
+            self._size += n
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def timestamps(self):
+        return self._timestamps[:self._size]
+
+    @property
+    def values(self):
+        return self._values[:, :self._size]
+
+    @property
+    def latestTime(self):
+        return self._timestamps[self._size - 1]
+
+    @property
+    def latestValue(self):
+        return self._values[:, self._size - 1:self._size]
@@ -0,0 +1,63 @@
+from __future__ import print_function, division
+
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger("rsimusim.cache")
+
+def dataset_key(path):
+    "Identify a dataset file by its absolute path, size and modification time"
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime)
+
+class StageCache(object):
+    """Memoization of intermediate simulation stages
+
+    Entries are keyed by stage name and a digest of the inputs of the stage, such that
+    simulations which share e.g. dataset and relative pose but differ in noise or camera
+    model can reuse the noise free results. The least recently used entries are
+    evicted when more than max_entries are stored.
+    """
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*inputs):
+        h = hashlib.sha1()
+        for x in inputs:
+            if isinstance(x, np.ndarray):
+                h.update('{}{}'.format(x.dtype, x.shape).encode('utf8'))
+                h.update(np.ascontiguousarray(x).tobytes())
+            else:
+                h.update(repr(x).encode('utf8'))
+        return h.hexdigest()
+
+    def get(self, stage, key, compute):
+        "Cached value of stage for key, calling compute() on a miss"
+        k = (stage, key)
+        try:
+            value = self._entries.pop(k)
+            self.hits += 1
+            logger.debug("Cache hit for stage %s", stage)
+        except KeyError:
+            value = compute()
+            self.misses += 1
+            logger.debug("Cache miss for stage %s", stage)
+        self._entries[k] = value
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
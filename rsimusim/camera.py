@@ -1,16 +1,28 @@
 from __future__ import print_function, division
 
+import time
+import atexit
+import threading
 import multiprocessing
 import logging
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 import numpy as np
-import scipy.optimize
 
 from imusim.platforms.base import Platform, Component
 from imusim.platforms.timers import IdealTimer
-from imusim.utilities.time_series import TimeSeries
+
+from .buffers import DEFAULT_CAPACITY
+from .trajectory import quaternions_to_matrices
+from . import profiling
 
 USE_MULTIPROC = True
+PROJECTION_METHODS = ('exact', 'linearized')
+# Seconds between control queue reads of idle projection workers
+CONTROL_POLL_INTERVAL = 0.1
 
 logger = logging.getLogger("rsimusim.camera")
 
@@ -73,6 +85,11 @@ def project_at_time(t, X, Rci, pci, trajectory, camera_model):
     return y, X_camera
 
 def _project_point_rs(X, t0, camera_model, Rci, pci, trajectory):
+    y, vt, _ = _solve_projection_row(X, t0, camera_model, Rci, pci, trajectory)
+    return y, vt
+
+def _solve_projection_row(X, t0, camera_model, Rci, pci, trajectory):
+    "Rolling shutter projection, also returning the number of root solver iterations"
     def root_func(r):
         t = t0 + r * camera_model.readout / camera_model.rows
         (u, v), X_camera = project_at_time(t, X, Rci, pci, trajectory, camera_model)
@@ -80,56 +97,202 @@ def _project_point_rs(X, t0, camera_model, Rci, pci, trajectory):
             raise ValueError("Behind camera")
         return v - r
 
+    from scipy.optimize import brentq
     try:
-        v = scipy.optimize.brentq(root_func, 0, camera_model.rows, xtol=0.5)
+        v, r = brentq(root_func, 0, camera_model.rows, xtol=0.5, full_output=True)
     except ValueError:
-        return None, None
+        return None, None, 0
     vt = t0 + v * camera_model.readout / camera_model.rows
     y, _ = project_at_time(vt, X, Rci, pci, trajectory, camera_model)
-    return y, vt
+    return y, vt, r.iterations
+
+def _project_at_times(times, X, Rci, pci, trajectory, camera_model, evaluator=None):
+    "Vectorized project_at_time for (3, N) landmarks X, each at its own time"
+    if evaluator is None:
+        Rws = quaternions_to_matrices(trajectory.rotation(times).array)
+        pws = trajectory.position(times)
+    else:
+        Rws = evaluator.rotation_matrix(times)
+        pws = evaluator.position(times)
+    X_imu = np.einsum('nji,jn->in', Rws, X - pws)
+    X_camera = np.dot(Rci, X_imu) + pci
+    return camera_model.project(X_camera), X_camera[2]
+
+def project_linearized(positions, t0, camera_model, Rci, pci, trajectory, max_error=0.5, evaluator=None):
+    """Rolling shutter projection of all landmarks of a frame using a linearized trajectory
+
+    The camera motion is linearized around the mid-readout time using the linear and
+    angular velocity of the trajectory, which gives the row equation r = v(t(r)) in closed form
+    for every landmark. One correction step is then made with the exact pose at the solved row.
+    The remaining row residual gives an estimate of the pixel error compared to the exact root,
+    and landmarks whose estimate exceeds max_error, or which are close to degenerate, are marked
+    to be projected with the exact solver instead.
+
+    Parameters
+    ----------------
+    positions : (N, 3) array
+        Landmark positions
+    t0 : float
+        Frame start time
+    max_error : float
+        Largest accepted error estimate, in pixels
+    evaluator : TrajectoryEvaluator
+        If given, poses are evaluated by it for all landmarks at once, instead of by the trajectory.
+        The error estimate is then relative to the evaluator's splines, see TrajectoryEvaluator.
+
+    Returns
+    ----------------
+    image_points : (N, 2) array
+        Projected points, NaN for landmarks without a projection in the frame
+    fallback : (N,) bool array
+        Landmarks which must be projected with the exact solver
+    errors : (N,) array
+        Estimated pixel errors
+    """
+    X = np.asarray(positions, dtype='double').reshape(-1, 3).T
+    n = X.shape[1]
+    rows = camera_model.rows
+    row_time = camera_model.readout / rows
+    tm = t0 + 0.5 * camera_model.readout
+
+    # First order motion of the landmarks in the camera frame around the mid-readout time
+    if evaluator is None:
+        Rws = np.array(trajectory.rotation(tm).toMatrix())
+        pws = trajectory.position(tm).reshape(3, 1)
+        v = trajectory.velocity(tm).reshape(3, 1)
+        w = trajectory.rotationalVelocity(tm).reshape(3, 1)
+    else:
+        values = evaluator.evaluate(tm)
+        Rws = values['rotation'][0]
+        pws, v, w = values['position'], values['velocity'], values['rotational_velocity']
+    D = X - pws
+    X_camera = np.dot(Rci, np.dot(Rws.T, D)) + pci
+    dX_camera = -np.dot(Rci, np.dot(Rws.T, np.cross(w, D, axis=0) + v))
+
+    # Image motion per second, by a finite difference of one row time
+    y0 = camera_model.project(X_camera)
+    J = (camera_model.project(X_camera + row_time * dX_camera) - y0) / row_time
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Linearized row equation r = y0_v + J_v (t(r) - tm)
+        denom = 1 - J[1] * row_time
+        r1 = (y0[1] - 0.5 * rows * J[1] * row_time) / denom
+        # Keep the trajectory queries near the frame, points far outside are rejected anyway
+        r1 = np.clip(np.where(np.isfinite(r1), r1, 0.5 * rows), -rows, 2 * rows)
+
+        # Correction step using the exact pose at the solved row
+        (_, v1), z1 = _project_at_times(tm + (r1 - 0.5 * rows) * row_time, X, Rci, pci, trajectory, camera_model,
+                                        evaluator)
+        r2 = r1 + (v1 - r1) / denom
+        r2 = np.clip(np.where(np.isfinite(r2), r2, 0.5 * rows), -rows, 2 * rows)
+        y2, z2 = _project_at_times(tm + (r2 - 0.5 * rows) * row_time, X, Rci, pci, trajectory, camera_model,
+                                   evaluator)
+
+        # The exact root is about (y2_v - r2) / denom rows away, where the point moves J row_time per row
+        errors = np.abs((y2[1] - r2) / denom) * row_time * np.sqrt(np.sum(J ** 2, axis=0))
+
+        valid = np.isfinite(errors) & (X_camera[2] > 0) & (z1 > 0) & (z2 > 0) & (denom > 0.5)
+        inside = (r2 >= 0) & (r2 < rows)
+        # Points just outside the row range may still have an exact root inside it
+        outside = (r2 < -1) | (r2 > rows + 1)
+    accepted = valid & (errors <= max_error)
+    fallback = ~(accepted & (inside | outside))
+
+    image_points = np.full((n, 2), np.nan)
+    use = accepted & inside
+    image_points[use] = y2[:, use].T
+    return image_points, fallback, errors
+
+def _drain_control(ctrlq, contexts, block=False):
+    "Apply pending register and release messages, waiting for the first one if block is True"
+    while True:
+        try:
+            message, handle, context = ctrlq.get(block)
+        except queue.Empty:
+            return
+        block = False
+        if message == 'register':
+            contexts[handle] = context
+        else:
+            contexts.pop(handle, None)
 
-def projection_worker(camera_model, Rci, pci, trajectory, inq, outq):
+def projection_worker(inq, outq, ctrlq):
     logger.debug("Worker process (pid=%d) started", multiprocessing.current_process().pid)
+    contexts = {}
     while True:
-        object = inq.get()
+        try:
+            object = inq.get(timeout=CONTROL_POLL_INTERVAL)
+        except queue.Empty:
+            # Idle workers keep reading the control queue, such that it never fills up
+            _drain_control(ctrlq, contexts)
+            continue
         if object is None:
             inq.put(object)
             break # Stop processing
-        lm_id, lm_pos, t = object
-        image_point, _ = _project_point_rs(lm_pos, t, camera_model, Rci, pci, trajectory)
-        outq.put((lm_id, image_point))
+        tag, start, positions, t = object
+        handle = tag[0]
+        _drain_control(ctrlq, contexts)
+        # Contexts are registered before their tasks are queued, so block until it has arrived
+        while handle not in contexts:
+            _drain_control(ctrlq, contexts, block=True)
+        camera_model, Rci, pci, trajectory = contexts[handle]
+        t0 = time.time()
+        image_points = []
+        iterations = 0
+        for lm_pos in positions:
+            image_point, _, n = _solve_projection_row(lm_pos, t, camera_model, Rci, pci, trajectory)
+            image_points.append(image_point)
+            iterations += n
+        outq.put((tag, start, image_points, time.time() - t0, iterations))
     logger.debug("Worker process (pid=%d) quit normally", multiprocessing.current_process().pid)
 
-class Camera(Component):
-    def __init__(self, camera_model, Rci, pci, platform):
-        self.current_frame = 0
-        self.camera_model = camera_model
-        self.Rci = Rci
-        self.pci = pci
+class ProjectionPool(object):
+    """Pool of projection worker processes that can be shared by many cameras
 
-        if USE_MULTIPROC:
-            self.inq = multiprocessing.Queue()
-            self.outq = multiprocessing.Queue()
-            self.procs = []
+    The camera model, relative pose and trajectory of a camera are sent to the workers
+    once, when the camera registers them, and tasks then refer to them by handle.
+    The worker processes are thus started once and reused by all simulations that use the pool.
+    Cameras may use the pool from several threads, but their project() calls are run one at a time.
 
-        super(Camera, self).__init__(platform)
+    The pool can be used as a context manager, which starts the workers on entry
+    and stops them on exit.
+    """
+    def __init__(self, processes=None):
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.procs = []
+        self.handles = set()
+        self._next_handle = 0
+        self._next_call = 0
+        self._lock = threading.Lock()
 
-    def __del__(self):
-        if USE_MULTIPROC:
-            self.stop_multiproc()
+    def __enter__(self):
+        self.start()
+        return self
 
-    def start_multiproc(self):
-        if not USE_MULTIPROC:
-            raise RuntimeError("Multiprocessing is turned off in code")
-        args = (self.camera_model, self.Rci, self.pci, self.platform.trajectory, self.inq, self.outq)
-        self.procs = [ multiprocessing.Process(target=projection_worker, args=args)
-                          for _ in range(multiprocessing.cpu_count()) ]
+    def __exit__(self, *exc_info):
+        self.close(kill=exc_info[0] is not None)
+
+    @property
+    def alive(self):
+        "Number of worker processes that are alive"
+        return sum(1 for proc in self.procs if proc.is_alive())
+
+    def start(self):
+        if self.procs:
+            return
+        self.inq = multiprocessing.Queue()
+        self.outq = multiprocessing.Queue()
+        self.ctrlqs = [multiprocessing.Queue() for _ in range(self.processes)]
+        self.procs = [multiprocessing.Process(target=projection_worker, args=(self.inq, self.outq, ctrlq))
+                      for ctrlq in self.ctrlqs]
         for proc in self.procs:
             proc.daemon = True # Kill process on parent exit
             proc.start()
         logger.info('Started %d worker processes', len(self.procs))
 
-    def stop_multiproc(self, kill=False):
+    def close(self, kill=False):
+        if not self.procs:
+            return
         logger.debug("Signalling worker processes to stop")
         self.inq.put(None) # Signal done
         for proc in self.procs:
@@ -137,8 +300,228 @@ class Camera(Component):
                 proc.terminate()
             else:
                 proc.join()
+        # Unread messages must not keep the interpreter from exiting
+        for q in [self.inq, self.outq] + self.ctrlqs:
+            q.cancel_join_thread()
+            q.close()
+        self.procs = []
+        self.ctrlqs = []
+        self.handles.clear()
         logger.debug("All worker processes has quit")
 
+    def register(self, camera_model, Rci, pci, trajectory):
+        "Send a projection context to all workers and return its handle"
+        self.start()
+        handle = self._next_handle
+        self._next_handle += 1
+        self.handles.add(handle)
+        for ctrlq in self.ctrlqs:
+            ctrlq.put(('register', handle, (camera_model, Rci, pci, trajectory)))
+        logger.debug("Registered projection context %d", handle)
+        return handle
+
+    def release(self, handle):
+        "Let the workers drop a projection context"
+        if handle not in self.handles:
+            return
+        self.handles.discard(handle)
+        for ctrlq in self.ctrlqs:
+            ctrlq.put(('release', handle, None))
+
+    def project(self, handle, positions, t, image_points, chunk_size=1, workers=None):
+        """Project landmark positions at frame time t, filling successful projections into image_points
+
+        Positions are sent to the workers in chunks of chunk_size landmarks. At most workers
+        chunks, by default one per worker process, are queued at a time, and the next chunk
+        is queued when a result comes back, such that at most that many workers are busy.
+        Returns the total time spent projecting in the workers.
+        """
+        workers = self.processes if workers is None else max(1, workers)
+        starts = list(range(0, len(positions), chunk_size))
+        with self._lock:
+            # Results are tagged with the call, such that results left over from an interrupted call are dropped
+            tag = (handle, self._next_call)
+            self._next_call += 1
+            queued = 0
+            pending = 0
+            busy = 0.0
+            with profiling.phase('queue_wait'):
+                while queued < len(starts) or pending > 0:
+                    while queued < len(starts) and pending < workers:
+                        start = starts[queued]
+                        self.inq.put((tag, start, positions[start:start + chunk_size], t))
+                        queued += 1
+                        pending += 1
+                    result_tag, start, chunk_points, elapsed, iterations = self.outq.get()
+                    if result_tag != tag:
+                        continue
+                    pending -= 1
+                    busy += elapsed
+                    profiling.count('brentq_iterations', iterations)
+                    for i, im_pt in enumerate(chunk_points, start):
+                        if im_pt is not None:
+                            image_points[i] = im_pt.ravel()
+            return busy
+
+_projection_pool = None
+
+def projection_pool():
+    "The shared projection pool, which is created on first use"
+    global _projection_pool
+    if _projection_pool is None:
+        _projection_pool = ProjectionPool()
+        atexit.register(shutdown_projection_pool)
+    return _projection_pool
+
+def shutdown_projection_pool(kill=False):
+    "Stop the worker processes of the shared projection pool"
+    global _projection_pool
+    if _projection_pool is not None:
+        _projection_pool.close(kill=kill)
+        _projection_pool = None
+
+class ProjectionScheduler(object):
+    """Choose serial or parallel projection for each frame
+
+    The scheduler keeps running estimates of the time to project one landmark, and of the
+    overhead of sending one chunk of landmarks to a worker process and back.
+    For every frame it picks the number of workers, and the chunk size, that minimizes the
+    predicted time, where zero workers means that the frame is projected serially.
+
+    Parameters
+    ----------------
+    mode : str
+        'auto' to decide per frame, or 'serial' or 'parallel' to always use that mode
+    workers : int
+        Maximum number of workers to use, defaults to the size of the projection pool
+    chunk_size : int
+        Fixed number of landmarks per chunk in parallel mode
+    """
+    MODES = ('auto', 'serial', 'parallel')
+    # Initial estimates, which are replaced by measurements as frames are projected
+    DEFAULT_LANDMARK_COST = 1e-3
+    DEFAULT_CHUNK_OVERHEAD = 2e-4
+    # Number of chunks per worker, for load balancing
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self, mode='auto', workers=None, chunk_size=None, smoothing=0.2):
+        if mode not in self.MODES:
+            raise ValueError("No such projection mode: {}".format(mode))
+        self.mode = mode
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.smoothing = smoothing
+        self.landmark_cost = self.DEFAULT_LANDMARK_COST
+        self.chunk_overhead = self.DEFAULT_CHUNK_OVERHEAD
+        self.decisions = [] # (frame number, landmarks, workers, chunk size)
+
+    def _update(self, name, value):
+        current = getattr(self, name)
+        setattr(self, name, (1 - self.smoothing) * current + self.smoothing * value)
+
+    def _chunk_size(self, num_landmarks, workers):
+        if self.chunk_size is not None:
+            return self.chunk_size
+        return max(1, int(np.ceil(num_landmarks / (self.CHUNKS_PER_WORKER * workers))))
+
+    def predict(self, num_landmarks, workers):
+        "Predicted time to project a frame using the given number of workers"
+        if workers == 0:
+            return num_landmarks * self.landmark_cost
+        num_chunks = np.ceil(num_landmarks / self._chunk_size(num_landmarks, workers))
+        return num_chunks * self.chunk_overhead + num_landmarks * self.landmark_cost / min(workers, num_chunks)
+
+    def plan(self, framenum, num_landmarks, max_workers):
+        """Choose how to project a frame
+
+        Returns
+        ----------------
+        workers : int
+            Number of workers to use, or 0 to project serially
+        chunk_size : int
+            Landmarks per chunk, or None for serial projection
+        """
+        if self.workers is not None:
+            max_workers = min(max_workers, self.workers)
+        if self.mode == 'serial' or max_workers < 1 or num_landmarks == 0:
+            candidates = [0]
+        elif self.mode == 'parallel':
+            candidates = range(1, max_workers + 1)
+        else:
+            candidates = range(max_workers + 1)
+        workers = min(candidates, key=lambda w: self.predict(num_landmarks, w))
+        chunk_size = self._chunk_size(num_landmarks, workers) if workers > 0 else None
+
+        if not self.decisions or self.decisions[-1][2] != workers:
+            logger.info("Frame %d: projecting %d landmarks %s", framenum, num_landmarks,
+                        "serially" if workers == 0 else
+                        "using {:d} workers and chunk size {:d}".format(workers, chunk_size))
+        self.decisions.append((framenum, num_landmarks, workers, chunk_size))
+        return workers, chunk_size
+
+    def record_serial(self, num_landmarks, elapsed):
+        if num_landmarks > 0:
+            self._update('landmark_cost', elapsed / num_landmarks)
+
+    def record_parallel(self, num_landmarks, num_chunks, workers, elapsed, busy):
+        "Update estimates from wall clock time and total time spent projecting in the workers"
+        if num_landmarks == 0:
+            return
+        self._update('landmark_cost', busy / num_landmarks)
+        overhead = max(elapsed - busy / min(workers, num_chunks), 0.0)
+        self._update('chunk_overhead', overhead / num_chunks)
+
+class Camera(Component):
+    def __init__(self, camera_model, Rci, pci, platform):
+        self.current_frame = 0
+        self.camera_model = camera_model
+        self.Rci = Rci
+        self.pci = pci
+        # Can be turned off per instance, e.g. when the camera is already used from a worker process
+        self.use_multiproc = USE_MULTIPROC
+        # Projection pool to use, or None for the shared pool
+        self.pool = None
+        self.scheduler = ProjectionScheduler()
+        # Landmarks are projected with the exact root solver, or linearized with exact fallback
+        self.projection_method = 'exact'
+        self.max_projection_error = 0.5 # Pixels, for the linearized method
+        # Optional TrajectoryEvaluator to linearize on instead of the platform trajectory, which it only approximates
+        self.evaluator = None
+        # Progress counters, e.g. for telemetry
+        self.landmarks_projected = 0
+        self.projection_busy = 0.0 # Seconds spent projecting in worker processes
+        self.frame_started = None # Wall clock time when the current frame started, if sampling
+        self._pool_handle = None
+
+        super(Camera, self).__init__(platform)
+
+    def __del__(self):
+        if self._pool_handle is not None:
+            self.stop_multiproc()
+
+    def __getstate__(self):
+        # Worker processes are not pickled, e.g. in checkpoints
+        state = self.__dict__.copy()
+        state['pool'] = None
+        state['_pool_handle'] = None
+        state['frame_started'] = None
+        return state
+
+    def start_multiproc(self):
+        if not USE_MULTIPROC:
+            raise RuntimeError("Multiprocessing is turned off in code")
+        if self.pool is None:
+            self.pool = projection_pool()
+        if self._pool_handle not in self.pool.handles:
+            self._pool_handle = self.pool.register(self.camera_model, self.Rci, self.pci, self.platform.trajectory)
+
+    def stop_multiproc(self, kill=False):
+        "Release the projection context from the pool. The workers are only stopped if kill is True."
+        if self._pool_handle is not None:
+            self.pool.release(self._pool_handle)
+        self._pool_handle = None
+        if kill and self.pool is not None:
+            self.pool.close(kill=True)
 
     @property
     def frame_rate(self):
@@ -146,45 +529,186 @@ class Camera(Component):
 
     def sample(self, t):
         framenum = self.current_frame
+        self.frame_started = time.time()
         logger.debug("Sampling frame %d at time %.5f", framenum, t)
         self.current_frame += 1
         environment = self.platform.simulation.environment
         pos = self.platform.trajectory.position(t)
         orientation = self.platform.trajectory.rotation(t)
 
-        landmarks = environment.observe(t, pos, orientation)
+        with profiling.phase('visibility'):
+            landmarks = environment.observe(t, pos, orientation)
         logger.debug("There are %d potential landmarks", len(landmarks))
-        if USE_MULTIPROC:
-            if not self.procs:
-                self.start_multiproc()
-            image_observation_list = []
-            for lm in landmarks:
-                self.inq.put((lm.id, lm.position, t))
-
-            not_seen = set([lm.id for lm in landmarks])
-            while not_seen:
-                lm_id, im_pt = self.outq.get()
-                if im_pt is not None:
-                    image_observation_list.append((lm_id, im_pt))
-                not_seen.remove(lm_id)
-
+        landmark_ids = np.fromiter((lm.id for lm in landmarks), dtype='int64', count=len(landmarks))
+        if self.projection_method == 'linearized' and landmarks:
+            with profiling.phase('linearized_projection'):
+                image_points, fallback, _ = project_linearized(np.array([lm.position for lm in landmarks]), t,
+                                                               self.camera_model, self.Rci, self.pci,
+                                                               self.platform.trajectory, self.max_projection_error,
+                                                               self.evaluator)
+            exact_indices = np.flatnonzero(fallback)
+            profiling.count('linearized_fallbacks', exact_indices.size)
+            exact_landmarks = [landmarks[i] for i in exact_indices]
+            exact_points = np.full((len(exact_landmarks), 2), np.nan)
+        else:
+            image_points = np.full((len(landmarks), 2), np.nan)
+            exact_indices = None
+            exact_landmarks = landmarks
+            exact_points = image_points
+        if self.use_multiproc:
+            max_workers = multiprocessing.cpu_count() if self.pool is None else self.pool.processes
+            workers, chunk_size = self.scheduler.plan(framenum, len(exact_landmarks), max_workers)
         else:
-            image_observation_list = [(lm.id, self.project_point_rs(lm.position, t)[0]) for lm in landmarks]
-        image_observations = {lm_id : image_point for lm_id, image_point in image_observation_list
-                              if 0 <= image_point[0] <= self.camera_model.columns \
-                                and 0 <= image_point[1] < self.camera_model.rows}
+            workers = 0
+
+        with profiling.phase('projection'):
+            t0 = time.time()
+            if workers > 0:
+                self.start_multiproc()
+                busy = self.pool.project(self._pool_handle, [lm.position for lm in exact_landmarks], t, exact_points,
+                                         chunk_size, workers)
+                num_chunks = int(np.ceil(len(exact_landmarks) / chunk_size))
+                self.projection_busy += busy
+                self.scheduler.record_parallel(len(exact_landmarks), num_chunks, workers, time.time() - t0, busy)
+            else:
+                iterations = 0
+                for i, lm in enumerate(exact_landmarks):
+                    im_pt, _, n = _solve_projection_row(lm.position, t, self.camera_model, self.Rci, self.pci,
+                                                        self.platform.trajectory)
+                    iterations += n
+                    if im_pt is not None:
+                        exact_points[i] = im_pt.ravel()
+                self.scheduler.record_serial(len(exact_landmarks), time.time() - t0)
+                profiling.count('brentq_iterations', iterations)
+        if exact_indices is not None:
+            image_points[exact_indices] = exact_points
+
+        # Failed projections are left as NaN and rejected together with out of bounds points
+        valid = inside_image(image_points, self.camera_model)
+        image_observations = FrameObservations(landmark_ids[valid], image_points[valid])
+        self.landmarks_projected += len(image_observations)
+        self.frame_started = None
+        profiling.count('frames')
+        profiling.count('landmarks_considered', len(landmarks))
+        profiling.count('landmarks_projected', len(image_observations))
+        profiling.count('landmarks_rejected', len(landmarks) - len(image_observations))
         logger.debug("Frame %d had %d valid observations", framenum, len(image_observations))
         return framenum, t, image_observations
 
     def project_point_rs(self, X, t0):
-        return _project_point_rs(X, t0, self.camera_model, self.platform.trajectory)
+        return _project_point_rs(X, t0, self.camera_model, self.Rci, self.pci, self.platform.trajectory)
+
+def inside_image(image_points, camera_model):
+    """Mask of the (N, 2) image points that are inside the image
+
+    Pixel coordinates x and y are inside if 0 <= x < columns and 0 <= y < rows.
+    NaN points, e.g. failed projections, are outside.
+    """
+    x, y = np.asarray(image_points).T
+    with np.errstate(invalid='ignore'):
+        return (x >= 0) & (x < camera_model.columns) & (y >= 0) & (y < camera_model.rows)
+
+class FrameObservations(object):
+    """Image observations of a single frame
+
+    Landmark ids are stored as an (N,) int64 array and the corresponding image points
+    as a contiguous (N, 2) array.
+    """
+    __slots__ = ('landmarks', 'points')
+
+    def __init__(self, landmarks, points):
+        self.landmarks = landmarks
+        self.points = points
+
+    def __len__(self):
+        return self.landmarks.size
+
+    def as_dict(self):
+        "Observations as a dict mapping landmark id to a (2,1) image point"
+        return {lm_id: ip.reshape(2,1) for lm_id, ip in zip(self.landmarks.tolist(), self.points)}
+
+class ImageMeasurements(object):
+    """Time series of FrameObservations
+
+    Mimics the TimeSeries interface. The values property is a sequence of the
+    observations of each frame as a dict, as produced by earlier versions.
+    The dicts are built when accessed, so prefer frames where possible.
+    """
+    def __init__(self, capacity=None):
+        capacity = DEFAULT_CAPACITY if capacity is None else max(int(capacity), 1)
+        self._timestamps = np.empty(capacity)
+        self.frames = []
+
+    def add(self, t, frame):
+        n = len(self.frames)
+        if n == self._timestamps.size:
+            self._timestamps = np.hstack((self._timestamps, np.empty(n)))
+        self._timestamps[n] = t
+        self.frames.append(frame)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def timestamps(self):
+        return self._timestamps[:len(self.frames)]
+
+    @property
+    def values(self):
+        return _FrameDicts(self.frames)
+
+    def flatten(self):
+        """All observations as flat arrays
+
+        Returns
+        ----------------
+        landmarks : (M,) array of landmark ids
+        frames : (M,) array of frame indices
+        times : (M,) array of frame times
+        points : (M, 2) array of image points
+        """
+        counts = [len(frame) for frame in self.frames]
+        frame_indices = np.repeat(np.arange(len(self.frames)), counts)
+        times = np.repeat(self.timestamps, counts)
+        if not self.frames:
+            return np.empty(0, dtype='int64'), frame_indices, times, np.empty((0, 2))
+        landmarks = np.concatenate([frame.landmarks for frame in self.frames])
+        points = np.concatenate([frame.points for frame in self.frames])
+        return landmarks, frame_indices, times, points
+
+class _FrameDicts(object):
+    "Sequence of the observations of each frame as a dict, built on access"
+    def __init__(self, frames):
+        self._frames = frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [frame.as_dict() for frame in self._frames[index]]
+        return self._frames[index].as_dict()
+
+    def __iter__(self):
+        for frame in self._frames:
+            yield frame.as_dict()
+
+def frame_times(start_time, end_time, frame_rate, readout):
+    """Start times of all frames sampled by BasicCameraBehaviour
+
+    The first frame starts one period after start_time, and frames
+    that would end after end_time are not sampled.
+    """
+    period = 1. / frame_rate
+    num_frames = int(np.floor((end_time - readout - start_time) / period + 1e-9))
+    return start_time + period * np.arange(1, num_frames + 1)
 
 class BasicCameraBehaviour(object):
-    def __init__(self, camera_platform, end_time):
+    def __init__(self, camera_platform, end_time, capacity=None):
         self.camera_platform = camera_platform
         self.end_time = end_time
         camera = self.camera_platform.camera
-        camera.measurements = TimeSeries()
+        camera.measurements = ImageMeasurements(capacity)
         # Start the sampling process
         timer = self.camera_platform.timer
         timer.callback = self._timer_callback
@@ -0,0 +1,4 @@
+"Constants shared by modules which should not import the simulation"
+
+# Format of the start and finish times stored in results files
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
@@ -2,7 +2,6 @@ from __future__ import print_function, division
 
 import bisect
 
-import h5py
 import numpy as np
 from imusim.maths.quaternions import QuaternionArray
 from imusim.utilities.time_series import TimeSeries
@@ -11,6 +10,7 @@ from imusim.trajectories.splined import \
     SampledRotationTrajectory, SplinedRotationTrajectory, \
     SampledTrajectory, SplinedTrajectory
 
+from . import profiling
 
 class DatasetError(Exception):
     pass
@@ -62,6 +62,11 @@ class Dataset(object):
 
     @classmethod
     def from_file(cls, filepath):
+        with profiling.phase('dataset_load'):
+            return cls._from_file(filepath)
+
+    @classmethod
+    def _from_file(cls, filepath):
         instance = cls()
 
         def load_timeseries(group):
@@ -71,6 +76,7 @@ class Dataset(object):
                 data = QuaternionArray(data)
             return TimeSeries(timestamps, data)
 
+        import h5py
         with h5py.File(filepath, 'r') as h5f:
             instance.name = h5f.attrs['name']
             instance._position_data = load_timeseries(h5f['position'])
@@ -100,6 +106,10 @@ class Dataset(object):
         return [lm for lm in self.landmarks if interval_id in lm.visibility]
 
     def _update_trajectory(self):
+        with profiling.phase('spline_fit'):
+            self._fit_trajectory()
+
+    def _fit_trajectory(self):
         smooth_rotations = False
         if self._position_data and not self._orientation_data:
             samp = SampledPositionTrajectory(self._position_data)
@@ -0,0 +1,304 @@
+from __future__ import print_function, division
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+import datetime
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+from imusim.simulation.base import Simulation
+from imusim.behaviours.imu import BasicIMUBehaviour
+
+from .simulation import SimulationConfiguration, SimulationResults
+from .camera import ImageMeasurements, FrameObservations, frame_times, inside_image, project_linearized, \
+    _solve_projection_row
+from .inertial import DefaultIMU, sample_times, generate_default_imu
+from .scene import SceneEnvironment
+from .buffers import MeasurementBuffer
+from .trajectory import TrajectoryEvaluator
+
+logger = logging.getLogger("rsimusim.estimate")
+
+# Bytes per image observation (int64 landmark id and two double coordinates)
+OBSERVATION_BYTES = 24
+# Bytes per IMU sample, accelerometer and gyroscope with three doubles and a timestamp each
+IMU_SAMPLE_BYTES = 2 * 4 * 8
+# Approximate in memory size of a FrameObservations with its two arrays, and of a visibility cache entry
+FRAME_OVERHEAD_BYTES = 320
+VISIBILITY_ENTRY_BYTES = 8
+
+class CostEstimate(object):
+    """Predicted cost of running a simulation configuration
+
+    Attributes are counts of the work to do, the calibrated cost per item, and the
+    predicted totals: seconds (wall clock), memory_bytes (peak resident size) and
+    file_bytes (size of the results file).
+    """
+    def __init__(self):
+        self.frames = 0
+        self.imu_samples = 0
+        self.landmarks_considered = 0 # Landmark projections over all frames
+        self.landmarks_projected = 0 # Predicted observations in the results
+        self.acceptance = None # Fraction of projections inside the image
+        self.brentq_iterations = None # Mean root solver iterations per projection
+        self.projection_seconds = None # Per landmark
+        self.visibility_seconds = None # Per frame
+        self.imu_seconds = None # Per sample
+        self.setup_seconds = None
+        self.workers = 1
+        self.seconds = None
+        self.memory_bytes = None
+        self.file_bytes = None
+
+    def as_dict(self):
+        return OrderedDict((key, getattr(self, key)) for key in (
+            'frames', 'imu_samples', 'landmarks_considered', 'landmarks_projected', 'acceptance',
+            'brentq_iterations', 'projection_seconds', 'visibility_seconds', 'imu_seconds', 'setup_seconds',
+            'workers', 'seconds', 'memory_bytes', 'file_bytes'))
+
+    def summary(self):
+        "Human readable report of the estimate"
+        lines = [
+            '{:<24s} {:>14d}'.format('Frames', self.frames),
+            '{:<24s} {:>14d}'.format('IMU samples', self.imu_samples),
+            '{:<24s} {:>14d}'.format('Landmark projections', self.landmarks_considered),
+            '{:<24s} {:>14d}'.format('Observations', self.landmarks_projected),
+            '{:<24s} {:>14s}'.format('Acceptance', _format_optional(self.acceptance, '{:.1%}')),
+            '{:<24s} {:>14s}'.format('Projection', _format_optional(self.projection_seconds, '{:.3g} s')),
+            '{:<24s} {:>14d}'.format('Projection workers', self.workers),
+            '',
+            '{:<24s} {:>14s}'.format('Wall clock', _format_duration(self.seconds)),
+            '{:<24s} {:>14s}'.format('Peak memory', _format_optional(self.memory_bytes, _format_bytes)),
+            '{:<24s} {:>14s}'.format('Results file', _format_optional(self.file_bytes, _format_bytes)),
+        ]
+        return '\n'.join(lines)
+
+def visible_counts(dataset, times):
+    "Number of visible landmarks at each time, as given by Dataset.visible_landmarks()"
+    interval_ids = np.searchsorted(dataset._landmark_bounds, times, side='left') - 1
+    if not dataset.landmarks or len(times) == 0:
+        return np.zeros(len(times), dtype='int64')
+    visibility = np.concatenate([np.fromiter(lm.visibility, dtype='int64', count=len(lm.visibility))
+                                 for lm in dataset.landmarks])
+    first = min(visibility.min(), interval_ids.min()) if visibility.size else interval_ids.min()
+    counts = np.bincount(visibility - first, minlength=interval_ids.max() - first + 1)
+    return counts[interval_ids - first]
+
+def estimate(config_path, datasetdir=None, calibration_frames=20, calibration_size=200, imu_calibration_size=1000,
+             seed=0):
+    """Estimate the cost of a simulation without running it
+
+    The configuration and dataset are loaded as for a simulation. The number of frames and
+    IMU samples follow from the config, and the number of landmarks to project in every frame
+    from the visibility intervals of the dataset. The cost per projection, and the fraction
+    of projections that end up inside the image, are calibrated by projecting a random batch
+    of calibration_size visible landmarks from calibration_frames frames, or all their visible
+    landmarks for the linearized projection method. The IMU cost is calibrated by generating
+    imu_calibration_size samples.
+
+    Parameters
+    ----------------
+    config_path : str
+        Simulation configuration
+    datasetdir : str
+        Directory to search for the dataset
+
+    Returns
+    ----------------
+    estimate : CostEstimate
+    """
+    result = CostEstimate()
+    t0 = time.time()
+    config = SimulationConfiguration()
+    config.parse_yaml(config_path, datasetdir)
+    result.setup_seconds = time.time() - t0
+
+    camera_model = config.camera_model
+    times = frame_times(config.start_time, config.end_time, camera_model.frame_rate, camera_model.readout)
+    result.frames = len(times)
+    result.imu_samples = len(sample_times(config.start_time, config.end_time, config.imu_config['sample_rate']))
+    counts = visible_counts(config.dataset, times)
+    result.landmarks_considered = int(counts.sum())
+
+    rng = np.random.RandomState(seed)
+    _calibrate_projection(result, config, times, counts, calibration_frames, calibration_size, rng)
+    result.imu_seconds = _calibrate_imu(config, imu_calibration_size)
+
+    mode = config.projection['mode']
+    if mode == 'serial':
+        result.workers = 1
+    else:
+        # The auto mode only goes parallel when that is faster, so this is a lower bound
+        result.workers = config.projection.get('workers', multiprocessing.cpu_count())
+    projection_seconds = result.landmarks_considered * (result.projection_seconds or 0.0) / result.workers
+    result.seconds = (result.setup_seconds + result.frames * (result.visibility_seconds or 0.0) +
+                      projection_seconds + result.imu_samples * result.imu_seconds)
+
+    result.memory_bytes = _estimate_memory(result, config)
+    result.file_bytes = _estimate_file_size(result, config)
+    logger.debug("Estimate for %s: %s", config_path, dict(result.as_dict()))
+    return result
+
+def _calibrate_projection(result, config, times, counts, num_frames, batch_size, rng):
+    dataset = config.dataset
+    candidates = np.flatnonzero(counts)
+    if candidates.size == 0:
+        result.acceptance = 0.0
+        return
+    frames = candidates[np.linspace(0, candidates.size - 1, num=min(num_frames, candidates.size)).astype('int')]
+
+    t0 = time.time()
+    visible = [(times[i], dataset.visible_landmarks(times[i])) for i in frames]
+    result.visibility_seconds = (time.time() - t0) / len(frames)
+
+    pairs = [(t, lm) for t, landmarks in visible for lm in landmarks]
+    linearized = config.projection['method'] == 'linearized'
+    if linearized:
+        # The linearized method projects whole frames at once, so its cost is calibrated on whole frames
+        batch = pairs
+    else:
+        batch = [pairs[i] for i in rng.choice(len(pairs), size=min(batch_size, len(pairs)), replace=False)]
+
+    # The simulation projects through the transformed trajectory and the relative pose,
+    # which is the same as projecting through the dataset trajectory with the identity.
+    camera_model = config.camera_model
+    Rci = np.eye(3)
+    pci = np.zeros((3, 1))
+    trajectory = dataset.trajectory
+    if linearized:
+        evaluator = TrajectoryEvaluator.from_trajectory(trajectory) if config.projection['refit_spline'] else None
+        image_points, iterations, elapsed = _calibrate_linearized(batch, camera_model, Rci, pci, trajectory,
+                                                                  config.projection['max_error'], evaluator)
+    else:
+        image_points, iterations, elapsed = _calibrate_exact(batch, camera_model, Rci, pci, trajectory)
+    accepted = np.count_nonzero(inside_image(image_points, camera_model))
+    result.projection_seconds = elapsed / len(batch)
+    result.acceptance = accepted / len(batch)
+    result.brentq_iterations = iterations / len(batch)
+    result.landmarks_projected = int(round(result.landmarks_considered * result.acceptance))
+
+def _calibrate_exact(batch, camera_model, Rci, pci, trajectory):
+    image_points = np.full((len(batch), 2), np.nan)
+    iterations = 0
+    t0 = time.time()
+    for i, (t, lm) in enumerate(batch):
+        image_point, _, n = _solve_projection_row(lm.position, t, camera_model, Rci, pci, trajectory)
+        iterations += n
+        if image_point is not None:
+            image_points[i] = image_point.ravel()
+    return image_points, iterations, time.time() - t0
+
+def _calibrate_linearized(batch, camera_model, Rci, pci, trajectory, max_error, evaluator=None):
+    # As in Camera.sample, every frame is projected at once and fallbacks are solved exactly
+    times = np.array([t for t, _ in batch])
+    image_points = np.full((len(batch), 2), np.nan)
+    iterations = 0
+    t0 = time.time()
+    for t in np.unique(times):
+        indices = np.flatnonzero(times == t)
+        positions = np.array([batch[i][1].position for i in indices])
+        points, fallback, _ = project_linearized(positions, t, camera_model, Rci, pci, trajectory, max_error,
+                                                 evaluator)
+        image_points[indices] = points
+        for i in indices[fallback]:
+            image_point, _, n = _solve_projection_row(batch[i][1].position, t, camera_model, Rci, pci, trajectory)
+            iterations += n
+            image_points[i] = np.nan if image_point is None else image_point.ravel()
+    return image_points, iterations, time.time() - t0
+
+def _calibrate_imu(config, num_samples):
+    # Same IMU and sampling as the simulation, on the dataset trajectory
+    imu_conf = config.imu_config
+    sample_rate = imu_conf['sample_rate']
+    start = config.start_time
+    end = min(config.end_time, start + (num_samples + 1) / sample_rate)
+    times = sample_times(start, end, sample_rate)
+    if times.size == 0:
+        return 0.0
+    simulation = Simulation(environment=SceneEnvironment(config.dataset))
+    imu = DefaultIMU(imu_conf['accelerometer']['bias'], imu_conf['accelerometer']['noise'],
+                     imu_conf['gyroscope']['bias'], imu_conf['gyroscope']['noise'],
+                     simulation=simulation, trajectory=config.dataset.trajectory)
+    t0 = time.time()
+    if imu_conf['vectorized']:
+        generate_default_imu(imu, times)
+    else:
+        BasicIMUBehaviour(imu, 1. / sample_rate, initialTime=start)
+        simulation.time = start
+        simulation.run(times[-1])
+    return (time.time() - t0) / times.size
+
+def _resident_bytes():
+    "Peak resident size of this process so far, or None if not available"
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and in bytes on macOS
+    return maxrss if os.uname()[0] == 'Darwin' else 1024 * maxrss
+
+def _estimate_memory(result, config):
+    baseline = _resident_bytes()
+    if baseline is None:
+        return None
+    # The transformed trajectory has the same keyframes as the dataset trajectory
+    keyframes = len(config.dataset.trajectory.sampled.positionKeyFrames.timestamps)
+    trajectory_bytes = keyframes * 8 * 8 * 4 # Keyframes and spline coefficients
+    measurement_bytes = (result.landmarks_projected * OBSERVATION_BYTES +
+                         result.frames * FRAME_OVERHEAD_BYTES +
+                         result.landmarks_considered * VISIBILITY_ENTRY_BYTES)
+    imu_bytes = result.imu_samples * IMU_SAMPLE_BYTES
+    if config.imu_config['vectorized']:
+        # Ideal signals are kept while the sensor models are applied
+        imu_bytes *= 2
+    return baseline + trajectory_bytes + measurement_bytes + imu_bytes
+
+def _estimate_file_size(result, config):
+    "Results file size, calibrated by saving small results in the same format"
+    tmpdir = tempfile.mkdtemp(prefix='rsimusim_estimate_')
+    try:
+        sizes = []
+        for num_frames in (1, 11):
+            path = os.path.join(tmpdir, 'frames_{:d}.h5'.format(num_frames))
+            _dummy_results(config, num_frames).save(path)
+            sizes.append(os.path.getsize(path))
+    finally:
+        shutil.rmtree(tmpdir)
+    base, frame_bytes = sizes[0], (sizes[1] - sizes[0]) / 10
+    return int(base + max(result.frames - 1, 0) * frame_bytes +
+               result.landmarks_projected * OBSERVATION_BYTES + result.imu_samples * IMU_SAMPLE_BYTES)
+
+def _dummy_results(config, num_frames):
+    results = SimulationResults()
+    results.trajectory = config.dataset.trajectory
+    results.config_path = config.path
+    results.config_text = config.text
+    results.dataset_path = config.dataset_path
+    results.time_started = results.time_finished = datetime.datetime.now()
+    results.image_measurements = ImageMeasurements(num_frames)
+    for i in range(num_frames):
+        results.image_measurements.add(float(i), FrameObservations(np.empty(0, dtype='int64'), np.empty((0, 2))))
+    empty = MeasurementBuffer.wrap(np.empty(0), np.empty((3, 0)))
+    results.accelerometer_measurements = results.gyroscope_measurements = empty
+    return results
+
+def _format_optional(value, fmt):
+    if value is None:
+        return '-'
+    return fmt(value) if callable(fmt) else fmt.format(value)
+
+def _format_bytes(n):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(n) < 1024 or unit == 'GB':
+            return '{:.1f} {}'.format(n, unit)
+        n /= 1024
+
+def _format_duration(seconds):
+    if seconds is None:
+        return '-'
+    return str(datetime.timedelta(seconds=int(round(seconds))))
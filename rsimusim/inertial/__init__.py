@@ -1,2 +1,5 @@
 from .mpu9250 import MPU9250Gyroscope, MPU9250IMU
-from .default import DefaultIMU
\ No newline at end of file
+from .default import DefaultIMU
+from .vectorized import sample_times, ideal_imu_signals, default_imu_measurements, apply_default_imu, \
+    generate_default_imu
+from .streaming import stream_samples
@@ -14,26 +14,65 @@ from imusim.platforms.adcs import IdealADC
 from imusim.platforms.timers import IdealTimer
 from imusim.platforms.radios import IdealRadio
 
+from ..rng import GaussianNoise
+
 class TransformedAccelerometer(TransformedSensor, IdealAccelerometer):
     pass
 
 class TransformedGyroscope(TransformedSensor, IdealGyroscope):
     pass
 
+class StreamNoiseMixin(object):
+    """Noise drawn from a rsimusim.rng.GaussianNoise by sample index
+
+    sample_index is the index of the next sample and is increased once per sample.
+    """
+    def noiseVoltages(self, t):
+        v = self.noise.samples(self.sample_index, 1)
+        self.sample_index += 1
+        return v
+
+class StreamNoisyTransformedAccelerometer(StreamNoiseMixin, TransformedAccelerometer):
+    def __init__(self, platform, noise, transform, offset, **kwargs):
+        self.noise = noise
+        self.sample_index = 0
+        TransformedAccelerometer.__init__(self, platform, transform, offset, **kwargs)
+
+class StreamNoisyTransformedGyroscope(StreamNoiseMixin, TransformedGyroscope):
+    def __init__(self, platform, noise, transform, offset, **kwargs):
+        self.noise = noise
+        self.sample_index = 0
+        TransformedGyroscope.__init__(self, platform, transform, offset, **kwargs)
+
 class DefaultIMU(StandardIMU):
     def __init__(self, acc_bias, acc_noise, gyro_bias, gyro_noise,
-                 simulation=None, trajectory=None):
+                 simulation=None, trajectory=None, streams=None):
         identity = np.eye(3, dtype='double')
 
+        # Kept for the vectorized sample generation in rsimusim.inertial.vectorized
+        self.transform = identity
+        self.acc_bias = acc_bias
+        self.acc_noise = acc_noise
+        self.gyro_bias = gyro_bias
+        self.gyro_noise = gyro_noise
+        self.streams = streams
+
         # To handle the noise free case we need to choose different sensor subclasses
         # (Otherwise the call that creates random data raises an Exception due to zero scale)
+        # With random streams, the noise of each sample is given by the seed and sample index.
         if isinstance(acc_noise, Number) and acc_noise <= 0:
             self.accelerometer = TransformedAccelerometer(self, identity, acc_bias)
+        elif streams is not None:
+            noise = GaussianNoise(streams, 'accelerometer', acc_noise)
+            self.accelerometer = StreamNoisyTransformedAccelerometer(self, noise, identity, acc_bias)
         else:
             self.accelerometer = NoisyTransformedAccelerometer(self, acc_noise, identity, acc_bias)
 
         if isinstance(gyro_noise, Number) and gyro_noise <= 0:
             self.gyroscope = TransformedGyroscope(self, identity, gyro_bias)
+        elif streams is not None:
+            noise = GaussianNoise(streams, 'gyroscope', gyro_noise)
+            self.gyroscope = StreamNoisyTransformedGyroscope(self, noise, identity, gyro_bias)
         else:
             self.gyroscope = NoisyTransformedGyroscope(self, gyro_noise, identity, gyro_bias)
 
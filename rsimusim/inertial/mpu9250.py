@@ -5,55 +5,101 @@ import numpy as np
 from imusim.platforms.gyroscopes import IdealGyroscope
 from imusim.platforms.imus import IdealIMU, StandardIMU
 
+from ..rng import RandomStreams
+
 class MarkovProc(object):
     @classmethod
-    def from_ar1(cls, Ts, phi, sigma2):
+    def from_ar1(cls, Ts, phi, sigma2, rng=None):
         tau = Ts / (1 - phi)
         sigma_w = np.sqrt(sigma2) / Ts
-        instance = cls(tau, sigma_w)
+        instance = cls(tau, sigma_w, rng=rng)
         return instance
         
-    def __init__(self, tau, sigma_w, initial_time=0):
+    def __init__(self, tau, sigma_w, initial_time=0, rng=None):
         self._t = initial_time
         self.tau = tau
         self.sigma_w = sigma_w
         self._prev = 0
+        self.rng = np.random if rng is None else rng
 
     def __call__(self, t):
         dt = t - self._t
         b = self._prev
-        w = np.random.normal(scale=self.sigma_w)
+        w = self.rng.normal(scale=self.sigma_w)
         new_b = (1 - dt / self.tau) * b + dt * w
         self._prev = new_b
         self._t = t
         return new_b
 
+    def block(self, times):
+        """Process values for an array of increasing sample times
+
+        Equivalent to calling the process once per sample time.
+        For uniformly sampled times the recursion is computed as a first order IIR filter
+        over a block of pre-drawn noise.
+        """
+        if not len(times):
+            return np.empty(0)
+        dt = np.diff(np.hstack((self._t, times)))
+        w = self.rng.normal(scale=self.sigma_w, size=len(times))
+        if np.allclose(dt, dt[0], rtol=1e-6, atol=0):
+            a = 1 - dt[0] / self.tau
+            from scipy.signal import lfilter
+            b, _ = lfilter([dt[0]], [1, -a], w, zi=[a * self._prev])
+        else:
+            b = np.empty_like(w)
+            prev = self._prev
+            for i in range(len(times)):
+                prev = (1 - dt[i] / self.tau) * prev + dt[i] * w[i]
+                b[i] = prev
+        self._prev = b[-1]
+        self._t = times[-1]
+        return b
+
 class RWModel(object):
-    def __init__(self, sigma2, initial_t=0):
+    def __init__(self, sigma2, initial_t=0, rng=None):
         self.sigma = np.sqrt(sigma2)
         self._prev = 0
+        self.rng = np.random if rng is None else rng
 
     def __call__(self, t):
-        self._prev += np.random.normal(scale=self.sigma)
+        self._prev += self.rng.normal(scale=self.sigma)
         return self._prev
+
+    def block(self, times):
+        b = self._prev + np.cumsum(self.rng.normal(scale=self.sigma, size=len(times)))
+        if len(times):
+            self._prev = b[-1]
+        return b
         
 class WNModel(object):
-    def __init__(self, sigma2):
+    def __init__(self, sigma2, rng=None):
         self.sigma = np.sqrt(sigma2)
+        self.rng = np.random if rng is None else rng
     
     def __call__(self, t):
-        return np.random.normal(scale=self.sigma)
+        return self.rng.normal(scale=self.sigma)
+
+    def block(self, times):
+        return self.rng.normal(scale=self.sigma, size=len(times))
 
 class MPU9250Gyroscope(IdealGyroscope):
     def __init__(self, platform, noiseStdDev, rng=None, **kwargs):
         if rng is None:
             rng = np.random.RandomState()
+
+        # With random streams every process of every axis gets an independent stream
+        def component_rng(axis, component):
+            if isinstance(rng, RandomStreams):
+                return rng.stream('mpu9250_gyroscope', axis, component)
+            return rng
+
         Ts = 1. / 1000 # Sample time
         self._bias_components = [[
-            MarkovProc.from_ar1(Ts, 9.999049e-01, 8.030220e-10),
-            MarkovProc.from_ar1(Ts, 6.211672e-01, 4.546056e-03),
-            RWModel(1.174606e-11),
-            WNModel(5.876599e-06)
+            MarkovProc.from_ar1(Ts, 9.999049e-01, 8.030220e-10, rng=component_rng(i, 0)),
+            MarkovProc.from_ar1(Ts, 6.211672e-01, 4.546056e-03, rng=component_rng(i, 1)),
+            RWModel(1.174606e-11, rng=component_rng(i, 2)),
+            WNModel(5.876599e-06, rng=component_rng(i, 3))
         ] for i in range(3)]
 
         # rad / s -> voltage scale factor
@@ -65,10 +111,19 @@ class MPU9250Gyroscope(IdealGyroscope):
     def noiseVoltages(self, t):
         br = np.array([sum(comp(t) for comp in axis_comp) for axis_comp in self._bias_components]).reshape(3,1)
         return self._voltage_scale * br
-        
+
+    def block_noise_voltages(self, times):
+        """Noise voltages for an array of increasing sample times as a (3, N) array
+
+        Draws whole blocks from each bias and noise process instead of one sample at a time.
+        Process states carry over between calls, also when mixed with noiseVoltages().
+        """
+        br = np.vstack([sum(comp.block(times) for comp in axis_comp) for axis_comp in self._bias_components])
+        return self._voltage_scale * br
+
 class MPU9250IMU(IdealIMU):
-    def __init__(self, simulation=None, trajectory=None):
+    def __init__(self, simulation=None, trajectory=None, rng=None):
         # FIXME: Ugly loading two initalizers
         IdealIMU.__init__(self, simulation, trajectory)
-        self.gyroscope = MPU9250Gyroscope(self, 0)
+        self.gyroscope = MPU9250Gyroscope(self, 0, rng=rng)
         StandardIMU.__init__(self, simulation, trajectory)
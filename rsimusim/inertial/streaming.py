@@ -0,0 +1,70 @@
+from __future__ import print_function, division
+
+import os
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("rsimusim.inertial.streaming")
+
+DEFAULT_BLOCK_SIZE = 2**20
+
+def stream_samples(sample_block, path, num_samples, sample_rate, start_time=0.0,
+                   block_size=DEFAULT_BLOCK_SIZE, dataset='data', progress=False):
+    """Generate IMU samples block by block and write them directly to file
+
+    Only one block of samples is kept in memory at a time, which makes it possible to
+    generate very long sequences, e.g. for Allan variance studies.
+
+    Parameters
+    ----------------
+    sample_block : callable
+        Called as sample_block(times) for consecutive blocks of sample times
+        and must return a (3, len(times)) array.
+    path : str
+        Output file. Files ending in .npy are written as a memory mapped (3, N) array.
+        Otherwise a chunked HDF5 file is written with the (3, N) samples in `dataset`,
+        and the start time and sample rate as attributes.
+    num_samples : int
+        Total number of samples
+    sample_rate : float
+        Sample rate in Hz. The first sample is taken one period after start_time.
+    progress : bool
+        Log progress after every block
+
+    Returns
+    ----------------
+    path : str
+    """
+    dt = 1. / sample_rate
+    _, ext = os.path.splitext(path)
+    if ext == '.npy':
+        h5f = None
+        out = np.lib.format.open_memmap(path, mode='w+', dtype='double', shape=(3, num_samples))
+    else:
+        import h5py
+        h5f = h5py.File(path, 'w')
+        out = h5f.create_dataset(dataset, shape=(3, num_samples), dtype='double',
+                                 chunks=(3, max(1, min(block_size, num_samples))))
+        out.attrs['start_time'] = start_time
+        out.attrs['sample_rate'] = sample_rate
+
+    try:
+        t0 = time.time()
+        for first in range(0, num_samples, block_size):
+            last = min(first + block_size, num_samples)
+            times = start_time + dt * np.arange(first + 1, last + 1)
+            out[:, first:last] = sample_block(times)
+            if progress:
+                elapsed = time.time() - t0
+                logger.info("Generated %d/%d samples (%.1f%%) in %.1f seconds",
+                            last, num_samples, 100. * last / num_samples, elapsed)
+    finally:
+        if h5f is None:
+            out.flush()
+            del out
+        else:
+            h5f.close()
+
+    return path
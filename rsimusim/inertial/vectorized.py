@@ -0,0 +1,105 @@
+from __future__ import print_function, division
+
+from numbers import Number
+
+import numpy as np
+
+from imusim.environment.base import Environment
+
+from ..buffers import MeasurementBuffer
+from ..rng import GaussianNoise
+
+def sample_times(start_time, end_time, sample_rate):
+    """Sample times of an IMU sampled periodically from start_time
+
+    Matches BasicIMUBehaviour, which takes its first sample one period after start_time.
+    """
+    dt = 1. / sample_rate
+    num_samples = int(np.floor((end_time - start_time) / dt + 1e-9))
+    return start_time + dt * np.arange(1, num_samples + 1)
+
+def ideal_imu_signals(trajectory, times, environment=None, evaluator=None):
+    """Ideal specific force and angular rate for an array of times
+
+    Both are expressed in the body frame of the trajectory, as measured by
+    imusim's ideal accelerometer and gyroscope without sensor offsets.
+    If evaluator is a rsimusim.trajectory.TrajectoryEvaluator, the trajectory is
+    evaluated by its refitted splines instead, which approximates the imusim trajectory.
+
+    Returns
+    ----------------
+    specific_force : (3, N) array
+    angular_rate : (3, N) array
+    """
+    if environment is None:
+        environment = Environment()
+    if evaluator is not None:
+        values = evaluator.evaluate(times)
+        gravity = environment.gravitationalField(values['position'], times)
+        # Rotate into the body frame with the transposed body to world rotations
+        specific_force = np.einsum('nji,jn->in', values['rotation'], values['acceleration'] - gravity)
+        angular_rate = np.einsum('nji,jn->in', values['rotation'], values['rotational_velocity'])
+        return specific_force, angular_rate
+    rotations = trajectory.rotation(times)
+    gravity = environment.gravitationalField(trajectory.position(times), times)
+    specific_force = rotations.rotateFrame(trajectory.acceleration(times) - gravity)
+    angular_rate = rotations.rotateFrame(trajectory.rotationalVelocity(times))
+    return specific_force, angular_rate
+
+def _sensor_model(sensor, name, true_values, transform, bias, noise, first_sample, streams):
+    values = np.dot(transform, true_values) + bias
+    # Zero noise is handled by the noise free sensor classes in DefaultIMU
+    if isinstance(noise, Number) and noise <= 0:
+        pass
+    elif streams is not None:
+        values += GaussianNoise(streams, name, noise).samples(first_sample, values.shape[1])
+    elif hasattr(sensor, 'sample_index'):
+        # Seeded random streams give the same noise as the event loop for each sample index
+        values += sensor.noise.samples(first_sample, values.shape[1])
+        sensor.sample_index = first_sample + values.shape[1]
+    else:
+        values += np.random.normal(scale=noise, size=values.shape)
+    return values
+
+def default_imu_measurements(imu, specific_force, angular_rate, first_sample=0, streams=None):
+    """Measurements of the DefaultIMU sensor models for precomputed ideal signals
+
+    If the IMU uses random streams, first_sample is the sample index of the first sample.
+    Passing streams draws the noise from those streams instead of the IMU's own noise source,
+    which gives a new noise realization for the same ideal signals, and leaves the IMU unchanged.
+
+    Returns
+    ----------------
+    accelerometer : (3, N) array
+    gyroscope : (3, N) array
+    """
+    acc = _sensor_model(imu.accelerometer, 'accelerometer', specific_force, imu.transform,
+                        imu.acc_bias, imu.acc_noise, first_sample, streams)
+    gyro = _sensor_model(imu.gyroscope, 'gyroscope', angular_rate, imu.transform,
+                         imu.gyro_bias, imu.gyro_noise, first_sample, streams)
+    return acc, gyro
+
+def apply_default_imu(imu, times, specific_force, angular_rate, first_sample=0, streams=None):
+    """Apply the DefaultIMU sensor models to precomputed ideal signals
+
+    The results replace the rawMeasurements of the accelerometer and gyroscope.
+    See default_imu_measurements() for first_sample and streams.
+    """
+    acc, gyro = default_imu_measurements(imu, specific_force, angular_rate, first_sample, streams)
+    imu.accelerometer.rawMeasurements = MeasurementBuffer.wrap(times, acc)
+    imu.gyroscope.rawMeasurements = MeasurementBuffer.wrap(times, gyro)
+    return imu.accelerometer.rawMeasurements, imu.gyroscope.rawMeasurements
+
+def generate_default_imu(imu, times, environment=None, first_sample=0):
+    """Generate DefaultIMU measurements without the imusim event loop
+
+    The trajectory is evaluated once for all sample times, after which the
+    sensor transform, bias and noise are applied in bulk.
+    The results replace the rawMeasurements of the accelerometer and gyroscope.
+
+    If the IMU uses random streams, first_sample is the sample index of times[0].
+    """
+    if environment is None and imu.simulation is not None:
+        environment = imu.simulation.environment
+    specific_force, angular_rate = ideal_imu_signals(imu.trajectory, times, environment)
+    return apply_default_imu(imu, times, specific_force, angular_rate, first_sample)
@@ -1,18 +1,58 @@
 from __future__ import print_function, division
 
 import os
+import shutil
+import hashlib
 import logging
+import tempfile
 
 import numpy as np
 from crisp import GyroStream
 import crisp.rotations
 
+logger = logging.getLogger("rsimusim.misc")
+
+# Calibrated streams are cached in this per user directory by default, see CalibratedGyroStream.from_directory()
+GYRO_CACHE_DIR = os.environ.get('RSIMUSIM_GYRO_CACHE', os.path.join(
+    os.environ.get('XDG_CACHE_HOME', None) or os.path.join(os.path.expanduser('~'), '.cache'), 'rsimusim', 'gyro'))
+GYRO_CACHE_VERSION = 1
+_GYRO_CACHE_ARRAYS = ('data', 'timestamps', 'orientations')
+
 class CalibratedGyroStream(GyroStream):
     @classmethod
-    def from_directory(cls, directory, sequence_name):
+    def from_directory(cls, directory, sequence_name, cache_dir=GYRO_CACHE_DIR):
+        """Load, calibrate and integrate <sequence_name>_gyro.csv using <sequence_name>_reference.csv
+
+        The calibrated data, timestamps and orientations are cached as .npy files in cache_dir,
+        keyed by a hash of the contents of both files, the reference parameters and the
+        post processing. Entries of the same sequence with another key are removed when a new
+        entry is written. The default cache_dir is $RSIMUSIM_GYRO_CACHE if set, and otherwise
+        rsimusim/gyro in $XDG_CACHE_HOME or ~/.cache, which is created with mode 0700.
+        Set cache_dir to None to disable the cache.
+
+        Streams loaded from the cache are read-only memory maps, so data, timestamps and
+        orientations must be copied before they are modified in place.
+        """
         data_path = os.path.join(directory, sequence_name + '_gyro.csv')
         param_path = os.path.join(directory, sequence_name + '_reference.csv')
         params = cls.load_params(param_path)
+        if cache_dir is None:
+            return cls._from_files(data_path, params, sequence_name)
+
+        key = cls._cache_key(data_path, param_path, params, sequence_name)
+        entry = os.path.join(cache_dir, '{}_{}'.format(sequence_name, key))
+        if os.path.isdir(entry):
+            logger.debug("Loading calibrated gyro stream from %s", entry)
+            return cls._from_cache(entry, params)
+        instance = cls._from_files(data_path, params, sequence_name)
+        try:
+            cls._write_cache(instance, cache_dir, entry, sequence_name)
+        except (IOError, OSError) as e:
+            logger.warning("Failed to cache calibrated gyro stream: %s", e)
+        return instance
+
+    @classmethod
+    def _from_files(cls, data_path, params, sequence_name):
         instance = cls.from_csv(data_path)
         instance.params = params
         data = instance.data
@@ -34,6 +74,55 @@ class CalibratedGyroStream(GyroStream):
         instance.integrate(dt)
         return instance
 
+    @staticmethod
+    def _cache_key(data_path, param_path, params, sequence_name):
+        h = hashlib.sha1()
+        for path in (data_path, param_path):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(2**20), b''):
+                    h.update(block)
+        post_processed = sequence_name in ('rccar', 'walk', 'rotation')
+        h.update(repr((GYRO_CACHE_VERSION, sorted(params.items()), post_processed)).encode('utf8'))
+        return h.hexdigest()
+
+    @classmethod
+    def _from_cache(cls, entry, params):
+        instance = cls()
+        instance.params = params
+        arrays = {name: np.load(os.path.join(entry, name + '.npy'), mmap_mode='r') for name in _GYRO_CACHE_ARRAYS}
+        instance.data = arrays['data']
+        instance.timestamps = arrays['timestamps']
+        instance._GyroStream__last_q = arrays['orientations']
+        instance._GyroStream__last_dt = 1. / params['gyro_rate']
+        return instance
+
+    @staticmethod
+    def _write_cache(instance, cache_dir, entry, sequence_name):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        # Written to a temporary directory first, such that readers never see a partial entry
+        tmp_entry = tempfile.mkdtemp(prefix='.tmp_', dir=cache_dir)
+        try:
+            arrays = {'data': instance.data, 'timestamps': instance.timestamps,
+                      'orientations': instance.orientations}
+            for name in _GYRO_CACHE_ARRAYS:
+                np.save(os.path.join(tmp_entry, name + '.npy'), np.ascontiguousarray(arrays[name]))
+            os.rename(tmp_entry, entry)
+        except:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            raise
+        logger.debug("Cached calibrated gyro stream in %s", entry)
+
+        # Invalidate entries of the same sequence with other sources or parameters
+        prefix = sequence_name + '_'
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            key = name[len(prefix):]
+            if (name.startswith(prefix) and path != entry and len(key) == 40
+                    and all(c in '0123456789abcdef' for c in key)):
+                logger.debug("Removing stale gyro cache entry %s", path)
+                shutil.rmtree(path, ignore_errors=True)
+
     @staticmethod
     def load_params(filepath):
         _, ext = os.path.splitext(filepath)
@@ -46,23 +135,75 @@ class CalibratedGyroStream(GyroStream):
         return data
 
     def orientation_at(self, t):
+        "Orientation (4,) at time t, see orientations_at()"
+        q = self.orientations_at(np.array([t]))[0]
+        if np.isnan(q[0]):
+            if len(self.timestamps) == 0:
+                raise ValueError("Time {:.6f} is outside the empty gyro stream".format(t))
+            raise ValueError("Time {:.6f} is outside the gyro stream [{:.6f}, {:.6f}]".format(
+                t, self.timestamps[0], self.timestamps[-1]))
+        return q
+
+    def orientations_at(self, times):
+        """Orientations at an array of times
+
+        The integrated orientations are interpolated with slerp between the bracketing samples,
+        which are found by binary search.
+
+        Returns
+        ----------------
+        orientations : (N, 4) array
+            Unit quaternions, NaN for times outside the stream
+        """
         q = self._GyroStream__last_q
         if q is None:
             raise RuntimeError('Must integrate the stream before extracting orientation')
-        n = np.flatnonzero(self.timestamps > t)[0]
-        t1 = self.timestamps[n - 1]
-        t2 = self.timestamps[n]
-        q1 = q[n - 1]
-        q2 = q[n]
-        tau = (t - t1) / (t2 - t1)
-        assert 0 <= tau <= 1
-        if np.isclose(tau, 0.0):
-            return q1
-        elif np.isclose(tau, 1.0):
-            return q2
-        else:
-            return crisp.rotations.slerp(q1, q2, tau)
+        times = np.asarray(times, dtype='double').ravel()
+        timestamps = self.timestamps
+        if len(timestamps) < 2:
+            # No intervals to interpolate in, only the time of a single sample is inside the stream
+            result = np.full((times.size, 4), np.nan)
+            if len(timestamps) == 1:
+                result[times == timestamps[0]] = q[0]
+            return result
+        # Index of the first sample after t, with the last sample as the end of the last interval
+        n = np.clip(np.searchsorted(timestamps, times, side='right'), 1, len(timestamps) - 1)
+        t1 = timestamps[n - 1]
+        t2 = timestamps[n]
+        tau = (times - t1) / (t2 - t1)
+        result = slerp_array(q[n - 1], q[n], tau)
+        outside = (times < timestamps[0]) | (times > timestamps[-1]) | np.isnan(times)
+        result[outside] = np.nan
+        return result
 
     @property
     def orientations(self):
-        return self._GyroStream__last_q
\ No newline at end of file
+        return self._GyroStream__last_q
+
+def slerp_array(q1, q2, tau):
+    """Spherical linear interpolation of (N, 4) quaternion arrays
+
+    Vectorized version of crisp.rotations.slerp, interpolating along the shortest path,
+    and returning the end points as is for tau close to 0 or 1.
+    """
+    q1 = np.asarray(q1, dtype='double')
+    q2 = np.array(q2, dtype='double')
+    tau = np.asarray(tau, dtype='double')
+    costheta = np.sum(q1 * q2, axis=1)
+    flip = costheta < 0
+    costheta[flip] = -costheta[flip]
+    q2_short = np.where(flip[:, np.newaxis], -q2, q2)
+    theta = np.arccos(np.clip(costheta, -1.0, 1.0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sin_theta = np.sin(theta)
+        f1 = np.sin((1.0 - tau) * theta) / sin_theta
+        f2 = np.sin(tau * theta) / sin_theta
+        q = f1[:, np.newaxis] * q1 + f2[:, np.newaxis] * q2_short
+        q /= np.sqrt(np.sum(q ** 2, axis=1))[:, np.newaxis]
+    same = np.isclose(costheta, 1.0)
+    q[same] = q1[same]
+    at_start = np.isclose(tau, 0.0)
+    q[at_start] = q1[at_start]
+    at_end = np.isclose(tau, 1.0)
+    q[at_end] = q2[at_end]
+    return q
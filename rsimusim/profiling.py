@@ -0,0 +1,122 @@
+from __future__ import print_function, division
+
+import io
+import time
+import pstats
+import cProfile
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger("rsimusim.profiling")
+
+class Profiler(object):
+    """Phase timers and counters for a simulation run
+
+    Code is instrumented with the module level phase() and count() functions, which
+    record to the active profiler, see activate(). When no profiler is active they do nothing.
+    Phases may be nested, in which case the time of the inner phase is also included
+    in the outer phase.
+
+    Parameters
+    ----------------
+    capture : bool
+        Also run cProfile while the profiler is active, and keep the function statistics
+    """
+    def __init__(self, capture=False):
+        self.phases = OrderedDict() # name -> [seconds, calls]
+        self.counters = OrderedDict()
+        self.capture = capture
+        self.function_stats = None
+        self._cprofile = None
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, [0.0, 0])
+            entry[0] += time.time() - t0
+            entry[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def start_capture(self):
+        if self.capture and self._cprofile is None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop_capture(self, num_functions=40):
+        if self._cprofile is None:
+            return
+        self._cprofile.disable()
+        out = io.StringIO() if str is not bytes else io.BytesIO()
+        stats = pstats.Stats(self._cprofile, stream=out)
+        stats.sort_stats('cumulative').print_stats(num_functions)
+        self.function_stats = out.getvalue()
+        self._cprofile = None
+
+    def as_dict(self):
+        return {'phases': {name: {'seconds': seconds, 'calls': calls}
+                           for name, (seconds, calls) in self.phases.items()},
+                'counters': dict(self.counters),
+                'function_stats': self.function_stats}
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        for name, entry in sorted(d['phases'].items()):
+            instance.phases[name] = [entry['seconds'], entry['calls']]
+        for name in sorted(d['counters']):
+            instance.counters[name] = d['counters'][name]
+        instance.function_stats = d.get('function_stats', None)
+        return instance
+
+    def summary(self):
+        "Human readable report of phases and counters"
+        lines = ['{:<24s} {:>12s} {:>10s}'.format('Phase', 'Seconds', 'Calls')]
+        for name, (seconds, calls) in sorted(self.phases.items(), key=lambda item: -item[1][0]):
+            lines.append('{:<24s} {:>12.3f} {:>10d}'.format(name, seconds, calls))
+        lines.append('')
+        lines.append('{:<24s} {:>12s}'.format('Counter', 'Value'))
+        for name, value in sorted(self.counters.items()):
+            lines.append('{:<24s} {:>12d}'.format(name, int(value)))
+        return '\n'.join(lines)
+
+class _NullProfiler(object):
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def count(self, name, n=1):
+        pass
+
+_null_profiler = _NullProfiler()
+_active = _null_profiler
+
+def active_profiler():
+    "The active Profiler, or None"
+    return None if _active is _null_profiler else _active
+
+@contextmanager
+def activate(profiler):
+    "Record phases and counters to profiler within the context"
+    global _active
+    previous = _active
+    _active = profiler
+    profiler.start_capture()
+    try:
+        yield profiler
+    finally:
+        profiler.stop_capture()
+        _active = previous
+
+def phase(name):
+    "Context manager timing a phase of the active profiler"
+    return _active.phase(name)
+
+def count(name, n=1):
+    "Increment a counter of the active profiler"
+    _active.count(name, n)
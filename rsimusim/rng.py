@@ -0,0 +1,99 @@
+from __future__ import print_function, division
+
+import zlib
+
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 2**16
+
+def _key_to_int(key):
+    if isinstance(key, (int, np.integer)):
+        return int(key)
+    # Built-in hash() of strings is randomized between interpreter runs
+    return zlib.crc32(str(key).encode('utf8')) & 0xffffffff
+
+class RandomStreams(object):
+    """Independent, counter based random streams derived from a single seed
+
+    A stream is identified by a key such as (sensor name, axis). Each stream is split into
+    blocks of block_size samples, and every block is generated by its own Philox generator
+    seeded from (seed, key, block index). Sample n of a stream is thus the same regardless
+    of how the samples are requested, which makes chunked or multi-process simulations
+    reproduce serial runs exactly.
+    """
+    def __init__(self, seed, block_size=DEFAULT_BLOCK_SIZE):
+        self.seed = seed
+        self.block_size = block_size
+        self._cache = {}
+
+    def generator(self, key, block):
+        "Generator for one block of a stream"
+        spawn_key = tuple(_key_to_int(k) for k in key) + (block,)
+        seq = np.random.SeedSequence(self.seed, spawn_key=spawn_key)
+        return np.random.Generator(np.random.Philox(seq))
+
+    def _block(self, key, block):
+        cached_block, values = self._cache.get(key, (None, None))
+        if cached_block != block:
+            values = self.generator(key, block).standard_normal(self.block_size)
+            self._cache[key] = (block, values)
+        return values
+
+    def standard_normal(self, key, start, stop):
+        "Samples start to stop (exclusive) of a standard normal stream"
+        if stop <= start:
+            return np.empty(0)
+        B = self.block_size
+        first_block = start // B
+        last_block = (stop - 1) // B
+        if first_block == last_block:
+            return self._block(key, first_block)[start - first_block * B:stop - first_block * B].copy()
+        values = np.hstack([self._block(key, block) for block in range(first_block, last_block + 1)])
+        return values[start - first_block * B:stop - first_block * B]
+
+    def stream(self, *key):
+        return Stream(self, key)
+
+    def __getstate__(self):
+        # Blocks are cheap to regenerate, so do not pickle the cache
+        return {'seed': self.seed, 'block_size': self.block_size, '_cache': {}}
+
+class Stream(object):
+    """Sequential view of a single random stream
+
+    Provides the normal() method of numpy.random.RandomState such that it can replace
+    the random state used by the noise models.
+    """
+    def __init__(self, streams, key):
+        self.streams = streams
+        self.key = key
+        self.position = 0
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        n = 1 if size is None else int(np.prod(size))
+        x = self.streams.standard_normal(self.key, self.position, self.position + n)
+        self.position += n
+        if size is None:
+            return loc + scale * x[0]
+        return loc + scale * x.reshape(size)
+
+class GaussianNoise(object):
+    """Per-axis Gaussian sensor noise indexed by sample number
+
+    Parameters
+    ----------------
+    streams : RandomStreams
+    name : str
+        Unique name of the sensor
+    scale : float or (3,1) array
+        Noise standard deviation
+    """
+    def __init__(self, streams, name, scale):
+        self.streams = streams
+        self.name = name
+        self.scale = scale
+
+    def samples(self, start, count):
+        "Noise for samples start to start + count as a (3, count) array"
+        x = np.vstack([self.streams.standard_normal((self.name, axis), start, start + count) for axis in range(3)])
+        return self.scale * x
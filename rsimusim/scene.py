@@ -4,10 +4,18 @@ from imusim.environment.base import Environment
 
 
 class SceneEnvironment(Environment):
-    def __init__(self, dataset, **kwargs):
+    def __init__(self, dataset, visibility_cache=None, **kwargs):
         self.scene = dataset
+        # Optional dict of time -> visible landmarks, shared between simulations of the same dataset
+        self.visibility_cache = visibility_cache
         super(SceneEnvironment, self).__init__(**kwargs)
 
     def observe(self, t, position, orientation):
-        landmarks = self.scene.visible_landmarks(t)
-        return landmarks
\ No newline at end of file
+        if self.visibility_cache is None:
+            return self.scene.visible_landmarks(t)
+        try:
+            landmarks = self.visibility_cache[t]
+        except KeyError:
+            landmarks = self.scene.visible_landmarks(t)
+            self.visibility_cache[t] = landmarks
+        return landmarks
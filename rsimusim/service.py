@@ -0,0 +1,334 @@
+from __future__ import print_function, division
+
+import os
+import stat
+import time
+import errno
+import socket
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing.connection import Listener, Client
+
+import yaml
+
+from .simulation import RollingShutterImuSimulation, SimulationConfiguration
+from .cache import StageCache, dataset_key
+
+logger = logging.getLogger("rsimusim.service")
+
+SOCKET_NAME = 'rsimusim.sock'
+AUTHKEY_NAME = 'authkey'
+AUTHKEY_BYTES = 32
+
+def runtime_dir():
+    """Private directory of the current user for the service socket and key
+
+    This is $XDG_RUNTIME_DIR/rsimusim if XDG_RUNTIME_DIR is set, and ~/.rsimusim otherwise.
+    The directory is created with mode 0700, and an existing directory must be owned by the
+    user and not be accessible by others.
+    """
+    base = os.environ.get('XDG_RUNTIME_DIR', None)
+    path = os.path.join(base, 'rsimusim') if base else os.path.join(os.path.expanduser('~'), '.rsimusim')
+    try:
+        os.makedirs(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise RuntimeError("{} must be owned by the current user and have mode 0700".format(path))
+    return path
+
+def default_address():
+    "Unix socket in the runtime_dir()"
+    return os.path.join(runtime_dir(), SOCKET_NAME)
+
+def load_authkey(path=None):
+    """Authentication key shared by the service and its clients
+
+    The key is read from path, by default the authkey file in runtime_dir(). If the file
+    does not exist, it is created with a random key and mode 0600.
+    """
+    if path is None:
+        path = os.path.join(runtime_dir(), AUTHKEY_NAME)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    else:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(AUTHKEY_BYTES))
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise RuntimeError("{} must be owned by the current user and have mode 0600".format(path))
+    with open(path, 'rb') as f:
+        key = f.read()
+    if len(key) < AUTHKEY_BYTES:
+        raise RuntimeError("{} does not contain a valid key".format(path))
+    return key
+
+def _is_loopback(host):
+    if host == 'localhost':
+        return True
+    parts = host.split('.')
+    return len(parts) == 4 and parts[0] == '127' and all(part.isdigit() for part in parts)
+
+def parse_address(address):
+    """Address given as host:port, or the path of a Unix socket
+
+    Messages are pickled, so only loopback hosts are accepted, and ValueError is raised for others.
+    """
+    if not isinstance(address, tuple):
+        host, sep, port = address.rpartition(':')
+        if not (sep and port.isdigit()):
+            return address
+        address = (host or 'localhost', int(port))
+    if not _is_loopback(address[0]):
+        raise ValueError("The service only listens on loopback addresses, not {}".format(address[0]))
+    return tuple(address)
+
+class LRUDict(OrderedDict):
+    "Dict which drops the least recently used entries when it holds more than max_entries"
+    def __init__(self, max_entries):
+        OrderedDict.__init__(self)
+        self.max_entries = max_entries
+
+    def __getitem__(self, key):
+        value = OrderedDict.__getitem__(self, key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        OrderedDict.__setitem__(self, key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_entries:
+            self.popitem(last=False)
+
+def _run_job_process(sim, out, include_tracks, conn):
+    try:
+        # Jobs already run in parallel, so project landmarks serially
+        sim.camera.camera.use_multiproc = False
+        result = sim.run()
+        result.save(out, include_tracks=include_tracks)
+        conn.send(None)
+    except Exception as e:
+        conn.send('{}: {}'.format(e.__class__.__name__, e))
+    finally:
+        conn.close()
+
+class SimulationService(object):
+    """Long running simulation service with datasets kept in memory
+
+    The service listens on a Unix socket, or a localhost TCP port, for simulation jobs.
+    Jobs are pickled, and clients must authenticate with the key from load_authkey(),
+    which only the current user can read.
+    Recently used datasets are kept in an LRU cache, and the transformed trajectories
+    and other noise free stages in a StageCache, so repeated jobs on the same dataset
+    skip loading and spline fitting. Each job is set up in the service process and is then
+    simulated in a forked worker process, which writes the results file.
+    At most `processes` jobs are simulated at the same time.
+    The workers are forked, so the service raises RuntimeError on platforms without
+    the fork start method.
+
+    Parameters
+    ----------------
+    address : str or (host, port)
+        Unix socket path, or "host:port" with a loopback host. Defaults to default_address()
+    processes : int
+        Maximum number of concurrent jobs, defaults to the number of CPUs
+    max_datasets : int
+        Number of datasets to keep in memory
+    max_stages : int
+        Number of cached stages, see StageCache
+    authkey : bytes
+        Authentication key, defaults to load_authkey()
+    """
+    def __init__(self, address=None, processes=None, max_datasets=4, max_stages=64, authkey=None):
+        self.address = parse_address(default_address() if address is None else address)
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.authkey = load_authkey() if authkey is None else authkey
+        try:
+            # The simulation is forked with the cached datasets instead of pickling them
+            self._context = multiprocessing.get_context('fork')
+        except ValueError:
+            raise RuntimeError("The simulation service requires the fork start method")
+        self.datasets = LRUDict(max_datasets)
+        self.cache = StageCache(max_entries=max_stages)
+        self.jobs = OrderedDict() # job id -> status
+        self._dataset_stamps = {}
+        self._setup_lock = threading.Lock()
+        self._jobs_lock = threading.Lock()
+        self._slots = threading.Semaphore(self.processes)
+        self._stopping = threading.Event()
+        self._next_job = 0
+        self._listener = None
+
+    def serve_forever(self):
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            self._remove_stale_socket()
+        self._listener = Listener(self.address, authkey=self.authkey)
+        logger.info("Listening on %s with %d job slots", self.address, self.processes)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    conn = self._listener.accept()
+                except (socket.error, EOFError, multiprocessing.AuthenticationError) as e:
+                    logger.warning("Rejected connection: %s", e)
+                    continue
+                if self._stopping.is_set():
+                    conn.close()
+                    break
+                thread = threading.Thread(target=self._handle, args=(conn,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            self._listener.close()
+            logger.info("Service stopped")
+
+    def _remove_stale_socket(self):
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except (socket.error, EOFError):
+            logger.info("Removing stale socket %s", self.address)
+            os.unlink(self.address)
+        else:
+            raise RuntimeError("A service is already listening on {}".format(self.address))
+
+    def shutdown(self):
+        self._stopping.set()
+        # Wake up the listener
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except (socket.error, EOFError):
+            pass
+
+    def status(self):
+        with self._jobs_lock:
+            jobs = dict(self.jobs)
+        return {'status': 'ok',
+                'datasets': list(self.datasets.keys()),
+                'cache_hits': self.cache.hits,
+                'cache_misses': self.cache.misses,
+                'jobs': jobs}
+
+    def _handle(self, conn):
+        try:
+            request = conn.recv()
+            op = request.get('op', None)
+            if op == 'run':
+                self._run_job(conn, request)
+            elif op == 'status':
+                conn.send(self.status())
+            elif op == 'shutdown':
+                conn.send({'status': 'ok'})
+                self.shutdown()
+            else:
+                conn.send({'status': 'error', 'error': "Unknown operation: {}".format(op)})
+        except EOFError:
+            logger.warning("Client disconnected")
+        finally:
+            conn.close()
+
+    def _set_job_status(self, job, status):
+        with self._jobs_lock:
+            self.jobs[job] = status
+
+    def _run_job(self, conn, request):
+        with self._jobs_lock:
+            job = self._next_job
+            self._next_job += 1
+        self._set_job_status(job, 'queued')
+        conn.send({'status': 'queued', 'job': job})
+        t0 = time.time()
+        try:
+            with self._slots:
+                with self._setup_lock:
+                    sim = self._setup(request)
+                self._set_job_status(job, 'running')
+                conn.send({'status': 'running', 'job': job})
+                error = self._simulate(sim, request['out'], request.get('include_tracks', False))
+        except Exception as e:
+            error = '{}: {}'.format(e.__class__.__name__, e)
+        status = 'done' if error is None else 'failed'
+        self._set_job_status(job, status)
+        logger.info("Job %d %s in %.1f seconds", job, status, time.time() - t0)
+        conn.send({'status': status, 'job': job, 'error': error, 'out': request['out'],
+                   'elapsed': time.time() - t0})
+
+    def _setup(self, request):
+        text = request['config_text']
+        datasetdir = request.get('datasetdir', None)
+        conf = yaml.safe_load(text)
+        ds_path = SimulationConfiguration.find_dataset(conf['dataset']['path'], datasetdir)
+        # Drop datasets whose file has changed since they were loaded
+        key = os.path.abspath(ds_path)
+        stamp = dataset_key(ds_path)
+        if self._dataset_stamps.get(key, None) != stamp:
+            self.datasets.pop(key, None)
+            self._dataset_stamps[key] = stamp
+        return RollingShutterImuSimulation.from_config_text(text, request.get('config_path', None), datasetdir,
+                                                            datasets=self.datasets, cache=self.cache)
+
+    def _simulate(self, sim, out, include_tracks):
+        parent_conn, child_conn = self._context.Pipe(duplex=False)
+        proc = self._context.Process(target=_run_job_process, args=(sim, out, include_tracks, child_conn))
+        # Fork while no other thread is setting up a job or updating the job table,
+        # such that the worker does not inherit the caches or locks in an inconsistent state
+        with self._setup_lock, self._jobs_lock:
+            proc.start()
+        child_conn.close()
+        try:
+            error = parent_conn.recv()
+        except EOFError:
+            error = None
+        proc.join()
+        if error is None and proc.exitcode != 0:
+            error = "Worker process exited with code {}".format(proc.exitcode)
+        return error
+
+def _request(request, address, authkey, callback=None):
+    address = default_address() if address is None else address
+    authkey = load_authkey() if authkey is None else authkey
+    conn = Client(parse_address(address), authkey=authkey)
+    try:
+        conn.send(request)
+        while True:
+            reply = conn.recv()
+            if callback is not None:
+                callback(reply)
+            if reply['status'] not in ('queued', 'running'):
+                return reply
+    finally:
+        conn.close()
+
+def submit(config_path, out, address=None, datasetdir=None, include_tracks=False, authkey=None,
+           callback=None):
+    """Run a simulation on a SimulationService and wait for it to finish
+
+    Relative paths are resolved in the current directory, which is also searched for the dataset.
+    The address and authkey default to those of SimulationService.
+    The callback, if given, is called with each status message.
+
+    Returns
+    ----------------
+    reply : dict
+        Final status message, with 'status' set to 'done' or 'failed', and 'error'
+    """
+    with open(config_path, 'r') as f:
+        text = f.read()
+    request = {'op': 'run',
+               'config_text': text,
+               'config_path': config_path,
+               'out': os.path.abspath(out),
+               'datasetdir': os.path.abspath(os.getcwd() if datasetdir is None else datasetdir),
+               'include_tracks': include_tracks}
+    return _request(request, address, authkey, callback)
+
+def service_status(address=None, authkey=None):
+    return _request({'op': 'status'}, address, authkey)
+
+def shutdown_service(address=None, authkey=None):
+    return _request({'op': 'shutdown'}, address, authkey)
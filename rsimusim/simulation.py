@@ -2,17 +2,17 @@ from __future__ import print_function, division
 
 from numbers import Number
 import os
+import pickle
 
 import yaml
 import numpy as np
-import h5py
 import time
 import datetime
 import logging
+import multiprocessing
 
 logger = logging.getLogger("rsimusim.simulation")
 
-from crisp.camera import AtanCameraModel
 from imusim.simulation.base import Simulation
 from imusim.platforms.imus import IdealIMU
 from imusim.behaviours.imu import BasicIMUBehaviour
@@ -21,10 +21,21 @@ from imusim.trajectories.splined import SplinedTrajectory
 from imusim.trajectories.sampled import SampledTrajectory
 from imusim.utilities.time_series import TimeSeries
 
-from .camera import CameraPlatform, PinholeModel, BasicCameraBehaviour
-from .inertial import DefaultIMU
+from .camera import CameraPlatform, PinholeModel, BasicCameraBehaviour, FrameObservations, ImageMeasurements, \
+    ProjectionScheduler, PROJECTION_METHODS, frame_times
+from .inertial import DefaultIMU, sample_times, ideal_imu_signals, default_imu_measurements, apply_default_imu
 from .scene import SceneEnvironment
 from .dataset import Dataset
+from .tracks import LandmarkTracks
+from .rng import RandomStreams
+from .buffers import MeasurementBuffer
+from .cache import StageCache, dataset_key
+from .profiling import Profiler
+from .trajectory import RelativePoseTrajectory, TrajectoryEvaluator
+from .constants import DATETIME_FORMAT
+from . import profiling
+
+CHECKPOINT_VERSION = 1
 
 class RollingShutterImuSimulation:
     def __init__(self):
@@ -36,22 +47,252 @@ class RollingShutterImuSimulation:
         self.imu_behaviour = None
         self.simulation = None
         self.simulation_trajectory = None
+        self.cache = None
+        self._trajectory_key = None
+        self._evaluator = None
+        self._time_started = None # Set when resumed from a checkpoint
+
+    def run(self, progress=False, chunks=None, telemetry=None, checkpoint=None, checkpoint_interval=600.0):
+        """Run the simulation
+
+        If chunks is given, the simulated interval is instead split into that many chunks
+        which are simulated in parallel worker processes, see run_chunked().
+        If telemetry is a Telemetry instance, it reports throughput while the simulation runs.
+        Telemetry is not available for chunked runs.
+
+        If checkpoint is a path, the simulation state is written to it every checkpoint_interval
+        seconds (wall clock), and the run can be continued with resume().
+        """
+        if chunks is not None:
+            if telemetry is not None:
+                logger.warning("Telemetry is not available for chunked simulations")
+            if checkpoint is not None:
+                logger.warning("Checkpoints are not available for chunked simulations")
+            return self.run_chunked(chunks, progress=progress)
+
+        # Simulate
+        if self._time_started is None:
+            self.simulation.time = self.config.start_time
+            t0 = datetime.datetime.now()
+        else:
+            t0 = self._time_started
+            logger.info("Resuming simulation at t=%.4f", self.simulation.time)
+        with profiling.phase('simulate'):
+            if telemetry is None:
+                self._simulate_until(self.config.end_time, progress, checkpoint, checkpoint_interval, t0)
+            else:
+                with telemetry.watch(self):
+                    self._simulate_until(self.config.end_time, progress, checkpoint, checkpoint_interval, t0)
+        if self.imu_behaviour is None:
+            with profiling.phase('imu_sampling'):
+                imu_times, specific_force, angular_rate = self.noise_free_imu_signals()
+                apply_default_imu(self.imu, imu_times, specific_force, angular_rate)
+        t1 = datetime.datetime.now()
 
+        # Release the projection context, if the camera used worker processes
+        if self.camera.camera.use_multiproc:
+            self.camera.camera.stop_multiproc()
+
+        return self._assemble_results(t0, t1)
+
+    def _simulate_until(self, end_time, progress, checkpoint, checkpoint_interval, t0):
+        if checkpoint is None:
+            self.simulation.run(end_time, printProgress=progress)
+            return
+
+        # Run the event loop in segments of one frame period, and checkpoint between segments
+        period = 1. / self.camera.camera.frame_rate
+        boundaries = np.append(np.arange(self.config.start_time + period, end_time, period), end_time)
+        last_checkpoint = time.time()
+        for segment_end in boundaries[boundaries > self.simulation.time]:
+            self.simulation.run(segment_end, printProgress=progress)
+            if time.time() - last_checkpoint >= checkpoint_interval:
+                self.save_checkpoint(checkpoint, t0)
+                last_checkpoint = time.time()
+
+    def _shared_objects(self):
+        # Large or external objects which are rebuilt from the config when resuming,
+        # and are thus not written to checkpoints.
+        shared = {'dataset': self.config.dataset,
+                  'trajectory': self.simulation_trajectory,
+                  'environment': self.environment,
+                  'camera_model': self.config.camera_model,
+                  'config': self.config}
+        if self._evaluator is not None:
+            shared['evaluator'] = self._evaluator
+        return shared
+
+    def save_checkpoint(self, path, time_started):
+        """Write the simulation state to path
+
+        The checkpoint holds the simulation time and pending events, the camera and IMU
+        with their measurements so far, and the state of the random number generators.
+        The file is replaced atomically.
+        """
+        header = {'version': CHECKPOINT_VERSION,
+                  'config_text': self.config.text,
+                  'config_path': self.config.path,
+                  'sim_time': self.simulation.time}
+        state = {'time_started': time_started,
+                 'np_random_state': np.random.get_state(),
+                 'simulation': self.simulation,
+                 'camera': self.camera,
+                 'camera_behaviour': self.camera_behaviour,
+                 'imu': self.imu,
+                 'imu_behaviour': self.imu_behaviour}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            _CheckpointPickler(f, self._shared_objects()).dump(state)
+        os.replace(tmp_path, path)
+        logger.info("Wrote checkpoint at t=%.4f to %s", self.simulation.time, path)
 
-    def run(self, progress=False):
-        # Camera simulator runs multiprocessed
-        self.camera.camera.start_multiproc()
+    @classmethod
+    def resume(cls, path, datasetdir=None, datasets=None, cache=None):
+        """Simulation restored from a checkpoint
+
+        The dataset and trajectory are rebuilt from the configuration stored in the checkpoint.
+        Calling run() continues the simulation, and gives the same results as an uninterrupted run.
+        """
+        with open(path, 'rb') as f:
+            header = pickle.load(f)
+            if header['version'] != CHECKPOINT_VERSION:
+                raise ValueError("Unsupported checkpoint version: {}".format(header['version']))
+            instance = cls.from_config_text(header['config_text'], header['config_path'], datasetdir, datasets,
+                                            cache=cache)
+            state = _CheckpointUnpickler(f, instance._shared_objects()).load()
+
+        instance.simulation = state['simulation']
+        instance.camera = state['camera']
+        instance.camera_behaviour = state['camera_behaviour']
+        instance.imu = state['imu']
+        instance.imu_behaviour = state['imu_behaviour']
+        instance._time_started = state['time_started']
+        np.random.set_state(state['np_random_state'])
+        logger.info("Resumed from checkpoint at t=%.4f", instance.simulation.time)
+        return instance
 
-        # Simulate
-        self.simulation.time = self.config.start_time
+    def run_chunked(self, chunks, processes=None, progress=False):
+        """Run the simulation in parallel over time chunks
+
+        Camera frames and IMU samples are split into chunks on their sample grids, and each
+        chunk is simulated in its own worker process against the same trajectory and dataset.
+        Workers return camera frames and ideal IMU signals, and the IMU noise and bias is
+        applied to the concatenated signals. The output thus matches a serial run with the
+        vectorized IMU, and a serial run with the event loop if the config has a seed.
+        If progress is True, the number of finished chunks is printed as they complete.
+
+        The workers inherit the simulation instead of receiving it pickled, so this requires
+        the fork start method, and raises RuntimeError on platforms without it.
+        """
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            raise RuntimeError("Chunked simulation requires the fork start method")
         t0 = datetime.datetime.now()
-        self.simulation.run(self.config.end_time, printProgress=progress)
+        camera = self.camera.camera
+        all_frame_times = frame_times(self.config.start_time, self.config.end_time,
+                                      camera.frame_rate, camera.camera_model.readout)
+        imu_times = sample_times(self.config.start_time, self.config.end_time, self.config.imu_config['sample_rate'])
+
+        boundaries = np.linspace(self.config.start_time, self.config.end_time, num=chunks + 1)
+        frame_splits = np.searchsorted(all_frame_times, boundaries[1:-1], side='right')
+        imu_splits = np.searchsorted(imu_times, boundaries[1:-1], side='right')
+        first_frames = np.hstack((0, frame_splits))
+        tasks = [(ft, first_frame, it) for ft, first_frame, it in
+                 zip(np.split(all_frame_times, frame_splits), first_frames, np.split(imu_times, imu_splits))]
+
+        processes = min(chunks, multiprocessing.cpu_count()) if processes is None else processes
+        logger.info("Simulating %d chunks using %d processes", chunks, processes)
+        pool = context.Pool(processes, initializer=_init_chunk_worker, initargs=(self,))
+        try:
+            with profiling.phase('simulate'):
+                chunk_results = []
+                for chunk_result in pool.imap(_simulate_chunk, tasks, chunksize=1):
+                    chunk_results.append(chunk_result)
+                    if progress:
+                        print("Simulated {:d}/{:d} chunks".format(len(chunk_results), len(tasks)))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        # Stitch chunks
+        camera.measurements = ImageMeasurements(len(all_frame_times))
+        for (ft, _, _), (frames, _, _) in zip(tasks, chunk_results):
+            for t, frame in zip(ft, frames):
+                camera.measurements.add(t, frame)
+        camera.current_frame = len(all_frame_times)
+        specific_force = np.hstack([f for _, f, _ in chunk_results])
+        angular_rate = np.hstack([w for _, _, w in chunk_results])
+        with profiling.phase('imu_sampling'):
+            apply_default_imu(self.imu, imu_times, specific_force, angular_rate)
+        # Frames were sampled in the worker processes
+        profiling.count('frames', len(all_frame_times))
         t1 = datetime.datetime.now()
 
-        # Stop camera worker processes
-        self.camera.camera.stop_multiproc()
-
-        # Assemble results
+        return self._assemble_results(t0, t1)
+
+    def noise_free_imu_signals(self):
+        """Noise free IMU signals for all sample times
+
+        Returns
+        ----------------
+        times : (N,) array of sample times
+        specific_force : (3, N) array
+        angular_rate : (3, N) array
+        """
+        start, end = self.config.start_time, self.config.end_time
+        sample_rate = self.config.imu_config['sample_rate']
+        evaluator = self.imu_evaluator
+        def compute():
+            times = sample_times(start, end, sample_rate)
+            specific_force, angular_rate = ideal_imu_signals(self.simulation_trajectory, times, self.environment,
+                                                             evaluator)
+            return times, specific_force, angular_rate
+        key = StageCache.make_key(self._trajectory_key, start, end, sample_rate, evaluator is not None)
+        return self._cached('imu_signals', key, compute)
+
+    @property
+    def trajectory_evaluator(self):
+        "TrajectoryEvaluator of the simulation trajectory, shared through the stage cache"
+        if self._evaluator is None:
+            self._evaluator = self._cached('evaluator', self._trajectory_key,
+                                           lambda: TrajectoryEvaluator.from_trajectory(self.simulation_trajectory))
+        return self._evaluator
+
+    @property
+    def imu_evaluator(self):
+        "Evaluator used for the vectorized IMU signals, or None to use the imusim trajectory"
+        return self.trajectory_evaluator if self.config.imu_config['refit_spline'] else None
+
+    def imu_realizations(self, seeds):
+        """IMU measurements for several noise realizations
+
+        The noise free signals are computed once, or taken from the stage cache, and the
+        configured bias and noise is then applied in bulk for every seed.
+        The noise of seed s is the same as that of a simulation with seed s in its config.
+        The measurements of the simulation's own IMU are left unchanged.
+
+        Returns
+        ----------------
+        realizations : list of (accelerometer, gyroscope) TimeSeries tuples
+        """
+        times, specific_force, angular_rate = self.noise_free_imu_signals()
+        realizations = []
+        for seed in seeds:
+            acc, gyro = default_imu_measurements(self.imu, specific_force, angular_rate, streams=RandomStreams(seed))
+            realizations.append((TimeSeries(times, acc), TimeSeries(times, gyro)))
+        return realizations
+
+    def _cached(self, stage, key, compute):
+        if self.cache is None:
+            return compute()
+        return self.cache.get(stage, key, compute)
+
+    def _assemble_results(self, t0, t1):
         results = SimulationResults()
         results.trajectory = self.simulation_trajectory
         results.config_path = self.config.path
@@ -60,50 +301,124 @@ class RollingShutterImuSimulation:
         results.time_started = t0
         results.time_finished = t1
         results.image_measurements = self.camera.camera.measurements
-        results.accelerometer_measurements = self.imu.accelerometer.rawMeasurements
-        results.gyroscope_measurements = self.imu.gyroscope.rawMeasurements
+        # Measurements are collected in array buffers, but results hold imusim time series
+        profiling.count('imu_samples', len(self.imu.gyroscope.rawMeasurements.timestamps))
+        results.accelerometer_measurements = _as_timeseries(self.imu.accelerometer.rawMeasurements)
+        results.gyroscope_measurements = _as_timeseries(self.imu.gyroscope.rawMeasurements)
+        results.profile = profiling.active_profiler()
 
         return results
 
     def _setup(self):
         # Trajectory used by the simulation
         # Not the same as the dataset to account for the relative pose
-        # between camera and IMU
-        self.simulation_trajectory = transform_trajectory(self.config.dataset.trajectory,
-                                                          self.config.Rci, self.config.pci)
-
-        from numpy.testing import assert_equal
-        assert_equal(self.simulation_trajectory.startTime, self.config.dataset.trajectory.startTime)
-        assert_equal(self.simulation_trajectory.endTime, self.config.dataset.trajectory.endTime)
-
-        self.environment = SceneEnvironment(self.config.dataset)
+        # between camera and IMU. It is evaluated from the dataset splines, and thus
+        # has the same start and end times.
+        # The noise free stages only depend on the dataset and relative pose
+        # and can thus be shared between simulations through the stage cache.
+        ds_key = dataset_key(self.config.dataset_path)
+        self._trajectory_key = StageCache.make_key(ds_key, self.config.Rci, self.config.pci)
+        with profiling.phase('trajectory_transform'):
+            self.simulation_trajectory = self._cached(
+                'trajectory', self._trajectory_key,
+                lambda: transform_trajectory(self.config.dataset.trajectory, self.config.Rci, self.config.pci))
+
+        # Visible landmarks per frame, shared by simulations with the same frame times. The key
+        # includes the frame times, such that each cached dict holds at most one entry per frame.
+        times = frame_times(self.config.start_time, self.config.end_time,
+                            self.config.camera_model.frame_rate, self.config.camera_model.readout)
+        visibility_cache = self._cached('visibility', StageCache.make_key(ds_key, times), dict)
+        self.environment = SceneEnvironment(self.config.dataset, visibility_cache=visibility_cache)
         self.simulation = Simulation(environment=self.environment)
 
         # Configure camera
         self.camera = CameraPlatform(self.config.camera_model, self.config.Rci, self.config.pci,
                                      simulation=self.simulation, trajectory=self.simulation_trajectory)
-        self.camera_behaviour = BasicCameraBehaviour(self.camera, self.config.end_time)
+        self.camera_behaviour = BasicCameraBehaviour(self.camera, self.config.end_time, capacity=len(times) + 1)
+        scheduling = dict(self.config.projection)
+        self.camera.camera.projection_method = scheduling.pop('method')
+        self.camera.camera.max_projection_error = scheduling.pop('max_error')
+        if scheduling.pop('refit_spline'):
+            self.camera.camera.evaluator = self.trajectory_evaluator
+        self.camera.camera.scheduler = ProjectionScheduler(**scheduling)
 
         # Configure IMU
         imu_conf = self.config.imu_config
         assert imu_conf['type'] == 'DefaultIMU'
+        streams = None if self.config.seed is None else RandomStreams(self.config.seed)
         self.imu = DefaultIMU(imu_conf['accelerometer']['bias'], imu_conf['accelerometer']['noise'],
                               imu_conf['gyroscope']['bias'], imu_conf['gyroscope']['noise'],
-                              simulation=self.simulation, trajectory=self.simulation_trajectory)
-        imu_dt = 1. / self.config.imu_config['sample_rate']
-        self.imu_behaviour = BasicIMUBehaviour(self.imu, imu_dt, initialTime=self.config.start_time)
+                              simulation=self.simulation, trajectory=self.simulation_trajectory,
+                              streams=streams)
+        if imu_conf['vectorized']:
+            # IMU samples are generated in bulk after the event loop
+            self.imu_behaviour = None
+        else:
+            imu_dt = 1. / self.config.imu_config['sample_rate']
+            self.imu_behaviour = BasicIMUBehaviour(self.imu, imu_dt, initialTime=self.config.start_time)
+            # Preallocate measurements for all samples
+            num_samples = len(sample_times(self.config.start_time, self.config.end_time, imu_conf['sample_rate']))
+            for sensor in self.imu.sensors:
+                sensor.rawMeasurements = MeasurementBuffer(num_samples + 1)
 
     @classmethod
-    def from_config(cls, path, datasetdir=None):
+    def from_config(cls, path, datasetdir=None, datasets=None, cache=None):
         instance = cls()
+        instance.cache = cache
         instance.config = SimulationConfiguration()
-        instance.config.parse_yaml(path, datasetdir)
+        instance.config.parse_yaml(path, datasetdir, datasets)
         instance._setup()
 
         return instance
 
+    @classmethod
+    def from_config_text(cls, text, path=None, datasetdir=None, datasets=None, cache=None):
+        instance = cls()
+        instance.cache = cache
+        instance.config = SimulationConfiguration()
+        instance.config.parse_yaml_text(text, path, datasetdir, datasets)
+        instance._setup()
+
+        return instance
+
+class _CheckpointPickler(pickle.Pickler):
+    "Pickler which writes references to shared objects instead of the objects themselves"
+    def __init__(self, f, shared):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self._shared = {id(obj): key for key, obj in shared.items()}
+
+    def persistent_id(self, obj):
+        return self._shared.get(id(obj), None)
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, f, shared):
+        pickle.Unpickler.__init__(self, f)
+        self._shared = shared
+
+    def persistent_load(self, pid):
+        return self._shared[pid]
+
+# Simulation used by the chunk worker processes
+_chunk_simulation = None
+
+def _init_chunk_worker(simulation):
+    global _chunk_simulation
+    _chunk_simulation = simulation
+    # The worker is itself one of many processes, so project landmarks serially
+    _chunk_simulation.camera.camera.use_multiproc = False
+
+def _simulate_chunk(task):
+    chunk_frame_times, first_frame, imu_times = task
+    sim = _chunk_simulation
+    camera = sim.camera.camera
+    camera.current_frame = first_frame
+    frames = [camera.sample(t)[2] for t in chunk_frame_times]
+    specific_force, angular_rate = ideal_imu_signals(sim.simulation_trajectory, imu_times, sim.environment,
+                                                     sim.imu_evaluator)
+    return frames, specific_force, angular_rate
+
 class SimulationResults:
-    __datetime_format = '%Y-%m-%d %H:%M:%S.%f'
+    __datetime_format = DATETIME_FORMAT
 
     def __init__(self):
         self.time_started = None
@@ -114,6 +429,15 @@ class SimulationResults:
         self.image_measurements = None
         self.gyroscope_measurements = None
         self.accelerometer_measurements = None
+        self.profile = None
+        self._landmark_tracks = None
+
+    @property
+    def landmark_tracks(self):
+        "Inverted index from landmark id to its image observations (built on first access)"
+        if self._landmark_tracks is None:
+            self._landmark_tracks = LandmarkTracks.from_flat(*self.image_measurements.flatten())
+        return self._landmark_tracks
 
     @classmethod
     def from_file(cls, path):
@@ -126,14 +450,14 @@ class SimulationResults:
         def load_observations(h5_file):
             framegroup = h5_file['camera']
             frames = sorted(framegroup.keys())
-            ts = TimeSeries()
+            measurements = ImageMeasurements(len(frames))
             for fkey in frames:
                 group = framegroup[fkey]
-                obs_dict = {lm_id: ip.reshape(2,1) for lm_id, ip in zip(group['landmarks'].value,
-                                                           group['measurements'].value.T)}
+                landmarks = group['landmarks'].value.astype('int64')
+                points = np.ascontiguousarray(group['measurements'].value.reshape(2, -1).T, dtype='double')
                 t = group['time'].value
-                ts.add(t, obs_dict)
-            return ts
+                measurements.add(t, FrameObservations(landmarks, points))
+            return measurements
 
         def load_datetime(h5ds):
             time_data = h5ds.value
@@ -141,6 +465,10 @@ class SimulationResults:
             return datetime.datetime.strptime(time_str, cls.__datetime_format)
 
         def load_trajectory(group):
+            if 'parent' in group:
+                # Relative pose to a parent spline: rebuild the simulated trajectory exactly
+                parent = load_trajectory(group['parent'])
+                return RelativePoseTrajectory(parent, group['R'].value, group['p'].value)
             pos_ts = load_timeseries(group['position'])
             rot_array_ts = load_timeseries(group['rotation'])
             rot_ts = TimeSeries(rot_array_ts.timestamps, QuaternionArray(rot_array_ts.values.T))
@@ -148,6 +476,19 @@ class SimulationResults:
             splined = SplinedTrajectory(sampled, smoothRotations=False)
             return splined
 
+        def load_tracks(group):
+            return LandmarkTracks(group['landmarks'].value, group['offsets'].value, group['frames'].value,
+                                  group['times'].value, group['measurements'].value)
+
+        def load_profile(group):
+            return Profiler.from_dict({
+                'phases': {name: {'seconds': float(seconds), 'calls': int(calls)}
+                           for name, (seconds, calls) in group['phases'].attrs.items()},
+                'counters': {name: int(value) for name, value in group['counters'].attrs.items()},
+                'function_stats': group['function_stats'].value if 'function_stats' in group else None
+            })
+
+        import h5py
         with h5py.File(path, 'r') as f:
             instance.time_started = load_datetime(f['time_started'])
             instance.time_finished = load_datetime(f['time_finished'])
@@ -158,48 +499,77 @@ class SimulationResults:
             instance.accelerometer_measurements = load_timeseries(f['accelerometer'])
             instance.image_measurements = load_observations(f)
             instance.trajectory = load_trajectory(f['trajectory'])
+            if 'tracks' in f:
+                instance._landmark_tracks = load_tracks(f['tracks'])
+            if 'profile' in f:
+                instance.profile = load_profile(f['profile'])
 
         return instance
 
-    def save(self, path):
+    def save(self, path, include_tracks=False):
         def save_timeseries(ts, group):
             group['data'] = ts.values
             group['timestamps'] = ts.timestamps
 
-        def save_observations(ts, h5_file):
+        def save_observations(measurements, h5_file):
             framegroup = h5_file.create_group('camera')
-            pad = int(np.ceil(np.log10(len(ts)+0.5)))
-            for framenum, (t, obs) in enumerate(zip(ts.timestamps, ts.values)):
-                landmarks = np.array(sorted(list(obs.keys())), dtype='int')
-                if len(landmarks) < 1:
-                    measurements = []
-                else:
-                    measurements = np.hstack([obs[lm_id].reshape(2,1) for lm_id in landmarks])
+            pad = int(np.ceil(np.log10(len(measurements)+0.5)))
+            for framenum, (t, frame) in enumerate(zip(measurements.timestamps, measurements.frames)):
+                order = np.argsort(frame.landmarks)
                 group = framegroup.create_group('frame_{framenum:0{pad}d}'.format(framenum=framenum, pad=pad))
-                group['landmarks'] = landmarks
-                group['measurements'] = measurements
+                group['landmarks'] = frame.landmarks[order]
+                group['measurements'] = frame.points[order].T
                 group['time'] = t
 
         def convert_datetime(dtime):
             return dtime.strftime(self.__datetime_format)
 
-        def save_trajectory(trajectory, h5f):
-            traj_group = h5f.create_group('trajectory')
+        def save_trajectory(trajectory, traj_group):
             save_timeseries(trajectory.sampled.positionKeyFrames, traj_group.create_group('position'))
             rot_ts = TimeSeries(trajectory.sampled.rotationKeyFrames.timestamps,
                                 trajectory.sampled.rotationKeyFrames.values.array.T)
             save_timeseries(rot_ts, traj_group.create_group('rotation'))
-
+            if isinstance(trajectory, RelativePoseTrajectory):
+                # The transformed keyframes above are kept for readers of the file,
+                # but a spline refitted to them is not the simulated trajectory
+                save_trajectory(trajectory.parent, traj_group.create_group('parent'))
+                traj_group['R'] = trajectory.R
+                traj_group['p'] = trajectory.p
+
+        def save_tracks(tracks, group):
+            group['landmarks'] = tracks.landmark_ids
+            group['offsets'] = tracks.offsets
+            group['frames'] = tracks.frames
+            group['times'] = tracks.times
+            group['measurements'] = tracks.measurements
+
+        def save_profile(profile, group):
+            phases = group.create_group('phases')
+            for name, (seconds, calls) in profile.phases.items():
+                phases.attrs[name] = [seconds, calls]
+            counters = group.create_group('counters')
+            for name, value in profile.counters.items():
+                counters.attrs[name] = value
+            if profile.function_stats is not None:
+                group['function_stats'] = profile.function_stats
+
+        import h5py
         with h5py.File(path, 'w') as f:
-            f['time_started'] = convert_datetime(self.time_started)
-            f['time_finished'] = convert_datetime(self.time_finished)
-            f['config_text'] = self.config_text
-            f['config_path'] = self.config_path
-            f['dataset_path'] = self.dataset_path
-            save_timeseries(self.gyroscope_measurements, f.create_group('gyroscope'))
-            save_timeseries(self.accelerometer_measurements, f.create_group('accelerometer'))
-            save_observations(self.image_measurements, f)
-            save_trajectory(self.trajectory, f)
+            with profiling.phase('save'):
+                f['time_started'] = convert_datetime(self.time_started)
+                f['time_finished'] = convert_datetime(self.time_finished)
+                f['config_text'] = self.config_text
+                f['config_path'] = self.config_path
+                f['dataset_path'] = self.dataset_path
+                save_timeseries(self.gyroscope_measurements, f.create_group('gyroscope'))
+                save_timeseries(self.accelerometer_measurements, f.create_group('accelerometer'))
+                save_observations(self.image_measurements, f)
+                save_trajectory(self.trajectory, f.create_group('trajectory'))
+                if include_tracks:
+                    save_tracks(self.landmark_tracks, f.create_group('tracks'))
+            # Written last, such that the time spent saving is included
+            if self.profile is not None:
+                save_profile(self.profile, f.create_group('profile'))
 
 
 class SimulationConfiguration:
@@ -212,19 +582,31 @@ class SimulationConfiguration:
         self.start_time = None
         self.end_time = None
         self.imu_config = None
+        self.projection = None
+        self.seed = None
         self.text = None
         self.path = None
 
-    def parse_yaml(self, path, datasetdir=None):
+    def parse_yaml(self, path, datasetdir=None, datasets=None):
         with open(path, 'r') as f:
             text = f.read()
-        conf = yaml.safe_load(text)
-        self.text = text
-        self.path = path
-        self._load_camera(conf)
-        self._load_relpose(conf)
-        self._load_dataset(conf, datasetdir)
-        self.imu_config = self._load_imu_config(conf)
+        self.parse_yaml_text(text, path, datasetdir, datasets)
+
+    def parse_yaml_text(self, text, path=None, datasetdir=None, datasets=None):
+        """Parse configuration from YAML text
+
+        If datasets is a dict, it is used as a cache of loaded datasets keyed by absolute path.
+        """
+        with profiling.phase('config'):
+            conf = yaml.safe_load(text)
+            self.text = text
+            self.path = path
+            self._load_camera(conf)
+            self.projection = self._load_projection(conf)
+            self._load_relpose(conf)
+            self._load_dataset(conf, datasetdir, datasets)
+            self.imu_config = self._load_imu_config(conf)
+            self.seed = self._load_seed(conf)
 
     def _load_camera(self, conf):
         cinfo = conf['camera']
@@ -238,6 +620,8 @@ class SimulationConfiguration:
         camera_matrix = np.array(params['camera_matrix']).reshape(3,3)
 
         if ctype == 'atan':
+            # crisp is slow to import, and only needed for this camera model
+            from crisp.camera import AtanCameraModel
             wc = np.array(params['dist_center'])
             lgamma = params['dist_param']
             camera = AtanCameraModel([cols, rows], framerate, readout, camera_matrix, wc, lgamma)
@@ -248,6 +632,43 @@ class SimulationConfiguration:
 
         self.camera_model = camera
 
+    def _load_projection(self, conf):
+        """Optional projection scheduling and method, e.g.
+
+        camera:
+          projection:
+            mode: auto # or serial, parallel
+            workers: 4
+            chunk_size: 50
+            method: linearized # or exact
+            max_error: 0.5 # pixels, for the linearized method
+            refit_spline: false # linearize on rsimusim.trajectory.TrajectoryEvaluator
+
+        The linearized method evaluates the platform trajectory by default, such that max_error
+        bounds the error relative to the exact projection. With refit_spline it instead evaluates
+        the refitted splines of the trajectory evaluator, which only approximate the trajectory.
+        """
+        pinfo = conf['camera'].get('projection', None) or {}
+        projection = {'mode': pinfo.get('mode', 'auto'),
+                      'method': pinfo.get('method', 'exact'),
+                      'max_error': pinfo.get('max_error', 0.5),
+                      'refit_spline': bool(pinfo.get('refit_spline', False))}
+        if projection['mode'] not in ProjectionScheduler.MODES:
+            raise ValueError("No such projection mode: {}".format(projection['mode']))
+        if projection['method'] not in PROJECTION_METHODS:
+            raise ValueError("No such projection method: {}".format(projection['method']))
+        if not isinstance(projection['max_error'], Number) or projection['max_error'] <= 0:
+            raise ValueError("Projection max_error must be positive: {}".format(projection['max_error']))
+        if projection['refit_spline'] and projection['method'] != 'linearized':
+            raise ValueError("The refitted spline evaluator requires the linearized projection method")
+        for key in ('workers', 'chunk_size'):
+            value = pinfo.get(key, None)
+            if value is not None:
+                if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                    raise ValueError("Projection {} must be a positive integer: {}".format(key, value))
+                projection[key] = value
+        return projection
+
     def _load_relpose(self, conf):
         try:
             pinfo = conf['relative_pose']
@@ -261,18 +682,25 @@ class SimulationConfiguration:
         self.Rci = R
         self.pci = p
 
-    def _load_dataset(self, conf, datasetdir=None):
-        dinfo = conf['dataset']
+    @staticmethod
+    def find_dataset(path, datasetdir=None):
         search_paths = ['.'] if datasetdir is None else [datasetdir, '.']
-        ds = None
         for root in search_paths:
-            ds_path = os.path.join(root, dinfo['path'])
+            ds_path = os.path.join(root, path)
             if os.path.exists(ds_path):
-                ds = Dataset.from_file(ds_path)
-                break
+                return ds_path
+        raise ValueError("Failed to find {} in search paths {}".format(path, search_paths))
 
-        if not ds:
-            raise ValueError("Failed to find {} in search paths {}".format(dinfo['path'], search_paths))
+    def _load_dataset(self, conf, datasetdir=None, datasets=None):
+        dinfo = conf['dataset']
+        ds_path = self.find_dataset(dinfo['path'], datasetdir)
+        key = os.path.abspath(ds_path)
+        if datasets is not None and key in datasets:
+            ds = datasets[key]
+        else:
+            ds = Dataset.from_file(ds_path)
+            if datasets is not None:
+                datasets[key] = ds
 
         # Make sure dataset has aligned spline knots in trajectory
         traj = ds.trajectory
@@ -333,12 +761,35 @@ class SimulationConfiguration:
         ginfo['bias'] = load_bias(ginfo['bias'])
         ginfo['noise'] = load_noise(ginfo['noise'])
 
+        iinfo['vectorized'] = bool(iinfo.get('vectorized', False))
+        # Evaluate the trajectory with rsimusim.trajectory.TrajectoryEvaluator instead of imusim.
+        # The evaluator refits splines to the keyframes, so the signals only approximate imusim's.
+        iinfo['refit_spline'] = bool(iinfo.get('refit_spline', False))
+        if iinfo['refit_spline'] and not iinfo['vectorized']:
+            raise ValueError("The refitted spline evaluator requires the vectorized IMU")
+
         return iinfo
 
+    def _load_seed(self, conf):
+        seed = conf.get('seed', None)
+        if seed is None:
+            return None
+        if not isinstance(seed, int) or isinstance(seed, bool) or seed < 0:
+            raise ValueError("Seed must be a non-negative integer: {}".format(seed))
+        return seed
+
     def _is_rotation(self, R):
         return np.allclose(np.dot(R, R.T), np.eye(3)) and np.isclose(np.linalg.det(R), 1.0)
 
-def transform_trajectory(trajectory, R, p):
+def _as_timeseries(measurements):
+    "imusim TimeSeries of a MeasurementBuffer"
+    if not isinstance(measurements, MeasurementBuffer):
+        return measurements
+    if len(measurements) == 0:
+        return TimeSeries()
+    return TimeSeries(measurements.timestamps.copy(), measurements.values.copy())
+
+def transform_trajectory(trajectory, R, p, refit=False):
     """Create new trajectory relative the given transformation
 
     If R1(t) and p1(t) is the rotation and translation given by inout trajectory, then
@@ -348,7 +799,14 @@ def transform_trajectory(trajectory, R, p):
     Then X2 = R X1 + p is the same point in the coordinate frame of the new trajectory
     Since X2 = R2(t).T [X - p2(t)] then we have
     R2(t) = R1(t)R and p2(t) = p1(t) + R1(t)p
+
+    By default the transform is applied to the evaluations of the input trajectory, see
+    RelativePoseTrajectory. If refit is True, a new spline is instead fitted to the
+    transformed keyframes.
     """
+    if not refit:
+        return RelativePoseTrajectory(trajectory, R, p)
+
     ts_q1 = trajectory.sampled.rotationKeyFrames
     q1 = ts_q1.values
     ts_p1 = trajectory.sampled.positionKeyFrames
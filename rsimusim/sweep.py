@@ -0,0 +1,153 @@
+from __future__ import print_function, division
+
+import os
+import copy
+import json
+import time
+import logging
+import itertools
+import multiprocessing
+
+import yaml
+
+from .simulation import RollingShutterImuSimulation, SimulationConfiguration
+from .dataset import Dataset
+from .cache import StageCache
+
+logger = logging.getLogger("rsimusim.sweep")
+
+INDEX_FILENAME = 'index.json'
+SWEEP_CACHE_ENTRIES = 16
+
+def set_config_value(conf, key, value):
+    "Set value in nested config dict given a dotted key, e.g. 'imu.gyroscope.noise'"
+    parts = key.split('.')
+    d = conf
+    for part in parts[:-1]:
+        d = d.setdefault(part, {})
+    d[parts[-1]] = value
+
+def expand_sweep(spec):
+    """Expand a sweep specification to a list of override dicts
+
+    The specification is a dict with a 'grid' and/or a 'variants' entry.
+    The grid maps dotted config keys to lists of values and is expanded to all combinations.
+    Variants is a list of override dicts. If both are given, every variant is combined
+    with every grid point.
+    """
+    grid = spec.get('grid', {}) or {}
+    keys = sorted(grid.keys())
+    grid_points = [dict(zip(keys, values)) for values in itertools.product(*[grid[key] for key in keys])]
+    variants = spec.get('variants', None) or [{}]
+    sweep = []
+    for variant in variants:
+        for point in grid_points:
+            overrides = dict(variant)
+            overrides.update(point)
+            sweep.append(overrides)
+    return sweep
+
+# Shared state of the sweep worker processes
+_sweep_state = {}
+
+def _init_sweep_worker(config_path, datasetdir, datasets, retries):
+    # Variants run by the same worker share noise free stages through the cache
+    _sweep_state.update(config_path=config_path, datasetdir=datasetdir, datasets=datasets, retries=retries,
+                        cache=StageCache(max_entries=SWEEP_CACHE_ENTRIES))
+
+def _run_variant(task):
+    index, text, out_path = task
+    entry = {'variant': index, 'output': out_path, 'status': 'failed', 'attempts': 0, 'error': None}
+    for attempt in range(1, _sweep_state['retries'] + 2):
+        entry['attempts'] = attempt
+        t0 = time.time()
+        try:
+            sim = RollingShutterImuSimulation.from_config_text(text, _sweep_state['config_path'],
+                                                               _sweep_state['datasetdir'], _sweep_state['datasets'],
+                                                               cache=_sweep_state['cache'])
+            # The worker is itself one of many processes, so project landmarks serially
+            sim.camera.camera.use_multiproc = False
+            result = sim.run()
+            result.save(out_path)
+        except Exception as e:
+            entry['error'] = '{}: {}'.format(e.__class__.__name__, e)
+            logger.warning("Variant %d failed (attempt %d): %s", index, attempt, entry['error'])
+            if os.path.exists(out_path):
+                os.unlink(out_path)
+        else:
+            entry['status'] = 'ok'
+            entry['error'] = None
+            entry['elapsed'] = time.time() - t0
+            break
+    return entry
+
+def run_sweep(config_path, sweep, out_dir, datasetdir=None, processes=None, retries=1):
+    """Run all variants of a base configuration on a process pool
+
+    Each distinct dataset is loaded once in the parent process and is inherited by the
+    worker processes, which are forked, so RuntimeError is raised on platforms without
+    the fork start method. Variants that fail are retried up to `retries` times and are then
+    skipped. One results file per variant is written to out_dir, together with an index
+    file describing the overrides and status of all variants.
+
+    Parameters
+    ----------------
+    config_path : str
+        Base simulation configuration
+    sweep : list of dict
+        Overrides for each variant, see expand_sweep()
+
+    Returns
+    ----------------
+    index : list of dict
+        One entry per variant
+    """
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        raise RuntimeError("Parameter sweeps require the fork start method")
+
+    with open(config_path, 'r') as f:
+        base_conf = yaml.safe_load(f)
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    datasets = {}
+    tasks = []
+    pad = len(str(max(len(sweep) - 1, 0)))
+    for index, overrides in enumerate(sweep):
+        conf = copy.deepcopy(base_conf)
+        for key, value in overrides.items():
+            set_config_value(conf, key, value)
+        ds_path = SimulationConfiguration.find_dataset(conf['dataset']['path'], datasetdir)
+        key = os.path.abspath(ds_path)
+        if key not in datasets:
+            logger.info("Loading dataset %s", ds_path)
+            datasets[key] = Dataset.from_file(ds_path)
+        text = yaml.safe_dump(conf, default_flow_style=False)
+        out_path = os.path.join(out_dir, 'variant_{index:0{pad}d}.h5'.format(index=index, pad=pad))
+        tasks.append((index, text, out_path))
+
+    logger.info("Running %d variants on %d datasets", len(tasks), len(datasets))
+    pool = context.Pool(processes, initializer=_init_sweep_worker,
+                        initargs=(config_path, datasetdir, datasets, retries))
+    try:
+        entries = []
+        for entry in pool.imap_unordered(_run_variant, tasks):
+            logger.info("Variant %d: %s", entry['variant'], entry['status'])
+            entries.append(entry)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    entries.sort(key=lambda entry: entry['variant'])
+    for entry in entries:
+        entry['overrides'] = sweep[entry['variant']]
+    with open(os.path.join(out_dir, INDEX_FILENAME), 'w') as f:
+        json.dump({'config_path': config_path, 'variants': entries}, f, indent=2)
+
+    return entries
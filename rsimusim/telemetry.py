@@ -0,0 +1,137 @@
+from __future__ import print_function, division
+
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("rsimusim.telemetry")
+
+class Telemetry(object):
+    """Periodic throughput reports of a running simulation
+
+    While watching a simulation, a background thread samples its progress every
+    `interval` seconds and reports frames/s, landmarks projected/s, IMU samples/s,
+    worker utilization, projection queue depth, the time spent in the current frame
+    and the estimated time remaining. Since reports are made from a separate thread,
+    a run that is stuck in a single frame still reports.
+
+    Parameters
+    ----------------
+    interval : float
+        Seconds between reports
+    path : str
+        If given, reports are appended to this file as JSON lines instead of being logged
+    """
+    def __init__(self, interval=10.0, path=None):
+        self.interval = interval
+        self.path = path
+        self.reports = []
+        self._simulation = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = None
+        self._started = None
+        self._started_sim_time = None
+
+    @contextmanager
+    def watch(self, simulation):
+        "Report on a RollingShutterImuSimulation while in the context"
+        self._simulation = simulation
+        self._stop.clear()
+        self._last = self._sample()
+        self._started = self._last['wall_time']
+        # A resumed simulation starts watching part way, so the ETA is based on the progress since then
+        self._started_sim_time = self._last['sim_time']
+        self._thread = threading.Thread(target=self._run, name='rsimusim-telemetry')
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            yield self
+        finally:
+            self._stop.set()
+            self._thread.join()
+            self.report()
+            self._thread = None
+            self._simulation = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except Exception:
+                logger.exception("Failed to report telemetry")
+
+    def _sample(self):
+        sim = self._simulation
+        camera = sim.camera.camera
+        pool = camera.pool
+        try:
+            queue_depth = pool.inq.qsize() if pool is not None and pool.procs else 0
+        except NotImplementedError: # Not available on all platforms
+            queue_depth = None
+        imu_samples = 0
+        if sim.imu is not None and sim.imu.gyroscope.rawMeasurements is not None:
+            imu_samples = len(sim.imu.gyroscope.rawMeasurements.timestamps)
+        return {
+            'wall_time': time.time(),
+            'sim_time': sim.simulation.time,
+            'frames': len(camera.measurements),
+            'landmarks': camera.landmarks_projected,
+            'imu_samples': imu_samples,
+            'busy': camera.projection_busy,
+            'workers': pool.alive if pool is not None else 0,
+            'queue_depth': queue_depth,
+            'frame_started': camera.frame_started,
+        }
+
+    def snapshot(self):
+        "Rates since the previous snapshot and totals so far"
+        current = self._sample()
+        last = self._last
+        self._last = current
+        dt = max(current['wall_time'] - last['wall_time'], 1e-9)
+        config = self._simulation.config
+        done = current['sim_time'] - config.start_time
+        done_watched = current['sim_time'] - self._started_sim_time
+        remaining = config.end_time - current['sim_time']
+        elapsed = current['wall_time'] - self._started
+        worker_seconds = dt * current['workers']
+        frame_started = current['frame_started']
+        return {
+            'time': current['wall_time'],
+            'sim_time': current['sim_time'],
+            'progress': done / (config.end_time - config.start_time),
+            'frames': current['frames'],
+            'frames_per_second': (current['frames'] - last['frames']) / dt,
+            'landmarks_per_second': (current['landmarks'] - last['landmarks']) / dt,
+            'imu_samples_per_second': (current['imu_samples'] - last['imu_samples']) / dt,
+            'workers': current['workers'],
+            'worker_utilization': ((current['busy'] - last['busy']) / worker_seconds
+                                   if worker_seconds > 0 else None),
+            'queue_depth': current['queue_depth'],
+            'current_frame_seconds': (current['wall_time'] - frame_started if frame_started is not None
+                                      else None),
+            'eta_seconds': elapsed * remaining / done_watched if done_watched > 0 else None,
+        }
+
+    def report(self):
+        report = self.snapshot()
+        self.reports.append(report)
+        if self.path is None:
+            logger.info("%.1f%% (t=%.3f): %.1f frames/s, %.0f landmarks/s, %.0f IMU samples/s, "
+                        "%d workers (%s utilized), queue depth %s, frame %s, ETA %s",
+                        100. * report['progress'], report['sim_time'], report['frames_per_second'],
+                        report['landmarks_per_second'], report['imu_samples_per_second'], report['workers'],
+                        _format_optional(report['worker_utilization'], '{:.0%}'),
+                        _format_optional(report['queue_depth'], '{:d}'),
+                        _format_optional(report['current_frame_seconds'], '{:.1f} s'),
+                        _format_optional(report['eta_seconds'], '{:.0f} s'))
+        else:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(report) + '\n')
+        return report
+
+def _format_optional(value, fmt):
+    return '-' if value is None else fmt.format(value)
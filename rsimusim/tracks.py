@@ -0,0 +1,106 @@
+from __future__ import print_function, division
+
+import numpy as np
+
+
+class LandmarkTracks(object):
+    """Inverted index from landmark id to its image observations
+
+    All observations are kept in flat arrays, sorted by landmark id and then by frame index.
+    The track of landmark ``landmark_ids[i]`` is the slice ``offsets[i]:offsets[i+1]`` of
+    the ``frames``, ``times`` and ``measurements`` arrays.
+    """
+    def __init__(self, landmark_ids, offsets, frames, times, measurements):
+        self.landmark_ids = landmark_ids
+        self.offsets = offsets
+        self.frames = frames
+        self.times = times
+        self.measurements = measurements
+
+    @classmethod
+    def from_flat(cls, landmarks, frames, times, measurements):
+        """Build index from flat (unsorted) per-observation arrays
+
+        Parameters
+        ----------------
+        landmarks : (M,) array of landmark ids
+        frames : (M,) array of frame indices
+        times : (M,) array of frame times
+        measurements : (M, 2) array of image points
+        """
+        landmarks = np.asarray(landmarks, dtype='int64')
+        frames = np.asarray(frames, dtype='int64')
+        times = np.asarray(times, dtype='double')
+        measurements = np.asarray(measurements, dtype='double').reshape(-1, 2)
+
+        order = np.lexsort((frames, landmarks))
+        landmarks = landmarks[order]
+        landmark_ids, starts = np.unique(landmarks, return_index=True)
+        offsets = np.append(starts, landmarks.size).astype('int64')
+        return cls(landmark_ids, offsets, frames[order], times[order],
+                   np.ascontiguousarray(measurements[order]))
+
+    @classmethod
+    def from_timeseries(cls, image_measurements):
+        """Build index from a TimeSeries of per-frame observation dicts"""
+        landmarks = []
+        frames = []
+        times = []
+        measurements = []
+        for framenum, (t, obs) in enumerate(zip(image_measurements.timestamps, image_measurements.values)):
+            n = len(obs)
+            landmarks.extend(obs.keys())
+            frames.append(np.full(n, framenum, dtype='int64'))
+            times.append(np.full(n, t, dtype='double'))
+            measurements.extend(ip.reshape(2) for ip in obs.values())
+
+        if not landmarks:
+            return cls.from_flat([], [], [], np.empty((0, 2)))
+        return cls.from_flat(landmarks, np.concatenate(frames), np.concatenate(times), np.vstack(measurements))
+
+    def __len__(self):
+        return self.landmark_ids.size
+
+    def __contains__(self, lm_id):
+        i = np.searchsorted(self.landmark_ids, lm_id)
+        return i < self.landmark_ids.size and self.landmark_ids[i] == lm_id
+
+    @property
+    def lengths(self):
+        "Number of observations in each track"
+        return np.diff(self.offsets)
+
+    @property
+    def start_times(self):
+        return self.times[self.offsets[:-1]]
+
+    @property
+    def end_times(self):
+        return self.times[self.offsets[1:] - 1]
+
+    def track(self, lm_id):
+        """Observations of a single landmark
+
+        Returns
+        ----------------
+        frames : (N,) array of frame indices
+        times : (N,) array of frame times
+        measurements : (N, 2) array of image points
+        """
+        i = np.searchsorted(self.landmark_ids, lm_id)
+        if i >= self.landmark_ids.size or self.landmark_ids[i] != lm_id:
+            raise KeyError(lm_id)
+        s = slice(self.offsets[i], self.offsets[i + 1])
+        return self.frames[s], self.times[s], self.measurements[s]
+
+    def longer_than(self, k):
+        "Ids of all landmarks tracked in more than k frames"
+        return self.landmark_ids[self.lengths > k]
+
+    def alive_between(self, t0, t1):
+        "Ids of all landmarks with at least one observation in [t0, t1]"
+        if not self.landmark_ids.size:
+            return self.landmark_ids
+        inside = (self.times >= t0) & (self.times <= t1)
+        counts = np.add.reduceat(inside.astype('int64'), self.offsets[:-1])
+        return self.landmark_ids[counts > 0]
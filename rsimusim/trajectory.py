@@ -0,0 +1,251 @@
+from __future__ import print_function, division
+
+import numpy as np
+from imusim.maths.quaternions import Quaternion
+from imusim.trajectories.sampled import SampledTrajectory
+from imusim.utilities.time_series import TimeSeries
+
+class RelativePoseTrajectory(object):
+    """Trajectory with a fixed relative pose to a parent trajectory
+
+    If R1(t) and p1(t) are the rotation and position of the parent, this trajectory has
+    R2(t) = R1(t) R and p2(t) = p1(t) + R1(t) p, and is evaluated directly from the parent,
+    such that the parent splines are reused without fitting new ones.
+    The derivatives follow from the rigid body motion of the lever arm r(t) = R1(t) p
+
+        v2 = v1 + w x r
+        a2 = a1 + alpha x r + w x (w x r)
+
+    where w and alpha are the world frame rotational velocity and acceleration,
+    which are the same for both trajectories.
+
+    Parameters
+    ----------------
+    parent : trajectory
+        E.g. an imusim SplinedTrajectory
+    R : (3,3) array
+        Rotation
+    p : (3,1) array
+        Translation, in the parent body frame
+    """
+    def __init__(self, parent, R, p):
+        self.parent = parent
+        self.R = np.asarray(R, dtype='double')
+        self.p = np.asarray(p, dtype='double').reshape(3,1)
+        self._q = Quaternion.fromMatrix(self.R)
+        self._sampled = None
+
+    @property
+    def startTime(self):
+        return self.parent.startTime
+
+    @property
+    def endTime(self):
+        return self.parent.endTime
+
+    @property
+    def sampled(self):
+        "Transformed keyframes of the parent, e.g. to store the trajectory"
+        if self._sampled is None:
+            ts_q1 = self.parent.sampled.rotationKeyFrames
+            ts_p1 = self.parent.sampled.positionKeyFrames
+            q1 = ts_q1.values
+            ts_q2 = TimeSeries(ts_q1.timestamps, q1 * self._q)
+            ts_p2 = TimeSeries(ts_p1.timestamps, ts_p1.values + q1.rotateVector(self.p))
+            self._sampled = SampledTrajectory(positionKeyFrames=ts_p2, rotationKeyFrames=ts_q2)
+        return self._sampled
+
+    @property
+    def positionKeyFrames(self):
+        return self.sampled.positionKeyFrames
+
+    @property
+    def rotationKeyFrames(self):
+        return self.sampled.rotationKeyFrames
+
+    def _lever_arm(self, t):
+        return self.parent.rotation(t).rotateVector(self.p)
+
+    def position(self, t):
+        return self.parent.position(t) + self._lever_arm(t)
+
+    def velocity(self, t):
+        w = self.parent.rotationalVelocity(t)
+        return self.parent.velocity(t) + np.cross(w, self._lever_arm(t), axis=0)
+
+    def acceleration(self, t):
+        w = self.parent.rotationalVelocity(t)
+        alpha = self.parent.rotationalAcceleration(t)
+        r = self._lever_arm(t)
+        return (self.parent.acceleration(t) + np.cross(alpha, r, axis=0) +
+                np.cross(w, np.cross(w, r, axis=0), axis=0))
+
+    def rotation(self, t):
+        return self.parent.rotation(t) * self._q
+
+    def rotationalVelocity(self, t):
+        return self.parent.rotationalVelocity(t)
+
+    def rotationalAcceleration(self, t):
+        return self.parent.rotationalAcceleration(t)
+
+class TrajectoryEvaluator(object):
+    """Vectorized evaluation of a splined trajectory for arrays of times
+
+    Positions and unit quaternions are interpolated by cubic B-splines refitted to the
+    keyframes, and all quantities are evaluated for an array of times with a single
+    spline evaluation each, returning contiguous arrays instead of imusim Quaternion objects.
+    The splines are not imusim's: the normalized component-wise quaternion spline differs from
+    imusim's rotation spline, mostly in the rotational velocity and acceleration, so the
+    evaluator approximates the imusim trajectory and does not reproduce it.
+    An optional fixed relative pose (R, p) is applied as in RelativePoseTrajectory.
+    Times outside the keyframes evaluate to NaN.
+
+    Parameters
+    ----------------
+    timestamps : (N,) array
+        Keyframe times
+    positions : (3, N) array
+    quaternions : (N, 4) array
+        Unit quaternions (w, x, y, z), body to world
+    R, p : (3,3) and (3,1) arrays
+        Optional relative pose
+    """
+    def __init__(self, timestamps, positions, quaternions, R=None, p=None):
+        from scipy.interpolate import make_interp_spline
+        timestamps = np.asarray(timestamps, dtype='double')
+        quaternions = np.array(quaternions, dtype='double')
+        # Consecutive keyframes on the same hemisphere, such that the components are smooth
+        signs = np.cumprod(np.where(np.sum(quaternions[1:] * quaternions[:-1], axis=1) < 0, -1., 1.))
+        quaternions[1:] *= signs[:, np.newaxis]
+        self.startTime = timestamps[0]
+        self.endTime = timestamps[-1]
+        self._position_spline = make_interp_spline(timestamps, np.asarray(positions, dtype='double').T, k=3)
+        self._position_spline.extrapolate = False
+        self._quaternion_spline = make_interp_spline(timestamps, quaternions, k=3)
+        self._quaternion_spline.extrapolate = False
+        self.R = None if R is None else np.asarray(R, dtype='double')
+        self.p = None if p is None else np.asarray(p, dtype='double').reshape(3)
+
+    @classmethod
+    def from_trajectory(cls, trajectory):
+        "Evaluator for the keyframes of an imusim SplinedTrajectory or a RelativePoseTrajectory"
+        R = p = None
+        if isinstance(trajectory, RelativePoseTrajectory):
+            R, p = trajectory.R, trajectory.p
+            trajectory = trajectory.parent
+        ts_p = trajectory.sampled.positionKeyFrames
+        ts_q = trajectory.sampled.rotationKeyFrames
+        if not np.all(ts_p.timestamps == ts_q.timestamps):
+            raise ValueError("Trajectory must have aligned position and rotation keyframes")
+        return cls(ts_p.timestamps, ts_p.values, ts_q.values.array, R, p)
+
+    def _quaternions(self, times, derivatives):
+        "Unit quaternions (N, 4) and their time derivatives, up to the given order"
+        s = self._quaternion_spline(times)
+        norm = np.sqrt(np.sum(s * s, axis=1))[:, np.newaxis]
+        q = s / norm
+        result = [q]
+        if derivatives >= 1:
+            ds = self._quaternion_spline(times, nu=1)
+            q_ds = np.sum(q * ds, axis=1)[:, np.newaxis]
+            dq = (ds - q * q_ds) / norm
+            result.append(dq)
+        if derivatives >= 2:
+            dds = self._quaternion_spline(times, nu=2)
+            # Second derivative of s / |s|
+            dnorm = q_ds
+            ddnorm = (np.sum(ds * ds, axis=1)[:, np.newaxis] + np.sum(s * dds, axis=1)[:, np.newaxis]
+                      - dnorm ** 2) / norm
+            ddq = (dds - 2 * dq * dnorm - q * ddnorm) / norm
+            result.append(ddq)
+        return result
+
+    def _lever_arm(self, matrices):
+        return np.ascontiguousarray(np.dot(matrices, self.p).T)
+
+    def position(self, times):
+        "(3, N) positions"
+        times = np.atleast_1d(times)
+        positions = self._position_spline(times).T
+        if self.p is not None:
+            positions = positions + self._lever_arm(self.rotation_matrix(times, relative=False))
+        return np.ascontiguousarray(positions)
+
+    def velocity(self, times):
+        "(3, N) velocities"
+        return self.evaluate(times)['velocity']
+
+    def acceleration(self, times):
+        "(3, N) accelerations"
+        return self.evaluate(times)['acceleration']
+
+    def rotation_matrix(self, times, relative=True):
+        "(N, 3, 3) body to world rotation matrices"
+        q, = self._quaternions(np.atleast_1d(times), 0)
+        matrices = quaternions_to_matrices(q)
+        if relative and self.R is not None:
+            matrices = np.dot(matrices, self.R)
+        return matrices
+
+    def rotational_velocity(self, times):
+        "(3, N) world frame rotational velocities"
+        return self.evaluate(times)['rotational_velocity']
+
+    def evaluate(self, times):
+        """All quantities for an array of times, sharing the spline evaluations
+
+        Returns
+        ----------------
+        values : dict
+            position, velocity, acceleration, rotational_velocity and rotational_acceleration
+            as contiguous (3, N) arrays, and rotation as an (N, 3, 3) array of rotation matrices
+        """
+        times = np.atleast_1d(times)
+        q, dq, ddq = self._quaternions(times, 2)
+        # For a unit quaternion q, the world frame rotational velocity is w = 2 dq q*, and
+        # its derivative is 2 ddq q* (the dq dq* term is a scalar)
+        w = 2 * _quaternion_product_conj(dq, q)[:, 1:]
+        alpha = 2 * _quaternion_product_conj(ddq, q)[:, 1:]
+        matrices = quaternions_to_matrices(q)
+        position = self._position_spline(times).T
+        velocity = self._position_spline(times, nu=1).T
+        acceleration = self._position_spline(times, nu=2).T
+        if self.p is not None:
+            r = self._lever_arm(matrices).T
+            position = position + r.T
+            w_r = np.cross(w, r)
+            velocity = velocity + w_r.T
+            acceleration = acceleration + (np.cross(alpha, r) + np.cross(w, w_r)).T
+        if self.R is not None:
+            matrices = np.dot(matrices, self.R)
+        return {'position': np.ascontiguousarray(position),
+                'velocity': np.ascontiguousarray(velocity),
+                'acceleration': np.ascontiguousarray(acceleration),
+                'rotation': np.ascontiguousarray(matrices),
+                'rotational_velocity': np.ascontiguousarray(w.T),
+                'rotational_acceleration': np.ascontiguousarray(alpha.T)}
+
+def _quaternion_product_conj(p, q):
+    "Products p q* of (N, 4) quaternion arrays"
+    pw, px, py, pz = p.T
+    qw, qx, qy, qz = q.T
+    return np.column_stack((pw*qw + px*qx + py*qy + pz*qz,
+                            -pw*qx + px*qw - py*qz + pz*qy,
+                            -pw*qy + px*qz + py*qw - pz*qx,
+                            -pw*qz - px*qy + py*qx + pz*qw))
+
+def quaternions_to_matrices(q):
+    "(N, 3, 3) rotation matrices of (N, 4) unit quaternions (w, x, y, z)"
+    w, x, y, z = q.T
+    matrices = np.empty((q.shape[0], 3, 3))
+    matrices[:, 0, 0] = 1 - 2*(y*y + z*z)
+    matrices[:, 0, 1] = 2*(x*y - w*z)
+    matrices[:, 0, 2] = 2*(x*z + w*y)
+    matrices[:, 1, 0] = 2*(x*y + w*z)
+    matrices[:, 1, 1] = 1 - 2*(x*x + z*z)
+    matrices[:, 1, 2] = 2*(y*z - w*x)
+    matrices[:, 2, 0] = 2*(x*z - w*y)
+    matrices[:, 2, 1] = 2*(y*z + w*x)
+    matrices[:, 2, 2] = 1 - 2*(x*x + y*y)
+    return matrices
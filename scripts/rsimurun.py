@@ -5,32 +5,104 @@ import logging
 import sys
 import os
 
-from rsimusim.simulation import RollingShutterImuSimulation
-
 parser = argparse.ArgumentParser()
 parser.add_argument('config')
-parser.add_argument('out')
+parser.add_argument('out', nargs='?', default=None)
 parser.add_argument('--dataset-dir', default=None)
 parser.add_argument('--loglevel', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
 parser.add_argument('--show-progress', action='store_true')
+parser.add_argument('--chunks', type=int, default=None,
+                    help='Simulate in parallel by splitting the time interval into this many chunks')
+parser.add_argument('--profile', action='store_true',
+                    help='Record phase timings and counters in the results file and print a summary')
+parser.add_argument('--profile-functions', action='store_true',
+                    help='With --profile, also capture function statistics using cProfile')
+parser.add_argument('--telemetry-interval', type=float, default=None,
+                    help='Report throughput every this many seconds')
+parser.add_argument('--telemetry-file', default=None,
+                    help='Append telemetry reports as JSON lines to this file instead of logging them')
+parser.add_argument('--checkpoint', default=None,
+                    help='Checkpoint file, defaults to the output file with .checkpoint appended')
+parser.add_argument('--checkpoint-interval', type=float, default=None,
+                    help='Write a checkpoint every this many seconds')
+parser.add_argument('--resume', action='store_true',
+                    help='Continue from the checkpoint file, if it exists')
+parser.add_argument('--server', nargs='?', const='', default=None, metavar='ADDRESS',
+                    help='Run on a simulation service (see rsimuserve.py), optionally at this address')
+parser.add_argument('--estimate', action='store_true',
+                    help='Only estimate run time, memory and output size of the config')
 args = parser.parse_args()
+if args.out is None and not args.estimate:
+    parser.error('the out argument is required unless --estimate is given')
 
 # Setup logging
 loglevel = getattr(logging, args.loglevel.upper())
 logging.basicConfig(level=loglevel)
 logger = logging.getLogger("rsimurun")
 
+if args.estimate:
+    # Dry run: the config and dataset are loaded, but nothing is simulated
+    from rsimusim.estimate import estimate
+    print(estimate(args.config, datasetdir=args.dataset_dir).summary())
+    sys.exit(0)
 
 if os.path.exists(args.out):
     logger.error('Outfile {} already exists'.format(args.out))
     sys.exit(-1)
 
-logger.info('Simulation configuration: {}'.format(args.config))
-if args.dataset_dir is not None:
-    logger.info('Dataset directory: {}'.format(args.dataset_dir))
-simulator = RollingShutterImuSimulation.from_config(args.config, datasetdir=args.dataset_dir)
-logger.info('Used dataset: {}'.format(simulator.config.dataset_path))
-result = simulator.run(progress=args.show_progress)
-logger.info('Saving results to {}'.format(args.out))
-result.save(args.out)
-logger.info('All done')
\ No newline at end of file
+if args.server is not None:
+    # Client mode: the service loads the dataset and writes the results file
+    from rsimusim.service import submit
+    def log_status(reply):
+        logger.info('Job {}: {}'.format(reply.get('job', '-'), reply['status']))
+    reply = submit(args.config, args.out, address=args.server or None, datasetdir=args.dataset_dir,
+                   callback=log_status)
+    if reply['status'] != 'done':
+        logger.error('Simulation failed: {}'.format(reply.get('error', None)))
+        sys.exit(-1)
+    logger.info('Results saved to {} in {:.1f} seconds'.format(args.out, reply['elapsed']))
+    sys.exit(0)
+
+# Imported after argument parsing, such that --help and argument errors are fast
+from rsimusim.simulation import RollingShutterImuSimulation
+from rsimusim.profiling import Profiler, activate
+from rsimusim.telemetry import Telemetry
+
+checkpoint = args.checkpoint
+if checkpoint is None and (args.checkpoint_interval is not None or args.resume):
+    checkpoint = args.out + '.checkpoint'
+
+def simulate():
+    logger.info('Simulation configuration: {}'.format(args.config))
+    if args.dataset_dir is not None:
+        logger.info('Dataset directory: {}'.format(args.dataset_dir))
+    if args.resume and os.path.exists(checkpoint):
+        logger.info('Resuming from checkpoint {}'.format(checkpoint))
+        simulator = RollingShutterImuSimulation.resume(checkpoint, datasetdir=args.dataset_dir)
+    else:
+        simulator = RollingShutterImuSimulation.from_config(args.config, datasetdir=args.dataset_dir)
+    logger.info('Used dataset: {}'.format(simulator.config.dataset_path))
+    telemetry = None
+    if args.telemetry_interval is not None or args.telemetry_file is not None:
+        interval = 10.0 if args.telemetry_interval is None else args.telemetry_interval
+        telemetry = Telemetry(interval, args.telemetry_file)
+    checkpoint_interval = 600.0 if args.checkpoint_interval is None else args.checkpoint_interval
+    result = simulator.run(progress=args.show_progress, chunks=args.chunks, telemetry=telemetry,
+                           checkpoint=checkpoint, checkpoint_interval=checkpoint_interval)
+    logger.info('Saving results to {}'.format(args.out))
+    result.save(args.out)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.unlink(checkpoint)
+
+if args.profile:
+    profiler = Profiler(capture=args.profile_functions)
+    with activate(profiler):
+        simulate()
+else:
+    simulate()
+logger.info('All done')
+
+if args.profile:
+    print(profiler.summary())
+    if profiler.function_stats is not None:
+        print(profiler.function_stats)
@@ -0,0 +1,28 @@
+from __future__ import print_function, division
+
+import argparse
+import logging
+
+parser = argparse.ArgumentParser(description='Serve simulation jobs, keeping recently used datasets in memory')
+parser.add_argument('--address', default=None,
+                    help='Unix socket path, or host:port to listen on localhost TCP. '
+                         'Defaults to a socket in $XDG_RUNTIME_DIR/rsimusim or ~/.rsimusim')
+parser.add_argument('--processes', type=int, default=None, help='Maximum number of concurrent jobs')
+parser.add_argument('--max-datasets', type=int, default=4, help='Number of datasets to keep in memory')
+parser.add_argument('--loglevel', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+args = parser.parse_args()
+
+# Setup logging
+loglevel = getattr(logging, args.loglevel.upper())
+logging.basicConfig(level=loglevel)
+logger = logging.getLogger("rsimuserve")
+
+# Imported after argument parsing, such that --help and argument errors are fast
+from rsimusim.service import SimulationService
+
+service = SimulationService(args.address, processes=args.processes,
+                            max_datasets=args.max_datasets)
+try:
+    service.serve_forever()
+except KeyboardInterrupt:
+    logger.info('Interrupted')
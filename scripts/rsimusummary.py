@@ -0,0 +1,34 @@
+from __future__ import print_function, division
+
+import argparse
+import logging
+import sys
+import os
+
+parser = argparse.ArgumentParser(description='Summarize many simulation results files into one table')
+parser.add_argument('pattern', nargs='+', help='Glob pattern(s) of results files')
+parser.add_argument('out', help='Output CSV table')
+parser.add_argument('--processes', type=int, default=None)
+parser.add_argument('--loglevel', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+args = parser.parse_args()
+
+# Setup logging
+loglevel = getattr(logging, args.loglevel.upper())
+logging.basicConfig(level=loglevel)
+logger = logging.getLogger("rsimusummary")
+
+if os.path.exists(args.out):
+    logger.error('Outfile {} already exists'.format(args.out))
+    sys.exit(-1)
+
+# Imported after argument parsing, such that --help and argument errors are fast
+from rsimusim.batch import summarize_files, write_summary_table
+
+summaries = summarize_files(args.pattern, processes=args.processes)
+if not summaries:
+    logger.error('No results files matched {}'.format(args.pattern))
+    sys.exit(-1)
+num_failed = sum(1 for s in summaries if s['error'])
+logger.info('Writing {:d} summaries ({:d} failed) to {}'.format(len(summaries), num_failed, args.out))
+write_summary_table(summaries, args.out)
+logger.info('All done')
@@ -0,0 +1,40 @@
+from __future__ import print_function, division
+
+import argparse
+import logging
+import sys
+import os
+
+import yaml
+
+parser = argparse.ArgumentParser(description='Run a parameter sweep over a base simulation configuration')
+parser.add_argument('config', help='Base simulation configuration')
+parser.add_argument('sweep', help='YAML file with a grid and/or a list of variants of config overrides')
+parser.add_argument('outdir')
+parser.add_argument('--dataset-dir', default=None)
+parser.add_argument('--processes', type=int, default=None)
+parser.add_argument('--retries', type=int, default=1)
+parser.add_argument('--loglevel', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+args = parser.parse_args()
+
+# Setup logging
+loglevel = getattr(logging, args.loglevel.upper())
+logging.basicConfig(level=loglevel)
+logger = logging.getLogger("rsimusweep")
+
+if os.path.exists(args.outdir) and os.listdir(args.outdir):
+    logger.error('Output directory {} is not empty'.format(args.outdir))
+    sys.exit(-1)
+
+# Imported after argument parsing, such that --help and argument errors are fast
+from rsimusim.sweep import expand_sweep, run_sweep
+
+with open(args.sweep, 'r') as f:
+    sweep = expand_sweep(yaml.safe_load(f))
+logger.info('Sweep of {:d} variants of {}'.format(len(sweep), args.config))
+index = run_sweep(args.config, sweep, args.outdir, datasetdir=args.dataset_dir,
+                  processes=args.processes, retries=args.retries)
+num_failed = sum(1 for entry in index if entry['status'] != 'ok')
+if num_failed:
+    logger.warning('{:d} of {:d} variants failed'.format(num_failed, len(index)))
+logger.info('All done')
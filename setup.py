@@ -19,7 +19,7 @@ classifiers = [
 
     # Specify the Python versions you support here. In particular, ensure
     # that you indicate whether you support Python 2, Python 3 or both.
-    'Programming Language :: Python :: 2.7',
+    'Programming Language :: Python :: 3',
 ]
 
 keywords = 'rolling-shutter camera imu gyroscope simulation'
@@ -30,9 +30,14 @@ requires = [ 'numpy',
              'crisp',
              'imusim'
 ]
+# rsimusim.rng uses np.random.SeedSequence, which was added in numpy 1.17
+install_requires = ['numpy>=1.17'] + [r for r in requires if r != 'numpy']
 
 scripts = [os.path.join('scripts/', fname) for fname in [
     'rsimurun.py',
+    'rsimusummary.py',
+    'rsimusweep.py',
+    'rsimuserve.py',
 ]]
 
 
@@ -45,7 +50,8 @@ setup(name='rsimusim',
       packages=['rsimusim', 'rsimusim.inertial'],
       scripts=scripts,
       classifiers=classifiers,
-      install_requires=requires,
+      install_requires=install_requires,
+      python_requires='>=3.5',
       requires=requires,
       keywords=keywords,
     )
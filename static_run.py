@@ -1,18 +1,21 @@
 #!/usr/bin/env python
+from __future__ import print_function, division
 
 import time
+import logging
 
 import numpy as np
 #from IPython import embed
 # Import all public symbols from IMUSim
 
-from imusim.behaviours.imu import BasicIMUBehaviour
 from imusim.trajectories.base import StaticTrajectory
 from imusim.simulation.base import Simulation
 
-from rsimusim.mpu9250 import MPU9250IMU
+from rsimusim.inertial import MPU9250IMU, stream_samples
 
 
+logging.basicConfig(level=logging.INFO)
+
 sim = Simulation()
 trajectory = StaticTrajectory()
 #wconst = np.array([0, 1, 0]).reshape(3,1)
@@ -20,27 +23,18 @@ trajectory = StaticTrajectory()
 
 imu = MPU9250IMU(simulation=sim, trajectory=trajectory)
 GYRO_SAMPLE_RATE = 1000.
-dt = 1. / GYRO_SAMPLE_RATE
-
-# Set up a behaviour that runs on the
-# simulated IMU
-behaviour1 = BasicIMUBehaviour(imu=imu, samplingPeriod=dt)
 
-# Set the time inside the simulation
-sim.time = trajectory.startTime
-# Run the simulation till the desired
-# end time
+# Noise processes are generated in blocks and written straight to a
+# memory mapped file, instead of running the simulation event loop
+# once per sample and keeping all samples in memory
 simulation_length = 3600*3
-sim.run(simulation_length)
+num_samples = int(simulation_length * GYRO_SAMPLE_RATE)
+savefilename = 'simulated_gyro.npy'
 
-#plt.figure()
-#plot(imu.gyroscope.rawMeasurements)
-#plt.legend()
-#plt.show()
 t0 = time.time()
-gdata = imu.gyroscope.rawMeasurements.values
-savefilename = 'simulated_gyro.npy'
-np.save(savefilename, gdata)
-save_elapsed = time.time() - t0
-print 'Saved {:d} samples to {}. Saving took {:.2f} seconds'.format(
-    gdata.shape[1], savefilename, save_elapsed)
+# The trajectory is static, so the gyroscope only measures its noise
+stream_samples(imu.gyroscope.block_noise_voltages, savefilename, num_samples, GYRO_SAMPLE_RATE,
+               start_time=trajectory.startTime, progress=True)
+elapsed = time.time() - t0
+print('Saved {:d} samples to {}. Simulation took {:.2f} seconds'.format(
+    num_samples, savefilename, elapsed))
@@ -0,0 +1,62 @@
+from __future__ import print_function, division
+
+import unittest
+import tempfile
+import shutil
+import os
+import logging
+
+logging.disable(logging.CRITICAL)
+
+import numpy as np
+from numpy.testing import assert_equal, assert_almost_equal
+
+from rsimusim.simulation import RollingShutterImuSimulation
+from rsimusim.batch import summarize_files, summarize_results, write_summary_table, SUMMARY_COLUMNS
+
+EXAMPLE_SIMULATION_CONFIG = 'data/config_default.yml'
+
+class BatchSummaryTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.mkdtemp(prefix='batchtests_')
+        sim = RollingShutterImuSimulation.from_config(EXAMPLE_SIMULATION_CONFIG, datasetdir='data/')
+        cls.result = sim.run()
+        cls.paths = [os.path.join(cls.tempdir, 'run_{:d}.h5'.format(i)) for i in range(3)]
+        for path in cls.paths:
+            cls.result.save(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempdir)
+
+    def test_summary_values(self):
+        summary = summarize_results(self.paths[0])
+        expected_counts = [len(obs) for obs in self.result.image_measurements.values]
+        assert_equal(summary['observation_counts'], expected_counts)
+        self.assertEqual(summary['num_frames'], len(self.result.image_measurements))
+        self.assertEqual(summary['num_imu_samples'], len(self.result.gyroscope_measurements))
+        expected_wall_clock = (self.result.time_finished - self.result.time_started).total_seconds()
+        assert_almost_equal(summary['wall_clock'], expected_wall_clock)
+        assert_equal(summary['track_length_histogram'], np.bincount(self.result.landmark_tracks.lengths))
+        assert_almost_equal(summary['gyro_mean_x'], np.mean(self.result.gyroscope_measurements.values[0]))
+
+    def test_summarize_files(self):
+        bad_path = os.path.join(self.tempdir, 'run_bad.h5')
+        with open(bad_path, 'w') as f:
+            f.write('not a results file')
+        try:
+            summaries = summarize_files(os.path.join(self.tempdir, 'run_*.h5'), processes=2)
+        finally:
+            os.unlink(bad_path)
+
+        self.assertEqual([s['path'] for s in summaries], sorted(self.paths + [bad_path]))
+        failed = [s for s in summaries if s['error']]
+        self.assertEqual([s['path'] for s in failed], [bad_path])
+
+        table_path = os.path.join(self.tempdir, 'summary.csv')
+        write_summary_table(summaries, table_path)
+        with open(table_path, 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0].split(','), SUMMARY_COLUMNS)
+        self.assertEqual(len(lines), len(summaries) + 1)
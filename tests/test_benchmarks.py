@@ -0,0 +1,48 @@
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmarks.synthetic import make_dataset, make_config
+from benchmarks.run import compare, run_benchmarks
+
+class SyntheticDatasetTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='benchtests_')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_dataset(self):
+        from rsimusim.dataset import Dataset
+        path = make_dataset(os.path.join(self.workdir, 'synthetic.h5'), 200, 5.0, visibility=1.0)
+        ds = Dataset.from_file(path)
+        self.assertEqual(len(ds.landmarks), 200)
+        visible = ds.visible_landmarks(2.0)
+        self.assertTrue(0 < len(visible) < 200)
+        q = ds.trajectory.rotation(2.0)
+        self.assertAlmostEqual(abs(q), 1.0)
+
+    def test_run_small(self):
+        sizes = {'tiny': {'landmarks': 100, 'duration': 4.0, 'speed': 1.0, 'visibility': 0.5}}
+        report = run_benchmarks(sizes, ['dataset_load', 'camera_sample', 'results_save'], repeat=1,
+                                workdir=self.workdir)
+        self.assertEqual([r['benchmark'] for r in report['results']], ['dataset_load', 'camera_sample', 'results_save'])
+        for record in report['results']:
+            self.assertGreater(record['best'], 0)
+            self.assertEqual(record['size'], 'tiny')
+
+class CompareTests(unittest.TestCase):
+    def test_compare(self):
+        old = {'results': [{'benchmark': 'a', 'size': 'small', 'best': 1.0},
+                           {'benchmark': 'b', 'size': 'small', 'best': 1.0}]}
+        new = {'results': [{'benchmark': 'a', 'size': 'small', 'best': 1.1},
+                           {'benchmark': 'b', 'size': 'small', 'best': 2.0},
+                           {'benchmark': 'c', 'size': 'small', 'best': 1.0}]}
+        rows, regressions = compare(old, new, threshold=1.2)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(regressions, [('b', 'small', 1.0, 2.0, 2.0)])
@@ -0,0 +1,45 @@
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+from rsimusim.buffers import MeasurementBuffer
+
+class MeasurementBufferTests(unittest.TestCase):
+    def test_add_samples(self):
+        buf = MeasurementBuffer(capacity=10)
+        times = np.arange(25) / 10.
+        values = np.random.uniform(size=(3, 25))
+        for t, v in zip(times, values.T):
+            buf.add(t, v.reshape(3,1))
+        self.assertEqual(len(buf), 25)
+        self.assertGreaterEqual(buf.capacity, 25)
+        assert_equal(buf.timestamps, times)
+        assert_equal(buf.values, values)
+        assert_equal(buf.latestValue, values[:, -1:])
+        self.assertEqual(buf.latestTime, times[-1])
+
+    def test_add_block(self):
+        buf = MeasurementBuffer(capacity=4)
+        buf.add(0.0, np.zeros((3,1)))
+        buf.add(np.array([1.0, 2.0, 3.0, 4.0]), np.ones((3, 4)))
+        assert_equal(buf.timestamps, [0., 1., 2., 3., 4.])
+        assert_equal(buf.values[:, 1:], np.ones((3, 4)))
+
+    def test_no_reallocation(self):
+        buf = MeasurementBuffer(capacity=100)
+        storage = buf._values
+        for i in range(100):
+            buf.add(i, np.ones(3))
+        self.assertIs(buf._values, storage)
+        self.assertIs(buf.values.base, storage)
+
+    def test_wrap(self):
+        times = np.arange(5.)
+        values = np.random.uniform(size=(3, 5))
+        buf = MeasurementBuffer.wrap(times, values)
+        self.assertEqual(len(buf), 5)
+        self.assertIs(buf.values.base, values)
+        assert_equal(buf.values, values)
@@ -0,0 +1,40 @@
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from rsimusim.cache import StageCache
+
+class StageCacheTests(unittest.TestCase):
+    def test_memoize(self):
+        cache = StageCache()
+        calls = []
+        def compute():
+            calls.append(1)
+            return len(calls)
+        key = StageCache.make_key('dataset.h5', np.eye(3), np.zeros((3,1)))
+        self.assertEqual(cache.get('trajectory', key, compute), 1)
+        self.assertEqual(cache.get('trajectory', key, compute), 1)
+        self.assertEqual(cache.get('other', key, compute), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_key_depends_on_values(self):
+        R = np.eye(3)
+        key = StageCache.make_key('dataset.h5', R)
+        self.assertEqual(key, StageCache.make_key('dataset.h5', R.copy()))
+        R2 = R.copy()
+        R2[0, 1] = 1e-12
+        self.assertNotEqual(key, StageCache.make_key('dataset.h5', R2))
+        self.assertNotEqual(key, StageCache.make_key('dataset.h5', R.astype('float32')))
+        self.assertNotEqual(StageCache.make_key(1.0, 2.0), StageCache.make_key(2.0, 1.0))
+
+    def test_eviction(self):
+        cache = StageCache(max_entries=2)
+        cache.get('a', 1, lambda: 'a')
+        cache.get('b', 1, lambda: 'b')
+        cache.get('a', 1, lambda: 'new a') # Refresh a
+        cache.get('c', 1, lambda: 'c')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a', 1, lambda: 'new a'), 'a')
+        self.assertEqual(cache.get('b', 1, lambda: 'new b'), 'new b')
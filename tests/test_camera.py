@@ -1,5 +1,6 @@
 from __future__ import print_function, division
 
+import threading
 import unittest
 
 import numpy as np
@@ -10,7 +11,9 @@ from imusim.behaviours.imu import BasicIMUBehaviour
 
 from rsimusim.dataset import Dataset
 from rsimusim.scene import SceneEnvironment
-from rsimusim.camera import CameraPlatform, PinholeModel, BasicCameraBehaviour
+from rsimusim.camera import CameraPlatform, PinholeModel, BasicCameraBehaviour, \
+    FrameObservations, ImageMeasurements, ProjectionPool, ProjectionScheduler, project_linearized, inside_image, \
+    _project_point_rs
 
 CAMERA_MATRIX = np.array(
         [[ 850.051391602,    0.        ,  0],
@@ -54,7 +57,173 @@ class CameraSimulationTest(unittest.TestCase):
                 self.assertTrue(0 <= x < camera.camera_model.columns)
                 self.assertTrue(0 <= y < camera.camera_model.rows)
 
+    def test_frame_arrays(self):
+        stop_time = self.ds.trajectory.startTime + 1.0
+        self.simulation.run(stop_time)
+        camera = self.camera.camera
 
+        for frame, observations in zip(camera.measurements.frames, camera.measurements.values):
+            self.assertEqual(frame.landmarks.dtype, np.int64)
+            self.assertEqual(frame.points.shape, (len(frame), 2))
+            self.assertTrue(frame.points.flags.c_contiguous)
+            self.assertEqual(sorted(observations.keys()), sorted(frame.landmarks.tolist()))
 
+    def test_shared_pool(self):
+        camera = self.camera.camera
+        stop_time = self.ds.trajectory.startTime + 0.5
+        with ProjectionPool(2) as pool:
+            camera.pool = pool
+            camera.start_multiproc()
+            self.simulation.run(stop_time)
+            camera.stop_multiproc()
+            self.assertEqual(pool.alive, 2)
+            self.assertEqual(len(pool.handles), 0)
+            procs = list(pool.procs)
+
+            # A second simulation reuses the running workers
+            expected = camera.measurements.frames
+            self.setUp()
+            camera = self.camera.camera
+            camera.pool = pool
+            self.simulation.run(stop_time)
+            camera.stop_multiproc()
+            self.assertEqual(pool.procs, procs)
+            for frame, expected_frame in zip(camera.measurements.frames, expected):
+                np.testing.assert_equal(frame.points, expected_frame.points)
+        self.assertEqual(pool.alive, 0)
+
+    def test_concurrent_pool_use(self):
+        camera = self.camera.camera
+        trajectory = self.ds.trajectory
+        t = trajectory.startTime + 0.5
+        positions = [lm.position for lm in self.ds.visible_landmarks(t)]
+        expected = np.full((len(positions), 2), np.nan)
+        for i, X in enumerate(positions):
+            im_pt = camera.project_point_rs(X, t)[0]
+            if im_pt is not None:
+                expected[i] = im_pt.ravel()
+
+        with ProjectionPool(2) as pool:
+            handles = [pool.register(camera.camera_model, camera.Rci, camera.pci, trajectory) for _ in range(2)]
+            results = [np.full((len(positions), 2), np.nan) for _ in handles]
+            threads = [threading.Thread(target=pool.project, args=(handle, positions, t, result, 3))
+                       for handle, result in zip(handles, results)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for result in results:
+                np.testing.assert_equal(result, expected)
+            for handle in handles:
+                pool.release(handle)
+        self.assertEqual(pool.alive, 0)
+
+    def test_scheduled_projection(self):
+        camera = self.camera.camera
+        stop_time = self.ds.trajectory.startTime + 0.5
+        self.simulation.run(stop_time)
+        expected = camera.measurements.frames
+
+        for mode, workers in (('parallel', None), ('parallel', 1), ('auto', None)):
+            self.setUp()
+            camera = self.camera.camera
+            camera.scheduler = ProjectionScheduler(mode, workers=workers, chunk_size=7 if mode == 'parallel' else None)
+            self.simulation.run(stop_time)
+            camera.stop_multiproc()
+            self.assertEqual(len(camera.scheduler.decisions), len(expected))
+            if workers is not None:
+                self.assertTrue(all(decision[2] <= workers for decision in camera.scheduler.decisions))
+            for frame, expected_frame in zip(camera.measurements.frames, expected):
+                np.testing.assert_equal(frame.landmarks, expected_frame.landmarks)
+                np.testing.assert_equal(frame.points, expected_frame.points)
+
+    def test_linearized_projection(self):
+        camera = self.camera.camera
+        camera.use_multiproc = False
+        stop_time = self.ds.trajectory.startTime + 0.5
+        self.simulation.run(stop_time)
+        expected = camera.measurements.frames
 
-
+        self.setUp()
+        camera = self.camera.camera
+        camera.use_multiproc = False
+        camera.projection_method = 'linearized'
+        self.simulation.run(stop_time)
+        self.assertEqual(len(camera.measurements), len(expected))
+        for frame, expected_frame in zip(camera.measurements.frames, expected):
+            common, i, j = np.intersect1d(frame.landmarks, expected_frame.landmarks, return_indices=True)
+            self.assertGreaterEqual(len(common), len(expected_frame) - 2)
+            # The exact solver stops within half a row of the root
+            np.testing.assert_array_less(np.linalg.norm(frame.points[i] - expected_frame.points[j], axis=1), 1.0)
+
+    def test_linearized_fallback(self):
+        camera = self.camera.camera
+        t = self.ds.trajectory.startTime + 1.0
+        landmarks = self.ds.visible_landmarks(t)
+        positions = np.array([lm.position for lm in landmarks])
+        args = (camera.camera_model, camera.Rci, camera.pci, self.ds.trajectory)
+        points, fallback, errors = project_linearized(positions, t, *args, max_error=0.5)
+        self.assertEqual(points.shape, (len(landmarks), 2))
+        for point, X in zip(points[~fallback], positions[~fallback]):
+            expected, _ = _project_point_rs(X, t, *args)
+            if expected is None:
+                self.assertTrue(np.all(np.isnan(point)))
+            else:
+                np.testing.assert_array_less(np.abs(point - expected.ravel()), 1.0)
+
+        # Every landmark falls back when no error is accepted
+        _, fallback, _ = project_linearized(positions, t, *args, max_error=-1)
+        self.assertTrue(np.all(fallback))
+
+class ProjectionSchedulerTest(unittest.TestCase):
+    def test_modes(self):
+        self.assertEqual(ProjectionScheduler('serial').plan(0, 10000, 8), (0, None))
+        self.assertEqual(ProjectionScheduler('parallel').plan(0, 3, 8), (3, 1))
+        self.assertEqual(ProjectionScheduler(workers=2, chunk_size=7).plan(0, 1000, 8), (2, 7))
+        self.assertEqual(ProjectionScheduler().plan(0, 0, 8), (0, None))
+        with self.assertRaises(ValueError):
+            ProjectionScheduler('fast')
+
+    def test_adapts_to_costs(self):
+        scheduler = ProjectionScheduler()
+        # Cheap projections and expensive IPC favours serial projection
+        for _ in range(50):
+            scheduler.record_serial(100, 100 * 1e-5)
+            scheduler.record_parallel(100, 4, 1, 4 * 1e-2 + 100 * 1e-5, 100 * 1e-5)
+        self.assertAlmostEqual(scheduler.landmark_cost, 1e-5)
+        self.assertAlmostEqual(scheduler.chunk_overhead, 1e-2, places=5)
+        self.assertEqual(scheduler.plan(0, 1000, 8), (0, None))
+
+        # Expensive projections use all workers for large frames
+        for _ in range(50):
+            scheduler.record_serial(100, 100 * 1e-2)
+        workers, chunk_size = scheduler.plan(1, 1000, 8)
+        self.assertEqual(workers, 8)
+        self.assertEqual(chunk_size, 32)
+        self.assertEqual(len(scheduler.decisions), 2)
+
+class ImageMeasurementsTest(unittest.TestCase):
+    def test_flatten(self):
+        measurements = ImageMeasurements()
+        measurements.add(0.0, FrameObservations(np.array([3, 5], dtype='int64'), np.array([[1., 2.], [3., 4.]])))
+        measurements.add(0.1, FrameObservations(np.empty(0, dtype='int64'), np.empty((0, 2))))
+        measurements.add(0.2, FrameObservations(np.array([5], dtype='int64'), np.array([[5., 6.]])))
+
+        landmarks, frames, times, points = measurements.flatten()
+        np.testing.assert_equal(landmarks, [3, 5, 5])
+        np.testing.assert_equal(frames, [0, 0, 2])
+        np.testing.assert_equal(times, [0.0, 0.0, 0.2])
+        np.testing.assert_equal(points, [[1., 2.], [3., 4.], [5., 6.]])
+
+        self.assertEqual(len(measurements), 3)
+        self.assertEqual(measurements.values[1], {})
+        np.testing.assert_equal(measurements.values[0][5], np.array([[3.], [4.]]))
+        self.assertEqual(len(measurements.values), 3)
+        self.assertEqual([sorted(obs.keys()) for obs in measurements.values], [[3, 5], [], [5]])
+        self.assertEqual(len(measurements.values[1:]), 2)
+
+    def test_inside_image(self):
+        camera_model = PinholeModel(CAMERA_MATRIX, (1920, 1080), 1./35, 30.0)
+        points = np.array([[0., 0.], [1919.5, 1079.5], [1920., 500.], [500., 1080.], [-0.1, 500.], [np.nan, 500.]])
+        # The last column and row are at 1919 and 1079, points on the far edge are outside
+        np.testing.assert_equal(inside_image(points, camera_model), [True, True, False, False, False, False])
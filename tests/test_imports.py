@@ -0,0 +1,21 @@
+from __future__ import print_function, division
+
+import unittest
+
+from benchmarks.imports import time_import
+
+class LazyImportTests(unittest.TestCase):
+    def test_simulation_import(self):
+        _, loaded = time_import('rsimusim.simulation', repeat=1)
+        self.assertNotIn('crisp', loaded)
+        self.assertNotIn('h5py', loaded)
+
+    def test_batch_import(self):
+        # Summaries only read results files, without the simulation stack
+        _, loaded = time_import('rsimusim.batch', repeat=1)
+        self.assertEqual(loaded, ['h5py'])
+
+    def test_light_modules(self):
+        for module in ('rsimusim', 'rsimusim.profiling', 'rsimusim.tracks'):
+            _, loaded = time_import(module, repeat=1)
+            self.assertEqual(loaded, [])
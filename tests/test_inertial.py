@@ -0,0 +1,140 @@
+from __future__ import print_function, division
+
+import unittest
+import tempfile
+import shutil
+import os
+import logging
+
+logging.disable(logging.CRITICAL)
+
+import numpy as np
+import h5py
+from numpy.testing import assert_almost_equal, assert_equal
+
+from rsimusim.simulation import RollingShutterImuSimulation
+from rsimusim.inertial import sample_times, generate_default_imu, stream_samples, MPU9250IMU
+from rsimusim.inertial.mpu9250 import MarkovProc, RWModel, WNModel
+from rsimusim.rng import RandomStreams
+
+class VectorizedImuTests(unittest.TestCase):
+    def test_noisefree_matches_event_loop(self):
+        sim = RollingShutterImuSimulation.from_config('data/config_noisefree.yml', datasetdir='data/')
+        result = sim.run()
+        gyro_ts = result.gyroscope_measurements
+        acc_ts = result.accelerometer_measurements
+
+        acc_fast, gyro_fast = generate_default_imu(sim.imu, gyro_ts.timestamps, sim.environment)
+        assert_almost_equal(gyro_fast.values, gyro_ts.values)
+        assert_almost_equal(acc_fast.values, acc_ts.values)
+
+    def test_sample_times(self):
+        sim = RollingShutterImuSimulation.from_config('data/config_noisefree.yml', datasetdir='data/')
+        result = sim.run()
+        config = sim.config
+        times = sample_times(config.start_time, config.end_time, config.imu_config['sample_rate'])
+        assert_almost_equal(times, result.gyroscope_measurements.timestamps)
+
+    def test_vectorized_simulation(self):
+        sim = RollingShutterImuSimulation.from_config('data/config_vectorized.yml', datasetdir='data/')
+        self.assertIsNone(sim.imu_behaviour)
+        result = sim.run()
+        gyro_ts = result.gyroscope_measurements
+        acc_ts = result.accelerometer_measurements
+        assert_almost_equal(gyro_ts.timestamps[0] - sim.config.start_time, 1. / sim.config.imu_config['sample_rate'])
+        self.assertEqual(gyro_ts.values.shape, (3, len(gyro_ts.timestamps)))
+
+        # Residual against the noise free signals should have the configured noise level
+        noisefree = RollingShutterImuSimulation.from_config('data/config_noisefree.yml', datasetdir='data/')
+        acc_ideal, gyro_ideal = generate_default_imu(noisefree.imu, gyro_ts.timestamps, noisefree.environment)
+        gyro_std = np.std(gyro_ts.values - gyro_ideal.values, axis=1)
+        acc_std = np.std(acc_ts.values - acc_ideal.values, axis=1)
+        assert_almost_equal(gyro_std / sim.config.imu_config['gyroscope']['noise'], 1.0, decimal=1)
+        assert_almost_equal(acc_std / sim.config.imu_config['accelerometer']['noise'].ravel(), 1.0, decimal=1)
+
+class MPU9250BlockTests(unittest.TestCase):
+    def test_block_matches_scalar(self):
+        Ts = 1. / 1000
+        times = Ts * np.arange(1, 5001)
+        process_factories = [
+            lambda: MarkovProc.from_ar1(Ts, 9.999049e-01, 8.030220e-10),
+            lambda: MarkovProc.from_ar1(Ts, 6.211672e-01, 4.546056e-03),
+            lambda: RWModel(1.174606e-11),
+            lambda: WNModel(5.876599e-06),
+        ]
+        for factory in process_factories:
+            np.random.seed(1234)
+            proc = factory()
+            scalar = np.array([proc(t) for t in times])
+            np.random.seed(1234)
+            proc = factory()
+            # Split in two blocks to check that state carries over
+            block = np.hstack((proc.block(times[:1234]), proc.block(times[1234:])))
+            assert_almost_equal(block / np.max(np.abs(scalar)), scalar / np.max(np.abs(scalar)), decimal=10)
+
+    def test_nonuniform_times(self):
+        times = np.cumsum(np.random.uniform(1e-3, 2e-3, size=200))
+        np.random.seed(1234)
+        proc = MarkovProc(0.1, 1.0)
+        scalar = np.array([proc(t) for t in times])
+        np.random.seed(1234)
+        proc = MarkovProc(0.1, 1.0)
+        assert_almost_equal(proc.block(times), scalar)
+
+    def test_gyroscope_block(self):
+        imu = MPU9250IMU()
+        times = np.arange(1, 101) / 1000.
+        noise = imu.gyroscope.block_noise_voltages(times)
+        self.assertEqual(noise.shape, (3, 100))
+        self.assertEqual(imu.gyroscope.noiseVoltages(times[-1] + 1. / 1000).shape, (3, 1))
+
+class SeededImuTests(unittest.TestCase):
+    def run_config(self, path):
+        sim = RollingShutterImuSimulation.from_config(path, datasetdir='data/')
+        return sim.run()
+
+    def test_reproducible(self):
+        r1 = self.run_config('data/config_seeded.yml')
+        r2 = self.run_config('data/config_seeded.yml')
+        assert_equal(r1.gyroscope_measurements.values, r2.gyroscope_measurements.values)
+        assert_equal(r1.accelerometer_measurements.values, r2.accelerometer_measurements.values)
+
+    def test_vectorized_matches_event_loop(self):
+        r_event = self.run_config('data/config_seeded.yml')
+        r_fast = self.run_config('data/config_seeded_vectorized.yml')
+        assert_almost_equal(r_fast.gyroscope_measurements.values, r_event.gyroscope_measurements.values)
+        assert_almost_equal(r_fast.accelerometer_measurements.values, r_event.accelerometer_measurements.values)
+
+    def test_mpu9250_streams(self):
+        times = np.arange(1, 2001) / 1000.
+        imu1 = MPU9250IMU(rng=RandomStreams(99))
+        imu2 = MPU9250IMU(rng=RandomStreams(99))
+        block = np.hstack((imu1.gyroscope.block_noise_voltages(times[:700]),
+                           imu1.gyroscope.block_noise_voltages(times[700:])))
+        scalar = np.hstack([imu2.gyroscope.noiseVoltages(t) for t in times])
+        assert_almost_equal(block / np.max(np.abs(scalar)), scalar / np.max(np.abs(scalar)), decimal=10)
+
+class StreamingTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='streamtests_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_stream_npy(self):
+        path = os.path.join(self.tempdir, 'samples.npy')
+        sample_block = lambda times: np.vstack((times, 2 * times, 3 * times))
+        stream_samples(sample_block, path, 1000, 100., start_time=2.0, block_size=64)
+        data = np.load(path)
+        expected_times = 2.0 + np.arange(1, 1001) / 100.
+        assert_almost_equal(data, sample_block(expected_times))
+
+    def test_stream_hdf5(self):
+        path = os.path.join(self.tempdir, 'samples.h5')
+        imu = MPU9250IMU(rng=RandomStreams(1))
+        stream_samples(imu.gyroscope.block_noise_voltages, path, 1000, 1000., block_size=300)
+
+        expected = MPU9250IMU(rng=RandomStreams(1)).gyroscope.block_noise_voltages(np.arange(1, 1001) / 1000.)
+        with h5py.File(path, 'r') as f:
+            assert_almost_equal(f['data'].value, expected)
+            self.assertEqual(f['data'].attrs['sample_rate'], 1000.)
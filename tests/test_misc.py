@@ -0,0 +1,106 @@
+from __future__ import print_function, division
+
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+import crisp.rotations
+
+from rsimusim.misc import CalibratedGyroStream, slerp_array
+
+class CalibratedGyroStreamTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        dt = 1. / 200
+        self.stream = CalibratedGyroStream.from_data(rng.normal(scale=0.5, size=(1000, 3)))
+        self.stream.timestamps = np.arange(1000) * dt - 0.3
+        self.stream.integrate(dt)
+
+    def test_matches_scalar_slerp(self):
+        q = self.stream.orientations
+        ts = self.stream.timestamps
+        times = np.random.uniform(ts[0], ts[-1], size=100)
+        orientations = self.stream.orientations_at(times)
+        self.assertEqual(orientations.shape, (100, 4))
+        for t, q_t in zip(times, orientations):
+            n = np.flatnonzero(ts > t)[0]
+            tau = (t - ts[n - 1]) / (ts[n] - ts[n - 1])
+            expected = crisp.rotations.slerp(q[n - 1], q[n], tau)
+            assert_almost_equal(q_t, expected)
+            assert_almost_equal(self.stream.orientation_at(t), expected)
+
+    def test_sample_times(self):
+        ts = self.stream.timestamps
+        assert_almost_equal(self.stream.orientations_at(ts), self.stream.orientations)
+
+    def test_out_of_range(self):
+        ts = self.stream.timestamps
+        orientations = self.stream.orientations_at([ts[0] - 1.0, ts[-1] + 1.0])
+        self.assertTrue(np.all(np.isnan(orientations)))
+        with self.assertRaises(ValueError):
+            self.stream.orientation_at(ts[-1] + 1.0)
+
+    def test_short_stream(self):
+        stream = CalibratedGyroStream.from_data(np.zeros((1, 3)))
+        stream.timestamps = np.array([0.5])
+        stream._GyroStream__last_q = np.array([[1., 0, 0, 0]])
+        orientations = stream.orientations_at([0.5, 0.6])
+        assert_equal(orientations[0], [1., 0, 0, 0])
+        self.assertTrue(np.all(np.isnan(orientations[1])))
+        with self.assertRaises(ValueError):
+            stream.orientation_at(0.6)
+
+    def test_slerp_array_shortest_path(self):
+        q1 = np.array([[1., 0, 0, 0]])
+        q2 = -np.array([[np.cos(0.5), np.sin(0.5), 0, 0]])
+        q = slerp_array(q1, q2, np.array([0.5]))
+        assert_almost_equal(q, [[np.cos(0.25), np.sin(0.25), 0, 0]])
+
+class GyroCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='gyrocachetests_')
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        rng = np.random.RandomState(0)
+        np.savetxt(os.path.join(self.directory, 'synthetic_gyro.csv'), rng.normal(size=(2000, 3)), delimiter=',')
+        self.write_params(0.1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_params(self, time_offset):
+        params = [200.0, time_offset, 0.1, -0.2, 0.3, 0.01, 0.02, 0.03]
+        with open(os.path.join(self.directory, 'synthetic_reference.csv'), 'w') as f:
+            f.write(','.join(str(x) for x in params) + '\n')
+
+    def assert_streams_equal(self, s1, s2):
+        assert_equal(s1.data, s2.data)
+        assert_equal(s1.timestamps, s2.timestamps)
+        assert_equal(s1.orientations, s2.orientations)
+        self.assertEqual(s1.params, s2.params)
+
+    def test_cached(self):
+        uncached = CalibratedGyroStream.from_directory(self.directory, 'synthetic', cache_dir=None)
+        first = CalibratedGyroStream.from_directory(self.directory, 'synthetic', cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        second = CalibratedGyroStream.from_directory(self.directory, 'synthetic', cache_dir=self.cache_dir)
+        self.assertIsInstance(second.data, np.memmap)
+        self.assertFalse(second.data.flags.writeable)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_dir).st_mode) & 0o077, 0)
+        self.assert_streams_equal(uncached, first)
+        self.assert_streams_equal(uncached, second)
+        t = second.timestamps[100] + 1e-3
+        assert_almost_equal(second.orientation_at(t), uncached.orientation_at(t))
+
+    def test_invalidation(self):
+        CalibratedGyroStream.from_directory(self.directory, 'synthetic', cache_dir=self.cache_dir)
+        entries = os.listdir(self.cache_dir)
+        self.write_params(0.2)
+        stream = CalibratedGyroStream.from_directory(self.directory, 'synthetic', cache_dir=self.cache_dir)
+        assert_almost_equal(stream.timestamps[0], -0.2)
+        new_entries = os.listdir(self.cache_dir)
+        self.assertEqual(len(new_entries), 1)
+        self.assertNotEqual(entries, new_entries)
@@ -0,0 +1,39 @@
+from __future__ import print_function, division
+
+import time
+import unittest
+
+from rsimusim import profiling
+from rsimusim.profiling import Profiler, activate
+
+class ProfilerTests(unittest.TestCase):
+    def test_inactive(self):
+        self.assertIsNone(profiling.active_profiler())
+        with profiling.phase('load'):
+            profiling.count('frames')
+
+    def test_phases_and_counters(self):
+        profiler = Profiler()
+        with activate(profiler):
+            self.assertIs(profiling.active_profiler(), profiler)
+            for _ in range(3):
+                with profiling.phase('load'):
+                    time.sleep(0.01)
+                    profiling.count('frames', 2)
+        self.assertIsNone(profiling.active_profiler())
+        seconds, calls = profiler.phases['load']
+        self.assertEqual(calls, 3)
+        self.assertGreaterEqual(seconds, 0.03)
+        self.assertEqual(profiler.counters['frames'], 6)
+        self.assertIn('load', profiler.summary())
+
+        restored = Profiler.from_dict(profiler.as_dict())
+        self.assertEqual(restored.phases, profiler.phases)
+        self.assertEqual(restored.counters, profiler.counters)
+
+    def test_capture(self):
+        profiler = Profiler(capture=True)
+        with activate(profiler):
+            sorted(range(1000))
+        self.assertIn('function calls', profiler.function_stats)
+        self.assertIsNone(Profiler().function_stats)
@@ -0,0 +1,53 @@
+from __future__ import print_function, division
+
+import unittest
+import pickle
+
+import numpy as np
+from numpy.testing import assert_equal, assert_almost_equal
+
+from rsimusim.rng import RandomStreams, GaussianNoise
+
+class RandomStreamsTests(unittest.TestCase):
+    def test_chunking_independent(self):
+        streams = RandomStreams(42, block_size=1000)
+        full = streams.standard_normal(('gyroscope', 0), 0, 5500)
+        chunked = RandomStreams(42, block_size=1000)
+        parts = [chunked.standard_normal(('gyroscope', 0), a, b) for a, b in [(0, 999), (999, 1001), (1001, 5500)]]
+        assert_equal(np.hstack(parts), full)
+        singles = [chunked.standard_normal(('gyroscope', 0), i, i + 1)[0] for i in range(1990, 2010)]
+        assert_equal(singles, full[1990:2010])
+
+    def test_same_seed(self):
+        a = RandomStreams(1).standard_normal(('accelerometer', 2), 100, 200)
+        b = RandomStreams(1).standard_normal(('accelerometer', 2), 100, 200)
+        c = RandomStreams(2).standard_normal(('accelerometer', 2), 100, 200)
+        assert_equal(a, b)
+        self.assertFalse(np.array_equal(a, c))
+
+    def test_independent_keys(self):
+        streams = RandomStreams(1)
+        x = streams.standard_normal(('gyroscope', 0), 0, 20000)
+        y = streams.standard_normal(('gyroscope', 1), 0, 20000)
+        self.assertLess(abs(np.corrcoef(x, y)[0, 1]), 0.05)
+        assert_almost_equal(np.std(x), 1.0, decimal=1)
+
+    def test_pickle(self):
+        streams = RandomStreams(5)
+        expected = streams.standard_normal(('a',), 0, 10)
+        loaded = pickle.loads(pickle.dumps(streams))
+        assert_equal(loaded.standard_normal(('a',), 0, 10), expected)
+
+    def test_stream(self):
+        streams = RandomStreams(3, block_size=100)
+        stream = streams.stream('mpu9250_gyroscope', 0, 1)
+        values = [stream.normal(scale=2.0) for _ in range(50)] + list(stream.normal(scale=2.0, size=150))
+        expected = 2.0 * streams.standard_normal(('mpu9250_gyroscope', 0, 1), 0, 200)
+        assert_almost_equal(values, expected)
+
+    def test_gaussian_noise(self):
+        scale = np.array([1.0, 2.0, 3.0]).reshape(3,1)
+        noise = GaussianNoise(RandomStreams(7), 'accelerometer', scale)
+        samples = noise.samples(10, 20000)
+        self.assertEqual(samples.shape, (3, 20000))
+        assert_almost_equal(np.std(samples, axis=1) / scale.ravel(), 1.0, decimal=1)
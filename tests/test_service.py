@@ -0,0 +1,104 @@
+from __future__ import print_function, division
+
+import os
+import stat
+import shutil
+import tempfile
+import threading
+import unittest
+
+from numpy.testing import assert_equal
+
+from rsimusim.service import SimulationService, LRUDict, parse_address, submit, service_status, shutdown_service, \
+    runtime_dir, default_address, load_authkey
+from rsimusim.simulation import SimulationResults
+
+class SimulationServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp(prefix='servicetests_')
+        self.old_runtime_dir = os.environ.get('XDG_RUNTIME_DIR', None)
+        os.environ['XDG_RUNTIME_DIR'] = self.outdir
+        self.address = default_address()
+        self.service = SimulationService(processes=2)
+        self.thread = threading.Thread(target=self.service.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            shutdown_service(self.address)
+        self.thread.join()
+        if self.old_runtime_dir is None:
+            del os.environ['XDG_RUNTIME_DIR']
+        else:
+            os.environ['XDG_RUNTIME_DIR'] = self.old_runtime_dir
+        shutil.rmtree(self.outdir)
+
+    def test_jobs_share_dataset(self):
+        outputs = [os.path.join(self.outdir, 'result_{:d}.h5'.format(i)) for i in range(2)]
+        for out in outputs:
+            reply = submit('data/config_seeded_vectorized.yml', out, address=self.address, datasetdir='data/')
+            self.assertEqual(reply['status'], 'done', reply['error'])
+
+        status = service_status(self.address)
+        self.assertEqual(len(status['datasets']), 1)
+        self.assertGreater(status['cache_hits'], 0)
+        self.assertEqual(sorted(status['jobs'].values()), ['done', 'done'])
+
+        result1, result2 = [SimulationResults.from_file(out) for out in outputs]
+        assert_equal(result1.gyroscope_measurements.values, result2.gyroscope_measurements.values)
+        assert_equal(result1.image_measurements.timestamps, result2.image_measurements.timestamps)
+
+    def test_failed_job(self):
+        reply = submit('data/config_bad_rotation.yml', os.path.join(self.outdir, 'bad.h5'), address=self.address,
+                       datasetdir='data/')
+        self.assertEqual(reply['status'], 'failed')
+        self.assertIn('ValueError', reply['error'])
+
+    def test_shutdown(self):
+        self.assertEqual(shutdown_service(self.address)['status'], 'ok')
+        self.thread.join()
+        self.assertFalse(os.path.exists(self.address))
+
+    def test_wrong_authkey(self):
+        with self.assertRaises(Exception):
+            service_status(self.address, authkey=b'rsimusim')
+        self.assertEqual(service_status(self.address)['status'], 'ok')
+
+class ServiceHelperTests(unittest.TestCase):
+    def test_lru_dict(self):
+        d = LRUDict(2)
+        d['a'] = 1
+        d['b'] = 2
+        d['a']
+        d['c'] = 3
+        self.assertEqual(list(d.keys()), ['a', 'c'])
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('localhost:5000'), ('localhost', 5000))
+        self.assertEqual(parse_address(':5000'), ('localhost', 5000))
+        self.assertEqual(parse_address('127.0.0.1:5000'), ('127.0.0.1', 5000))
+        self.assertEqual(parse_address('/tmp/rsimusim.sock'), '/tmp/rsimusim.sock')
+        for address in ('0.0.0.0:5000', 'example.com:5000', ('192.168.1.1', 5000)):
+            with self.assertRaises(ValueError):
+                parse_address(address)
+
+    def test_private_files(self):
+        tempdir = tempfile.mkdtemp(prefix='servicetests_')
+        old_runtime_dir = os.environ.get('XDG_RUNTIME_DIR', None)
+        os.environ['XDG_RUNTIME_DIR'] = tempdir
+        try:
+            path = runtime_dir()
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+            key = load_authkey()
+            self.assertEqual(load_authkey(), key)
+            keyfile = os.path.join(path, 'authkey')
+            self.assertEqual(stat.S_IMODE(os.stat(keyfile).st_mode), 0o600)
+            os.chmod(keyfile, 0o644)
+            with self.assertRaises(RuntimeError):
+                load_authkey()
+        finally:
+            if old_runtime_dir is None:
+                del os.environ['XDG_RUNTIME_DIR']
+            else:
+                os.environ['XDG_RUNTIME_DIR'] = old_runtime_dir
+            shutil.rmtree(tempdir)
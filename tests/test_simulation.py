@@ -1,22 +1,32 @@
 from __future__ import print_function, division
 
+import io
 import unittest
 import tempfile
+import contextlib
 import time
 import datetime
 import os
+import json
 import logging
 
 # Disable log output for now
 logging.disable(logging.CRITICAL)
 
 import numpy as np
+import yaml
+from imusim.utilities.time_series import TimeSeries
 from numpy.testing import assert_almost_equal, assert_equal, assert_array_less
 
 from rsimusim.simulation import RollingShutterImuSimulation, SimulationResults, transform_trajectory
 from rsimusim.inertial import DefaultIMU
 from crisp.camera import AtanCameraModel
-from rsimusim.camera import PinholeModel
+from rsimusim.camera import PinholeModel, frame_times, _project_point_rs
+from rsimusim.cache import StageCache
+from rsimusim.trajectory import RelativePoseTrajectory
+from rsimusim.profiling import Profiler, activate
+from rsimusim.telemetry import Telemetry
+from rsimusim.estimate import estimate
 
 from .helpers import assert_timeseries_equal, random_orientation, random_position
 
@@ -168,6 +178,33 @@ class SimulationTests(unittest.TestCase):
         assert_almost_equal(imu_config['gyroscope']['noise'], expected_gyro_noise)
         assert_almost_equal(imu_config['gyroscope']['bias'], expected_gyro_bias)
 
+    def test_load_projection(self):
+        self.assertEqual(self.sim.config.projection, {'mode': 'auto', 'method': 'exact', 'max_error': 0.5,
+                                                      'refit_spline': False})
+        with open(EXAMPLE_SIMULATION_CONFIG) as f:
+            conf = yaml.safe_load(f)
+        conf['camera']['projection'] = {'mode': 'parallel', 'workers': 2, 'chunk_size': 10}
+        sim = RollingShutterImuSimulation.from_config_text(yaml.safe_dump(conf), datasetdir='data/')
+        scheduler = sim.camera.camera.scheduler
+        self.assertEqual((scheduler.mode, scheduler.workers, scheduler.chunk_size), ('parallel', 2, 10))
+        self.assertEqual(sim.camera.camera.projection_method, 'exact')
+
+        conf['camera']['projection'] = {'method': 'linearized', 'max_error': 0.1}
+        sim = RollingShutterImuSimulation.from_config_text(yaml.safe_dump(conf), datasetdir='data/')
+        self.assertEqual(sim.camera.camera.projection_method, 'linearized')
+        self.assertEqual(sim.camera.camera.max_projection_error, 0.1)
+        self.assertIsNone(sim.camera.camera.evaluator)
+
+        conf['camera']['projection'] = {'method': 'linearized', 'refit_spline': True}
+        sim = RollingShutterImuSimulation.from_config_text(yaml.safe_dump(conf), datasetdir='data/')
+        self.assertIs(sim.camera.camera.evaluator, sim.trajectory_evaluator)
+
+        for projection in ({'mode': 'fast'}, {'workers': 0}, {'chunk_size': 2.5}, {'method': 'fast'},
+                           {'max_error': 0}, {'refit_spline': True}):
+            conf['camera']['projection'] = projection
+            with self.assertRaises(ValueError):
+                RollingShutterImuSimulation.from_config_text(yaml.safe_dump(conf), datasetdir='data/')
+
     def test_load_imu(self):
         self.assertEqual(self.sim.imu.__class__, DefaultIMU)
 
@@ -210,6 +247,29 @@ class SimulationTests(unittest.TestCase):
         self.assertLess(np.abs(acc_duration - expected_duration), 2. / self.sim.config.imu_config['sample_rate'] + eps)
         assert_almost_equal(acc_ts.timestamps, gyro_ts.timestamps)
 
+        # IMU measurements are imusim time series, which can be interpolated
+        self.assertIsInstance(gyro_ts, TimeSeries)
+        self.assertIsInstance(acc_ts, TimeSeries)
+        assert_almost_equal(gyro_ts(gyro_ts.timestamps[1]), gyro_ts.values[:, 1:2])
+
+    def test_linearized_simulation(self):
+        with open(EXAMPLE_SIMULATION_CONFIG) as f:
+            conf = yaml.safe_load(f)
+        conf['camera']['projection'] = {'method': 'linearized', 'max_error': 0.5}
+        sim = RollingShutterImuSimulation.from_config_text(yaml.safe_dump(conf), datasetdir='data/')
+        results = sim.run()
+
+        # Linearized on the simulated trajectory, the points stay close to the exact projection
+        camera = sim.camera.camera
+        positions = {lm.id: lm.position for lm in sim.config.dataset.landmarks}
+        for t, frame in list(zip(results.image_measurements.timestamps, results.image_measurements.frames))[:10]:
+            for landmark_id, point in zip(frame.landmarks, frame.points):
+                expected, _ = _project_point_rs(positions[landmark_id], t, camera.camera_model, camera.Rci, camera.pci,
+                                                results.trajectory)
+                self.assertIsNotNone(expected)
+                # The exact solver stops within half a row of the root
+                self.assertLess(np.linalg.norm(point - expected.ravel()), 1.0)
+
     def test_save_simulation(self):
         result = self.sim.run()
         fname = self.get_temp()
@@ -236,3 +296,188 @@ class SimulationTests(unittest.TestCase):
 
         self.assert_image_obs_equal(loaded.image_measurements, result.image_measurements)
 
+    def test_save_relative_pose_trajectory(self):
+        result = self.sim.run()
+        self.assertIsInstance(result.trajectory, RelativePoseTrajectory)
+        fname = self.get_temp()
+        result.save(fname)
+
+        loaded = SimulationResults.from_file(fname)
+        self.assertIsInstance(loaded.trajectory, RelativePoseTrajectory)
+        assert_equal(loaded.trajectory.R, result.trajectory.R)
+        assert_equal(loaded.trajectory.p, result.trajectory.p)
+        test_times = np.random.uniform(loaded.trajectory.startTime, loaded.trajectory.endTime, size=100)
+        assert_almost_equal(loaded.trajectory.position(test_times), result.trajectory.position(test_times), decimal=12)
+        assert_almost_equal(loaded.trajectory.rotation(test_times).array, result.trajectory.rotation(test_times).array,
+                            decimal=12)
+
+    def test_save_landmark_tracks(self):
+        result = self.sim.run()
+        fname = self.get_temp()
+        result.save(fname, include_tracks=True)
+
+        loaded = SimulationResults.from_file(fname)
+        tracks = result.landmark_tracks
+        loaded_tracks = loaded.landmark_tracks
+        assert_equal(loaded_tracks.landmark_ids, tracks.landmark_ids)
+        assert_equal(loaded_tracks.offsets, tracks.offsets)
+        assert_equal(loaded_tracks.frames, tracks.frames)
+        assert_equal(loaded_tracks.times, tracks.times)
+        assert_equal(loaded_tracks.measurements, tracks.measurements)
+
+        num_observations = sum(len(obs) for obs in result.image_measurements.values)
+        self.assertEqual(tracks.lengths.sum(), num_observations)
+
+    def test_save_profile(self):
+        profiler = Profiler()
+        with activate(profiler):
+            sim = RollingShutterImuSimulation.from_config(EXAMPLE_SIMULATION_CONFIG, datasetdir='data/')
+            result = sim.run()
+            self.assertIs(result.profile, profiler)
+            fname = self.get_temp()
+            result.save(fname)
+
+        for name in ('config', 'dataset_load', 'spline_fit', 'trajectory_transform', 'simulate',
+                     'visibility', 'projection', 'save'):
+            self.assertIn(name, profiler.phases)
+        counters = profiler.counters
+        self.assertEqual(counters['frames'], len(result.image_measurements))
+        self.assertEqual(counters['landmarks_projected'] + counters['landmarks_rejected'],
+                         counters['landmarks_considered'])
+        self.assertGreater(counters['brentq_iterations'], counters['landmarks_projected'])
+        self.assertEqual(counters['imu_samples'], len(result.gyroscope_measurements.timestamps))
+
+        loaded = SimulationResults.from_file(fname)
+        self.assertEqual(dict(loaded.profile.counters), dict(counters))
+        assert_almost_equal(loaded.profile.phases['save'][0], profiler.phases['save'][0])
+        self.assertIsNone(self.sim.run().profile)
+
+    def test_telemetry(self):
+        fname = self.get_temp()
+        telemetry = Telemetry(interval=0.1, path=fname)
+        result = self.sim.run(telemetry=telemetry)
+        with open(fname) as f:
+            reports = [json.loads(line) for line in f]
+        self.assertGreaterEqual(len(reports), 1)
+        self.assertEqual(reports, telemetry.reports)
+        last = reports[-1]
+        self.assertEqual(last['frames'], len(result.image_measurements))
+        assert_almost_equal(last['progress'], 1.0)
+        self.assertIsNone(last['current_frame_seconds'])
+        for key in ('frames_per_second', 'landmarks_per_second', 'imu_samples_per_second', 'worker_utilization',
+                    'queue_depth', 'eta_seconds'):
+            self.assertIn(key, last)
+
+    def test_estimate(self):
+        cost = estimate(EXAMPLE_SIMULATION_CONFIG, datasetdir='data/')
+        self.sim.camera.camera.use_multiproc = False
+        result = self.sim.run()
+        self.assertEqual(cost.frames, len(result.image_measurements))
+        self.assertEqual(cost.imu_samples, len(result.gyroscope_measurements.timestamps))
+        dataset = self.sim.config.dataset
+        considered = sum(len(dataset.visible_landmarks(t)) for t in result.image_measurements.timestamps)
+        self.assertEqual(cost.landmarks_considered, considered)
+        observations = sum(len(frame) for frame in result.image_measurements.frames)
+        self.assertLess(abs(cost.landmarks_projected - observations), 0.2 * considered)
+        self.assertGreater(cost.seconds, 0)
+        self.assertGreater(cost.memory_bytes, 0)
+
+        fname = self.get_temp()
+        result.save(fname)
+        assert_almost_equal(cost.file_bytes / os.path.getsize(fname), 1.0, decimal=1)
+
+        # The linearized method is calibrated as configured, with root solving only for fallbacks
+        with open(EXAMPLE_SIMULATION_CONFIG) as f:
+            conf = yaml.safe_load(f)
+        conf['camera']['projection'] = {'method': 'linearized'}
+        config_path = self.get_temp()
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(conf, f)
+        linearized = estimate(config_path, datasetdir='data/')
+        self.assertEqual(linearized.landmarks_considered, cost.landmarks_considered)
+        self.assertLess(linearized.brentq_iterations, cost.brentq_iterations)
+
+    def test_resume_checkpoint(self):
+        for config in (EXAMPLE_SIMULATION_CONFIG, 'data/config_seeded.yml'):
+            np.random.seed(123)
+            expected = RollingShutterImuSimulation.from_config(config, datasetdir='data/').run()
+
+            # Interrupted run, which checkpoints after every segment
+            np.random.seed(123)
+            sim = RollingShutterImuSimulation.from_config(config, datasetdir='data/')
+            sim.simulation.time = sim.config.start_time
+            checkpoint = self.get_temp()
+            t0 = datetime.datetime.now()
+            sim._simulate_until(sim.config.start_time + 0.5, False, checkpoint, 0.0, t0)
+            np.random.seed(321) # State after the checkpoint must not matter
+
+            resumed = RollingShutterImuSimulation.resume(checkpoint, datasetdir='data/')
+            assert_almost_equal(resumed.simulation.time, sim.simulation.time)
+            result = resumed.run()
+            self.assertEqual(result.time_started, t0)
+            self.assert_image_obs_equal(result.image_measurements, expected.image_measurements)
+            assert_timeseries_equal(result.gyroscope_measurements, expected.gyroscope_measurements)
+            assert_timeseries_equal(result.accelerometer_measurements, expected.accelerometer_measurements)
+
+    def test_chunked_simulation(self):
+        serial = RollingShutterImuSimulation.from_config('data/config_seeded.yml', datasetdir='data/').run()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            chunked = RollingShutterImuSimulation.from_config('data/config_seeded.yml',
+                                                              datasetdir='data/').run(chunks=3, progress=True)
+        self.assertIn('3/3 chunks', output.getvalue())
+
+        assert_almost_equal(chunked.image_measurements.timestamps, serial.image_measurements.timestamps)
+        for obs1, obs2 in zip(chunked.image_measurements.values, serial.image_measurements.values):
+            self.assertEqual(sorted(obs1.keys()), sorted(obs2.keys()))
+            for key in obs1:
+                assert_almost_equal(obs1[key], obs2[key], decimal=3)
+
+        for ts_chunked, ts_serial in [(chunked.gyroscope_measurements, serial.gyroscope_measurements),
+                                      (chunked.accelerometer_measurements, serial.accelerometer_measurements)]:
+            assert_almost_equal(ts_chunked.timestamps, ts_serial.timestamps)
+            assert_almost_equal(ts_chunked.values, ts_serial.values)
+
+    def test_frame_times(self):
+        result = self.sim.run()
+        camera_model = self.sim.config.camera_model
+        times = frame_times(self.sim.config.start_time, self.sim.config.end_time,
+                            camera_model.frame_rate, camera_model.readout)
+        assert_almost_equal(times, result.image_measurements.timestamps)
+
+
+class StageCacheSimulationTests(unittest.TestCase):
+    def test_shared_stages(self):
+        cache = StageCache()
+        sim1 = RollingShutterImuSimulation.from_config('data/config_vectorized.yml', datasetdir='data/', cache=cache)
+        sim2 = RollingShutterImuSimulation.from_config('data/config_seeded_vectorized.yml', datasetdir='data/',
+                                                       cache=cache)
+        self.assertIs(sim1.simulation_trajectory, sim2.simulation_trajectory)
+        self.assertIs(sim1.environment.visibility_cache, sim2.environment.visibility_cache)
+
+        result1 = sim1.run()
+        result2 = sim2.run()
+        self.assertEqual(len(sim1.environment.visibility_cache), len(result1.image_measurements))
+        self.assertIs(sim1.noise_free_imu_signals()[1], sim2.noise_free_imu_signals()[1])
+        self.assert_obs_equal(result1.image_measurements, result2.image_measurements)
+
+    def assert_obs_equal(self, im1, im2):
+        assert_equal(im1.timestamps, im2.timestamps)
+        for f1, f2 in zip(im1.frames, im2.frames):
+            assert_equal(f1.landmarks, f2.landmarks)
+            assert_equal(f1.points, f2.points)
+
+    def test_imu_realizations(self):
+        seeded = RollingShutterImuSimulation.from_config('data/config_seeded_vectorized.yml', datasetdir='data/')
+        expected = seeded.run()
+        sim = RollingShutterImuSimulation.from_config('data/config_vectorized.yml', datasetdir='data/')
+        unseeded = sim.run()
+        realizations = sim.imu_realizations([1234, 1, 2])
+        self.assertEqual(len(realizations), 3)
+        # The simulation keeps its own noise realization
+        assert_equal(sim.imu.gyroscope.rawMeasurements.values, unseeded.gyroscope_measurements.values)
+        assert_equal(sim.imu.accelerometer.rawMeasurements.values, unseeded.accelerometer_measurements.values)
+        acc, gyro = realizations[0]
+        assert_equal(gyro.values, expected.gyroscope_measurements.values)
+        assert_equal(acc.values, expected.accelerometer_measurements.values)
+        self.assertFalse(np.array_equal(realizations[1][1].values, realizations[2][1].values))
@@ -0,0 +1,61 @@
+from __future__ import print_function, division
+
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import logging
+
+logging.disable(logging.CRITICAL)
+
+import yaml
+
+from rsimusim.sweep import expand_sweep, set_config_value, run_sweep, INDEX_FILENAME
+from rsimusim.simulation import SimulationResults
+
+EXAMPLE_SIMULATION_CONFIG = 'data/config_default.yml'
+
+class SweepSpecTests(unittest.TestCase):
+    def test_grid(self):
+        sweep = expand_sweep({'grid': {'camera.readout': [0.01, 0.02], 'seed': [1, 2, 3]}})
+        self.assertEqual(len(sweep), 6)
+        self.assertIn({'camera.readout': 0.02, 'seed': 3}, sweep)
+
+    def test_variants_and_grid(self):
+        sweep = expand_sweep({'variants': [{'imu.gyroscope.noise': 0.1}, {'imu.gyroscope.noise': 0.2}],
+                              'grid': {'seed': [1, 2]}})
+        self.assertEqual(len(sweep), 4)
+        self.assertIn({'imu.gyroscope.noise': 0.2, 'seed': 1}, sweep)
+
+    def test_set_config_value(self):
+        conf = {'imu': {'gyroscope': {'noise': 1.0}}}
+        set_config_value(conf, 'imu.gyroscope.noise', 2.0)
+        set_config_value(conf, 'dataset.start', 5.5)
+        self.assertEqual(conf, {'imu': {'gyroscope': {'noise': 2.0}}, 'dataset': {'start': 5.5}})
+
+class SweepRunTests(unittest.TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp(prefix='sweeptests_')
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def test_run_sweep(self):
+        sweep = [{'dataset.end': 6.0, 'seed': 1},
+                 {'dataset.end': 6.0, 'camera.readout': 0.02},
+                 {'dataset.end': 6.0, 'camera.type': 'nosuchmodel'}]
+        index = run_sweep(EXAMPLE_SIMULATION_CONFIG, sweep, self.outdir, datasetdir='data/', processes=2, retries=1)
+
+        self.assertEqual([entry['status'] for entry in index], ['ok', 'ok', 'failed'])
+        self.assertEqual(index[2]['attempts'], 2)
+        self.assertFalse(os.path.exists(index[2]['output']))
+
+        result = SimulationResults.from_file(index[1]['output'])
+        conf = yaml.safe_load(result.config_text)
+        self.assertEqual(conf['camera']['readout'], 0.02)
+        self.assertEqual(conf['dataset']['end'], 6.0)
+
+        with open(os.path.join(self.outdir, INDEX_FILENAME), 'r') as f:
+            saved_index = json.load(f)
+        self.assertEqual([entry['overrides'] for entry in saved_index['variants']], sweep)
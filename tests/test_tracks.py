@@ -0,0 +1,66 @@
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+from rsimusim.tracks import LandmarkTracks
+
+class TimeSeriesStub(object):
+    def __init__(self, timestamps, values):
+        self.timestamps = timestamps
+        self.values = values
+
+def random_observations(num_frames=40, num_landmarks=30, p_visible=0.3):
+    timestamps = np.arange(num_frames) / 30.
+    frames = []
+    for _ in range(num_frames):
+        ids = np.flatnonzero(np.random.uniform(size=num_landmarks) < p_visible)
+        frames.append({lm_id: np.random.uniform(0, 1000, size=(2,1)) for lm_id in ids})
+    return TimeSeriesStub(timestamps, frames)
+
+class LandmarkTracksTests(unittest.TestCase):
+    def setUp(self):
+        self.image_ts = random_observations()
+        self.tracks = LandmarkTracks.from_timeseries(self.image_ts)
+
+    def test_tracks_match_frames(self):
+        for lm_id in self.tracks.landmark_ids:
+            frames, times, measurements = self.tracks.track(lm_id)
+            expected_frames = [i for i, obs in enumerate(self.image_ts.values) if lm_id in obs]
+            assert_equal(frames, expected_frames)
+            assert_equal(times, self.image_ts.timestamps[expected_frames])
+            for framenum, ip in zip(frames, measurements):
+                assert_equal(ip, self.image_ts.values[framenum][lm_id].ravel())
+
+    def test_all_landmarks_indexed(self):
+        expected = set()
+        for obs in self.image_ts.values:
+            expected.update(obs.keys())
+        self.assertEqual(set(self.tracks.landmark_ids), expected)
+        self.assertEqual(self.tracks.lengths.sum(), sum(len(obs) for obs in self.image_ts.values))
+
+    def test_missing_landmark(self):
+        self.assertFalse(12345 in self.tracks)
+        with self.assertRaises(KeyError):
+            self.tracks.track(12345)
+
+    def test_longer_than(self):
+        k = 10
+        expected = [lm_id for lm_id in self.tracks.landmark_ids if len(self.tracks.track(lm_id)[0]) > k]
+        assert_equal(self.tracks.longer_than(k), expected)
+
+    def test_alive_between(self):
+        t0, t1 = 0.2, 0.5
+        expected = set()
+        for t, obs in zip(self.image_ts.timestamps, self.image_ts.values):
+            if t0 <= t <= t1:
+                expected.update(obs.keys())
+        self.assertEqual(set(self.tracks.alive_between(t0, t1)), expected)
+
+    def test_empty(self):
+        tracks = LandmarkTracks.from_timeseries(TimeSeriesStub(np.arange(3.), [{}, {}, {}]))
+        self.assertEqual(len(tracks), 0)
+        self.assertEqual(len(tracks.longer_than(0)), 0)
+        self.assertEqual(len(tracks.alive_between(0, 10)), 0)
@@ -0,0 +1,103 @@
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+from rsimusim.dataset import Dataset
+from rsimusim.simulation import transform_trajectory
+from rsimusim.trajectory import RelativePoseTrajectory, TrajectoryEvaluator
+from rsimusim.inertial import ideal_imu_signals
+
+from .helpers import random_orientation, random_position
+
+class RelativePoseTrajectoryTests(unittest.TestCase):
+    def setUp(self):
+        self.parent = Dataset.from_file('data/example_dataset.h5').trajectory
+        self.R = np.array(random_orientation().toMatrix())
+        self.p = random_position().reshape(3,1) / 10
+        self.trajectory = RelativePoseTrajectory(self.parent, self.R, self.p)
+        self.times = np.linspace(self.parent.startTime + 1.0, self.parent.endTime - 1.0, num=50)
+
+    def test_pose(self):
+        for t in self.times:
+            R1 = np.array(self.parent.rotation(t).toMatrix())
+            R2 = np.array(self.trajectory.rotation(t).toMatrix())
+            assert_almost_equal(R2, R1 @ self.R)
+            assert_almost_equal(self.trajectory.position(t), self.parent.position(t) + R1 @ self.p)
+        self.assertEqual(self.trajectory.startTime, self.parent.startTime)
+        self.assertEqual(self.trajectory.endTime, self.parent.endTime)
+
+    def test_vectorized(self):
+        positions = self.trajectory.position(self.times)
+        rotations = self.trajectory.rotation(self.times)
+        velocities = self.trajectory.velocity(self.times)
+        accelerations = self.trajectory.acceleration(self.times)
+        for i, t in enumerate(self.times):
+            assert_almost_equal(positions[:, i:i+1], self.trajectory.position(t))
+            assert_almost_equal(rotations[i].toMatrix(), self.trajectory.rotation(t).toMatrix())
+            assert_almost_equal(velocities[:, i:i+1], self.trajectory.velocity(t))
+            assert_almost_equal(accelerations[:, i:i+1], self.trajectory.acceleration(t))
+
+    def test_derivatives(self):
+        dt = 1e-4
+        for t in self.times:
+            velocity = (self.trajectory.position(t + dt) - self.trajectory.position(t - dt)) / (2 * dt)
+            assert_almost_equal(self.trajectory.velocity(t), velocity, decimal=3)
+            acceleration = (self.trajectory.velocity(t + dt) - self.trajectory.velocity(t - dt)) / (2 * dt)
+            assert_almost_equal(self.trajectory.acceleration(t), acceleration, decimal=2)
+
+    def test_matches_refit(self):
+        refit = transform_trajectory(self.parent, self.R, self.p, refit=True)
+        sampled = self.trajectory.sampled
+        assert_almost_equal(sampled.positionKeyFrames.values, refit.sampled.positionKeyFrames.values)
+        assert_equal(sampled.rotationKeyFrames.timestamps, refit.sampled.rotationKeyFrames.timestamps)
+        for t in self.times:
+            assert_almost_equal(self.trajectory.position(t), refit.position(t), decimal=2)
+            assert_almost_equal(self.trajectory.rotation(t).toMatrix(), refit.rotation(t).toMatrix(), decimal=2)
+
+class TrajectoryEvaluatorTests(unittest.TestCase):
+    def setUp(self):
+        self.parent = Dataset.from_file('data/example_dataset.h5').trajectory
+        self.times = np.linspace(self.parent.startTime + 1.0, self.parent.endTime - 1.0, num=200)
+
+    def assert_matches_imusim(self, trajectory):
+        # The evaluator refits the splines, so it agrees with imusim within the interpolation error
+        evaluator = TrajectoryEvaluator.from_trajectory(trajectory)
+        values = evaluator.evaluate(self.times)
+        assert_almost_equal(values['position'], trajectory.position(self.times), decimal=4)
+        assert_almost_equal(values['velocity'], trajectory.velocity(self.times), decimal=3)
+        rotations = trajectory.rotation(self.times)
+        for i, q in enumerate(rotations):
+            assert_almost_equal(values['rotation'][i], q.toMatrix(), decimal=3)
+        w = trajectory.rotationalVelocity(self.times)
+        error = np.linalg.norm(values['rotational_velocity'] - w, axis=0)
+        self.assertLess(np.max(error), 0.1 * np.max(np.linalg.norm(w, axis=0)))
+        for key in ('position', 'rotation', 'rotational_velocity'):
+            self.assertTrue(values[key].flags['C_CONTIGUOUS'])
+
+    def test_matches_imusim(self):
+        self.assert_matches_imusim(self.parent)
+
+    def test_relative_pose(self):
+        R = np.array(random_orientation().toMatrix())
+        p = random_position().reshape(3,1) / 10
+        self.assert_matches_imusim(RelativePoseTrajectory(self.parent, R, p))
+
+    def test_single_methods(self):
+        evaluator = TrajectoryEvaluator.from_trajectory(self.parent)
+        values = evaluator.evaluate(self.times)
+        assert_equal(evaluator.position(self.times), values['position'])
+        assert_equal(evaluator.rotation_matrix(self.times), values['rotation'])
+        assert_equal(evaluator.rotational_velocity(self.times), values['rotational_velocity'])
+        self.assertTrue(np.all(np.isnan(evaluator.position(self.parent.endTime + 1.0))))
+
+    def test_imu_signals(self):
+        evaluator = TrajectoryEvaluator.from_trajectory(self.parent)
+        specific_force, angular_rate = ideal_imu_signals(self.parent, self.times)
+        refit_force, refit_rate = ideal_imu_signals(self.parent, self.times, evaluator=evaluator)
+        self.assertEqual(refit_force.shape, specific_force.shape)
+        self.assertLess(np.max(np.linalg.norm(refit_force - specific_force, axis=0)), 0.5)
+        self.assertLess(np.max(np.linalg.norm(refit_rate - angular_rate, axis=0)),
+                        0.1 * np.max(np.linalg.norm(angular_rate, axis=0)))